@@ -0,0 +1,21 @@
+"""
+Script for running the ANN recall-vs-latency report.
+
+This script compares the approximate FAISS index types against the flat index on
+held-out queries using the `src.ann_report` module.
+
+Run `main.py` with `vector_store_db: faiss` first to build the vector store, then run this script directly.
+
+Options: `--config PATH` selects another config file, `--instance NAME` keeps this instance's
+vector stores and logs apart, and `--set section.key=value` overrides single settings.
+"""
+
+from src.ann_report import run_ann_report
+from src.config_loader import apply_command_line_overrides
+
+if __name__ == '__main__':
+    # Apply --config, --instance and --set options given on the command line
+    apply_command_line_overrides()
+
+    # Build every configured index type and report its recall and latency
+    run_ann_report()
@@ -1,88 +1,324 @@
+import json
 import streamlit as st
-from src.config_loader import get_config
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS, Chroma
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms import Ollama
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-
-# Load configuration from config.yaml
-config = get_config()
+from src.config_loader import get_config, apply_command_line_overrides, reload_config_if_changed
+from src.config_schema import QUERY_TIME_SECTIONS
+from src.vectordb_builder import load_vectorstore_retriever, read_index_version, get_snapshot_directory
+from src.hybrid_retriever import build_hybrid_retriever
+from src.reranker import build_reranking_retriever
+from src.context_packer import build_context_packing_retriever
+from src.embedder import build_embedding_model
+from src.model_clients import build_ollama_llm
+from src.answer_cache import build_answer_cache, make_answer_cache_version
+from src.prompt_builder import build_conversational_chain
+from src.chat_sessions import build_session_store, update_session_store
+from src.index_snapshots import get_current_snapshot, retire_vector_store, start_snapshot_watcher
+
+@st.cache_resource
+def load_app_config():
+    """
+    Apply the command line options once per process and load the configuration.
+
+    Options are passed after `--`, e.g. `streamlit run app.py -- --instance docs --set hybrid_retrieval.k=6`.
+
+    Returns
+    -------
+    dict
+        The shared configuration dictionary.
+    """
+    apply_command_line_overrides()
+    return get_config()
+
+# Load configuration from config.yaml, picking up edited query-time settings on every rerun
+config = load_app_config()
+if config["config_reload"]["enabled"]:
+    reload_config_if_changed()
 vector_storedb = config["vector_store_db"]
 embedding_model = config["ollama_embedding"]["embedding_model"]
 llm = config["ollama_model"]["ollama_llm"]
 
-def load_vectorstore_retriever(vector_storedb, embedding_model):
+# The chain is rebuilt (over the already loaded index) whenever a query-time setting changes
+query_settings = json.dumps({section: config[section] for section in QUERY_TIME_SECTIONS}, sort_keys=True)
+
+# Prompt template used by the app
+APP_PROMPT_TEMPLATE = "You are a rational thinker. Use this context:\n{context}\n\nQuestion: {input}"
+
+# Instruction of the app's conversational prompt, followed by the conversation, the context and the question
+APP_CONVERSATION_INSTRUCTION = "You are a rational thinker. Use the conversation and the context to answer the latest question."
+
+@st.cache_resource(show_spinner="Loading vector store...")
+def get_served_index(vector_storedb, embedding_model):
     """
-    Load a vector store retriever based on user-specified configuration.
+    Load the vector store once and share it across reruns, sessions and chain rebuilds.
+
+    A background watcher loads every newly published index snapshot while the current one keeps
+    answering, then swaps it in; the next rerun builds its chains over the new retriever.
 
     Parameters
     ----------
     vector_storedb : str
-        The type of vector database to use ('faiss' or 'chroma').
-
+        The type of vector database to use ('faiss', 'chroma' or 'numpy').
     embedding_model : str
         The Ollama embedding model to use for vector representation.
 
     Returns
     -------
-    retriever : langchain.schema.retriever.BaseRetriever
-        A retriever object compatible with LangChain pipelines.
+    dict
+        `current`: the `(snapshot name, retriever)` served, replaced in a single assignment on every swap.
     """
-    embedding = OllamaEmbeddings(model=embedding_model)
+    index_snapshot = get_current_snapshot(vector_storedb)
+    retriever = load_vectorstore_retriever(
+        vector_storedb=vector_storedb, embedding_model=embedding_model,
+        persist_directory=get_snapshot_directory(vector_storedb, index_snapshot)
+    )
+    served_index = {'current': (index_snapshot, retriever)}
 
-    if vector_storedb == 'faiss':
-        vector_db_faiss = FAISS.load_local(
-            folder_path="C:/Users/BW/Desktop/Basic gen ai chatbot project/vector_store_dbs/faiss_vecdb",
-            embeddings=embedding,
-            allow_dangerous_deserialization=True
+    def swap_index(index_snapshot):
+        retriever = load_vectorstore_retriever(
+            vector_storedb=vector_storedb, embedding_model=embedding_model,
+            persist_directory=get_snapshot_directory(vector_storedb, index_snapshot)
         )
-        faiss_retriever = vector_db_faiss.as_retriever()
-        return faiss_retriever
+        retired_retriever = served_index['current'][1]
+        served_index['current'] = (index_snapshot, retriever)
+        retire_vector_store(retired_retriever.vectorstore)
 
-    elif vector_storedb == "chroma":
-        vector_db_chroma = Chroma(
-            persist_directory="C:/Users/BW/Desktop/Basic gen ai chatbot project/vector_store_dbs/chroma_vecdb",
-            embedding_function=embedding
-        )
-        chroma_retriever = vector_db_chroma.as_retriever()
-        return chroma_retriever
+    start_snapshot_watcher(vector_storedb, swap_index, index_snapshot)
+    return served_index
+
+@st.cache_resource(show_spinner="Building the retrieval chain...", max_entries=1)
+def get_retrieval_chain(vector_storedb, llm, query_settings, index_snapshot, _vector_retriever):
+    """
+    Build the retrieval chain once and share it across reruns and sessions.
 
-# Initialize retriever using selected vector store
-retriever = load_vectorstore_retriever(vector_storedb=vector_storedb, embedding_model=embedding_model)
+    Streamlit re-executes this script on every interaction; caching the chain as a resource
+    keeps the loaded vector store and the Ollama client alive between reruns.
 
-# Initialize LLM using Ollama
-llm = Ollama(model=llm)
+    Parameters
+    ----------
+    vector_storedb : str
+        The type of vector database to use ('faiss', 'chroma' or 'numpy').
+    llm : str
+        The Ollama LLM used to generate answers.
+    query_settings : str
+        The query-time config sections as JSON; a new value builds a new chain.
+    index_snapshot : str or None
+        The index snapshot served; a new snapshot builds a new chain.
+    _vector_retriever : BaseRetriever
+        The retriever of that snapshot (not hashed by Streamlit).
 
-# Create prompt template
-prompt = ChatPromptTemplate.from_template(
-    "You are a rational thinker. Use this context:\n{context}\n\nQuestion: {input}"
-)
+    Returns
+    -------
+    RetrievalChain
+        The retrieval chain answering user questions.
+    """
+    # LangChain's chain modules are only needed once, when the cached chain is first built
+    from langchain.prompts import ChatPromptTemplate
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain.chains import create_retrieval_chain
+
+    # Reuse the loaded vector store, adding hybrid retrieval on top
+    retriever = build_hybrid_retriever(
+        retriever=_vector_retriever, vector_storedb=vector_storedb,
+        persist_directory=get_snapshot_directory(vector_storedb, index_snapshot)
+    )
+
+    # Re-rank a wider candidate set, then pack the kept chunks into the token budget
+    retriever = build_reranking_retriever(retriever)
+    retriever = build_context_packing_retriever(retriever)
+
+    # Initialize LLM using Ollama, through the pooled model client shared with the embedder
+    ollama_llm = build_ollama_llm(llm)
+
+    # Create prompt template
+    prompt = ChatPromptTemplate.from_template(APP_PROMPT_TEMPLATE)
+
+    # Create document chain to process retrieved documents and generate final response
+    doc_chain = create_stuff_documents_chain(llm=ollama_llm, prompt=prompt)
+
+    # Create full retrieval chain to retrieve and answer questions
+    return create_retrieval_chain(
+        retriever=retriever,
+        combine_docs_chain=doc_chain
+    )
+
+@st.cache_resource(show_spinner="Building the conversational chain...", max_entries=1)
+def get_conversational_chain(vector_storedb, llm, query_settings, index_snapshot, _vector_retriever):
+    """
+    Build the conversational retrieval chain once and share it across reruns and sessions.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The type of vector database to use ('faiss', 'chroma' or 'numpy').
+    llm : str
+        The Ollama LLM used to rewrite questions and generate answers.
+    query_settings : str
+        The query-time config sections as JSON; a new value builds a new chain.
+    index_snapshot : str or None
+        The index snapshot served; a new snapshot builds a new chain.
+    _vector_retriever : BaseRetriever
+        The retriever of that snapshot (not hashed by Streamlit).
+
+    Returns
+    -------
+    RetrievalChain
+        The chain answering questions within a chat session.
+    """
+    retriever = build_hybrid_retriever(
+        retriever=_vector_retriever, vector_storedb=vector_storedb,
+        persist_directory=get_snapshot_directory(vector_storedb, index_snapshot)
+    )
+    return build_conversational_chain(retriever, llm=build_ollama_llm(llm), system_instruction=APP_CONVERSATION_INSTRUCTION)
+
+@st.cache_resource
+def get_session_store(conversation_enabled):
+    """
+    Create the bounded chat session store once and share it across reruns and browser sessions.
+
+    Parameters
+    ----------
+    conversation_enabled : bool
+        `conversation -> enabled`, so the store is created or dropped when it is changed; the session
+        limits are applied to the cached store by `update_session_store` on every rerun.
+
+    Returns
+    -------
+    SessionStore or None
+        The store, or None when conversations are disabled in the config.
+    """
+    return build_session_store()
+
+@st.cache_resource
+def get_answer_cache():
+    """
+    Open the semantic answer cache once and share it across reruns and sessions.
+
+    Returns
+    -------
+    SemanticAnswerCache or None
+        The cache, or None when it is disabled in the config.
+    """
+    return build_answer_cache()
+
+@st.cache_resource
+def get_query_embedding_model(embedding_model):
+    """
+    Build the embedding model used to look questions up in the answer cache.
+
+    Parameters
+    ----------
+    embedding_model : str
+        The Ollama embedding model to use for vector representation.
+
+    Returns
+    -------
+    Embeddings
+        The embedding model.
+    """
+    return build_embedding_model(embedding_model)
+
+def stream_answer(retrieval_chain, chain_input, sources):
+    """
+    Yield the LLM's answer token by token as the retrieval chain streams it.
+
+    Parameters
+    ----------
+    retrieval_chain : RetrievalChain
+        The retrieval chain answering user questions.
+    chain_input : dict
+        The chain's input: the user's question as `input`, and the `chat_history` of conversational chains.
+    sources : list
+        Filled with the metadata of the retrieved documents as they stream in.
 
-# Create document chain to process retrieved documents and generate final response
-doc_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
+    Yields
+    ------
+    str
+        Pieces of the answer, as soon as the LLM generates them.
+    """
+    for chunk in retrieval_chain.stream(chain_input):
+        if "context" in chunk:
+            sources.extend(document.metadata for document in chunk["context"])
+        if "answer" in chunk:
+            yield chunk["answer"]
+
+# Serve the newest index snapshot the background watcher has swapped in
+index_snapshot, vector_retriever = get_served_index(vector_storedb=vector_storedb, embedding_model=embedding_model)['current']
+served_index_version = read_index_version(get_snapshot_directory(vector_storedb, index_snapshot))
 
-# Create full retrieval chain to retrieve and answer questions
-retrieval_chain = create_retrieval_chain(
-    retriever=retriever,
-    combine_docs_chain=doc_chain
+# Reuse the cached retrieval chain (built again only after a query-time setting changed or a new snapshot was swapped in)
+retrieval_chain = get_retrieval_chain(
+    vector_storedb=vector_storedb, llm=llm, query_settings=query_settings,
+    index_snapshot=index_snapshot, _vector_retriever=vector_retriever
 )
+answer_cache = get_answer_cache()
+session_store = update_session_store(get_session_store(config["conversation"]["enabled"]))
 
 # Streamlit UI 
 
 # Title of the web app
 st.title("Gen AI App")
 
+if session_store is not None:
+    # Multi-turn chat: every browser session has its own chat session in the bounded store
+    conversational_chain = get_conversational_chain(
+        vector_storedb=vector_storedb, llm=llm, query_settings=query_settings,
+        index_snapshot=index_snapshot, _vector_retriever=vector_retriever
+    )
+    session = session_store.get(st.session_state.get("session_id"))
+    st.session_state["session_id"] = session.session_id
+
+    if st.button("New conversation"):
+        session_store.delete(session.session_id)
+        st.session_state["session_id"] = None
+        st.rerun()
+
+    # Turns folded into the running summary are only shown as the summary
+    if session.summary:
+        st.caption(f"Earlier in this conversation: {session.summary}")
+    for past_question, past_answer in session.turns:
+        st.chat_message("user").write(past_question)
+        st.chat_message("assistant").write(past_answer)
+
+    question = st.chat_input("Enter your question")
+    if question:
+        st.chat_message("user").write(question)
+        with st.chat_message("assistant"), session.lock:
+            # Only the first question of a conversation stands on its own, so only it uses the answer cache
+            cached_answer = None
+            if answer_cache is not None and not session.turn_count:
+                query_vector = get_query_embedding_model(embedding_model).embed_query(question)
+                cache_version = make_answer_cache_version(served_index_version, llm, APP_CONVERSATION_INSTRUCTION)
+                cached_answer = answer_cache.lookup(query_vector, cache_version)
+
+            if cached_answer is not None:
+                answer = cached_answer["answer"]
+                st.write(answer)
+            else:
+                sources = []
+                answer = st.write_stream(stream_answer(conversational_chain, session.chain_input(question), sources))
+                if answer_cache is not None and not session.turn_count:
+                    answer_cache.store(question, query_vector, answer, sources, cache_version)
+            session.add_turn(question, answer)
+    st.stop()
+
 # User input field for question
 question = st.text_input("Enter your question")
 
 # Submit button to trigger response generation
 if st.button("Submit"):
-    with st.spinner("Generating response..."):
-        # Run the retrieval chain with user's input
-        response = retrieval_chain.invoke({"input": question})
-
-    # Display the LLM's response
     st.write("Response:")
-    st.write(response["answer"])
\ No newline at end of file
+
+    # Serve near-duplicate questions from the semantic answer cache
+    cached_answer = None
+    if answer_cache is not None:
+        query_vector = get_query_embedding_model(embedding_model).embed_query(question)
+        cache_version = make_answer_cache_version(served_index_version, llm, APP_PROMPT_TEMPLATE)
+        cached_answer = answer_cache.lookup(query_vector, cache_version)
+
+    if cached_answer is not None:
+        st.write(cached_answer["answer"])
+    else:
+        # Stream the LLM's response to the page as tokens arrive
+        sources = []
+        answer = st.write_stream(stream_answer(retrieval_chain, {"input": question}, sources))
+        if answer_cache is not None:
+            answer_cache.store(question, query_vector, answer, sources, cache_version)
\ No newline at end of file
@@ -0,0 +1,22 @@
+"""
+Script for running the end-to-end benchmark.
+
+This script benchmarks data loading, splitting, index build, retrieval and chain invocation
+on synthetic corpora of growing size using the `src.benchmark` module. It runs offline, with
+deterministic fake embeddings and a fake LLM, and writes a JSON report.
+
+Run this script directly; no vector store or Ollama server is needed.
+
+Options: `--config PATH` selects another config file, `--instance NAME` keeps this instance's
+vector stores and logs apart, and `--set section.key=value` overrides single settings.
+"""
+
+from src.benchmark import run_benchmark
+from src.config_loader import apply_command_line_overrides
+
+if __name__ == '__main__':
+    # Apply --config, --instance and --set options given on the command line
+    apply_command_line_overrides()
+
+    # Benchmark every configured corpus size and write the report
+    run_benchmark()
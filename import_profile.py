@@ -0,0 +1,21 @@
+"""
+Script for profiling the start-up time of the project's entry points.
+
+This script imports each configured module in a fresh interpreter with `python -X importtime`
+using the `src.import_profile` module, and reports its import time against the start-up budget.
+
+Run this script directly after changing imports to check that cold start stays within budget.
+
+Options: `--config PATH` selects another config file, `--instance NAME` keeps this instance's
+vector stores and logs apart, and `--set section.key=value` overrides single settings.
+"""
+
+from src.import_profile import run_import_profile
+from src.config_loader import apply_command_line_overrides
+
+if __name__ == '__main__':
+    # Apply --config, --instance and --set options given on the command line
+    apply_command_line_overrides()
+
+    # Profile every configured entry point and write the report
+    run_import_profile()
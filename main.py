@@ -5,10 +5,17 @@ This script initializes and executes the full GenAI pipeline workflow defined
 in the `src.pipeline` module.
 
 Run this script directly to launch the end-to-end pipeline.
+
+Options: `--config PATH` selects another config file, `--instance NAME` keeps this instance's
+vector stores and logs apart, and `--set section.key=value` overrides single settings.
 """
 
 from src.pipeline import run_pipeline
+from src.config_loader import apply_command_line_overrides
 
 if __name__ == '__main__':
+    # Apply --config, --instance and --set options given on the command line
+    apply_command_line_overrides()
+
     # Execute the main pipeline when this script is run directly
     run_pipeline()
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+Script for running the vector quantization memory-vs-recall report.
+
+This script compares float16, int8 and truncated-dimension storage of the NumPy backend against
+exact float32 search on held-out queries using the `src.quantization_report` module.
+
+Run `main.py` first to build the vector store, then run this script directly.
+
+Options: `--config PATH` selects another config file, `--instance NAME` keeps this instance's
+vector stores and logs apart, and `--set section.key=value` overrides single settings.
+"""
+
+from src.quantization_report import run_quantization_report
+from src.config_loader import apply_command_line_overrides
+
+if __name__ == '__main__':
+    # Apply --config, --instance and --set options given on the command line
+    apply_command_line_overrides()
+
+    # Build every configured storage variant and report its memory and recall
+    run_quantization_report()
@@ -0,0 +1,22 @@
+"""
+Script for rebuilding shards of the sharded vector store.
+
+This script rebuilds the shards listed in `vector_shards -> rebuild_shards` (every shard if empty)
+from scratch using the `src.sharded_vectordb` module, leaving the other shards untouched.
+
+Run `main.py` with `vector_shards -> shard_count` above 1 first, then run this script directly,
+e.g. `python rebuild_shards.py --set vector_shards.rebuild_shards=[2]`.
+
+Options: `--config PATH` selects another config file, `--instance NAME` keeps this instance's
+vector stores and logs apart, and `--set section.key=value` overrides single settings.
+"""
+
+from src.sharded_vectordb import rebuild_shards
+from src.config_loader import apply_command_line_overrides
+
+if __name__ == '__main__':
+    # Apply --config, --instance and --set options given on the command line
+    apply_command_line_overrides()
+
+    # Rebuild the selected shards in parallel worker processes
+    rebuild_shards()
@@ -0,0 +1,21 @@
+"""
+Script for running the long-lived query server.
+
+This script loads the persisted vector store once and answers questions over HTTP
+using the `src.query_server` module, so query latency no longer includes index load.
+
+Run `main.py` first to build the vector store, then run this script directly.
+
+Options: `--config PATH` selects another config file, `--instance NAME` keeps this instance's
+vector stores and logs apart, and `--set section.key=value` overrides single settings.
+"""
+
+from src.query_server import run_query_server
+from src.config_loader import apply_command_line_overrides
+
+if __name__ == '__main__':
+    # Apply --config, --instance and --set options given on the command line
+    apply_command_line_overrides()
+
+    # Serve questions until interrupted
+    run_query_server()
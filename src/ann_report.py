@@ -0,0 +1,169 @@
+import json
+import os
+import time
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from src.embedder import embed_in_batches, build_embedding_model
+from src.faiss_index import create_faiss_index
+from src.vectordb_builder import get_persist_directory
+from src.config_loader import get_config
+from src.logger import log_component_start, log_component_end, logger_for_ann_report
+
+def load_indexed_vectors(embedding_model):
+    """
+    Embeds every chunk of the persisted FAISS store again, giving the exact float32 vectors.
+
+    Quantized indexes only hold approximations of the vectors, so the chunks are re-embedded
+    instead of reconstructed; with the embedding cache enabled this is all cache hits.
+
+    Parameters
+    ----------
+    embedding_model : str
+        The Ollama embedding model the store was built with.
+
+    Returns
+    -------
+    numpy.ndarray
+        A float32 matrix with one chunk embedding per row.
+    """
+    embedding = build_embedding_model(embedding_model)
+    vector_db = FAISS.load_local(
+        folder_path=get_persist_directory('faiss'),
+        embeddings=embedding,
+        allow_dangerous_deserialization=True
+    )
+    texts = [
+        vector_db.docstore.search(chunk_id).page_content
+        for _, chunk_id in sorted(vector_db.index_to_docstore_id.items())
+    ]
+    return embed_in_batches(texts, embedding)
+
+def measure_index(index, queries, k, ground_truth):
+    """
+    Runs every query on its own against an index and measures recall and latency.
+
+    Parameters
+    ----------
+    index : faiss.Index
+        The index to measure.
+    queries : numpy.ndarray
+        A float32 matrix with one query vector per row.
+    k : int
+        Number of neighbours retrieved per query.
+    ground_truth : numpy.ndarray
+        Positions of the exact k nearest neighbours of every query.
+
+    Returns
+    -------
+    dict
+        `recall_at_k` and the mean/p50/p95 per-query latency in milliseconds.
+    """
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, ground_truth):
+        started_at = time.perf_counter()
+        _, positions = index.search(query[np.newaxis, :], k)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        found += len(set(positions[0].tolist()) & set(expected.tolist()))
+    latencies = np.array(latencies)
+    return {
+        'recall_at_k': round(found / (len(queries) * k), 4),
+        'latency_ms_mean': round(float(latencies.mean()), 4),
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 4),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 4)
+    }
+
+def run_ann_report():
+    """
+    Compares the configured approximate FAISS index types against the flat index on held-out queries.
+
+    Returns
+    -------
+    list of dict
+        One row per index type and knob setting, also written as JSON to `ann_report -> output_path`.
+
+    Notes
+    -----
+    - Run `main.py` with `vector_store_db: faiss` first; the chunks of the persisted FAISS store are the corpus.
+    - `num_queries` chunks are held out of every index and used as queries, so no query finds itself.
+    - Recall@k is measured against the exact neighbours from a flat index over the same vectors.
+    - Every index type in `ann_report -> index_types` is built with the `faiss_index` settings, then searched
+      once per value of `nprobe_values` (IVF types) or `ef_search_values` (HNSW types).
+    - Latency is measured per single query, matching how the retriever queries the index.
+    """
+    try:
+        log_component_start(logger_for_ann_report, 'ANN Report Component')
+
+        config = get_config()
+        report_config = config['ann_report']
+        index_config = config['faiss_index']
+        k = int(report_config['k'])
+
+        vectors = load_indexed_vectors(config['ollama_embedding']['embedding_model'])
+        num_queries = min(int(report_config['num_queries']), len(vectors) // 2)
+        held_out = np.zeros(len(vectors), dtype=bool)
+        held_out[np.random.default_rng(0).choice(len(vectors), size=num_queries, replace=False)] = True
+        queries, base = vectors[held_out], vectors[~held_out]
+        k = min(k, len(base))
+        logger_for_ann_report.info('Index vectors: %s, held-out queries: %s, k: %s', len(base), len(queries), k)
+
+        # The flat index gives the exact neighbours every other index is measured against
+        flat_index = faiss.IndexFlatL2(base.shape[1])
+        flat_index.add(base)
+        _, ground_truth = flat_index.search(queries, k)
+        rows = [{'index_type': 'flat', 'knob': None, 'build_seconds': 0.0,
+                 'index_bytes': int(faiss.serialize_index(flat_index).nbytes),
+                 **measure_index(flat_index, queries, k, ground_truth)}]
+
+        for index_type in report_config['index_types']:
+            started_at = time.perf_counter()
+            index = create_faiss_index(base, {**index_config, 'index_type': index_type})
+            index.add(base)
+            build_seconds = round(time.perf_counter() - started_at, 3)
+            index_bytes = int(faiss.serialize_index(index).nbytes)
+
+            ivf_index = faiss.try_extract_index_ivf(index)
+            hnsw_index = faiss.downcast_index(index)
+            if ivf_index is not None:
+                knob_name, knob_values = 'nprobe', report_config['nprobe_values']
+            elif hasattr(hnsw_index, 'hnsw'):
+                knob_name, knob_values = 'ef_search', report_config['ef_search_values']
+            else:
+                knob_name, knob_values = None, [None]
+
+            for knob_value in knob_values:
+                if knob_name == 'nprobe':
+                    ivf_index.nprobe = int(knob_value)
+                elif knob_name == 'ef_search':
+                    hnsw_index.hnsw.efSearch = int(knob_value)
+                rows.append({
+                    'index_type': index_type,
+                    'knob': f'{knob_name}={knob_value}' if knob_name else None,
+                    'build_seconds': build_seconds,
+                    'index_bytes': index_bytes,
+                    **measure_index(index, queries, k, ground_truth)
+                })
+
+        for row in rows:
+            logger_for_ann_report.info(
+                '%-9s %-14s recall@%s: %.4f  '
+                'p50: %.3f ms  p95: %.3f ms  '
+                'size: %.1f MB  build: %ss',
+                row['index_type'], row['knob'] or '-', k, row['recall_at_k'], row['latency_ms_p50'], row['latency_ms_p95'], row['index_bytes'] / 1e6, row['build_seconds']
+            )
+
+        output_path = report_config['output_path']
+        output_directory = os.path.dirname(output_path)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as file:
+            json.dump({'index_vectors': len(base), 'queries': len(queries), 'k': k, 'results': rows}, file, indent=2)
+        logger_for_ann_report.info('ANN report written to: %s', output_path)
+
+        log_component_end(logger_for_ann_report, 'ANN Report Component')
+        return rows
+
+    except Exception as e:
+        logger_for_ann_report.debug('Error encountered in ANN report component. error: %s', e)
+        log_component_end(logger_for_ann_report, 'ANN Report Component')
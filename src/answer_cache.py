@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from src.config_loader import get_config
+from src.logger import logger_for_answer_cache
+
+def make_answer_cache_version(index_version, *answer_settings):
+    """
+    Combines the index version with the settings that shape an answer into one cache version.
+
+    Parameters
+    ----------
+    index_version : str
+        Version of the vector store the answers were retrieved from.
+    *answer_settings : str
+        Further settings that change answers, such as the LLM name and the prompt.
+
+    Returns
+    -------
+    str
+        A hex digest; cached answers are only served for the exact same version.
+    """
+    return hashlib.sha256('\x00'.join([str(index_version), *map(str, answer_settings)]).encode('utf-8')).hexdigest()
+
+class SemanticAnswerCache:
+    """
+    Persistent cache of LLM answers, looked up by cosine similarity of query embeddings.
+
+    A stored answer is served when a new question's embedding is at least `similarity_threshold`
+    similar to a cached question's, the cache version (index version, LLM and prompt) is unchanged
+    and the entry is younger than `ttl_seconds`. Entries live in SQLite, so they survive restarts;
+    the embeddings of the current version are also kept in memory as one matrix for a fast lookup.
+    Beyond `max_entries`, the least recently used answers are evicted.
+
+    Parameters
+    ----------
+    cache_path : str
+        Path of the SQLite file the answers are stored in.
+    similarity_threshold : float
+        Minimum cosine similarity for a cached answer to be served.
+    ttl_seconds : float
+        Maximum age of a served answer.
+    max_entries : int
+        Maximum number of answers kept.
+    """
+
+    def __init__(self, cache_path, similarity_threshold, ttl_seconds, max_entries):
+        self.similarity_threshold = float(similarity_threshold)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._row_ids = []
+        self._created_at = np.empty(0)
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+
+        cache_directory = os.path.dirname(cache_path)
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS answers ('
+            'id INTEGER PRIMARY KEY, version TEXT NOT NULL, question TEXT NOT NULL, vector BLOB NOT NULL, '
+            'answer TEXT NOT NULL, sources TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS idx_answers_version ON answers (version)')
+        self._connection.commit()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _load_version(self, version):
+        # Drops expired rows, then loads every remaining embedding of this version into one matrix
+        self._connection.execute('DELETE FROM answers WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        self._connection.commit()
+        rows = self._connection.execute(
+            'SELECT id, vector, created_at FROM answers WHERE version = ?', (version,)
+        ).fetchall()
+        self._row_ids = [row_id for row_id, _, _ in rows]
+        self._created_at = np.array([created_at for _, _, created_at in rows])
+        self._vectors = (
+            np.vstack([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows])
+            if rows else np.empty((0, 0), dtype=np.float32)
+        )
+        self._loaded_version = version
+
+    def lookup(self, query_vector, version):
+        """
+        Finds a cached answer for a question similar enough to the query.
+
+        Parameters
+        ----------
+        query_vector : list of float
+            Embedding of the new question.
+        version : str
+            Current cache version, see `make_answer_cache_version`.
+
+        Returns
+        -------
+        dict or None
+            The cached `question`, `answer`, `sources` and `similarity`, or None on a miss.
+        """
+        query_vector = self._normalize(query_vector)
+        with self._lock:
+            if version != self._loaded_version:
+                self._load_version(version)
+
+            best_row = None
+            if self._row_ids and self._vectors.shape[1] == query_vector.shape[0]:
+                similarities = self._vectors @ query_vector
+                similarities[self._created_at < time.time() - self.ttl_seconds] = -1.0
+                best_position = int(np.argmax(similarities))
+                if similarities[best_position] >= self.similarity_threshold:
+                    best_row = (self._row_ids[best_position], float(similarities[best_position]))
+
+            if best_row is None:
+                self.misses += 1
+                return None
+
+            row_id, similarity = best_row
+            question, answer, sources = self._connection.execute(
+                'SELECT question, answer, sources FROM answers WHERE id = ?', (row_id,)
+            ).fetchone()
+            self._connection.execute('UPDATE answers SET last_access = ? WHERE id = ?', (time.time(), row_id))
+            self._connection.commit()
+            self.hits += 1
+
+        logger_for_answer_cache.info('Answer cache hit. similarity: %.4f, cached question: %s', similarity, question)
+        return {'question': question, 'answer': answer, 'sources': json.loads(sources), 'similarity': similarity}
+
+    def store(self, question, query_vector, answer, sources, version):
+        """
+        Stores a freshly generated answer.
+
+        Parameters
+        ----------
+        question : str
+            The question that was answered.
+        query_vector : list of float
+            Embedding of the question.
+        answer : str
+            The LLM's answer.
+        sources : list of dict
+            Metadata of the documents the answer was generated from.
+        version : str
+            Current cache version, see `make_answer_cache_version`.
+        """
+        query_vector = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                'INSERT INTO answers (version, question, vector, answer, sources, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (version, question, query_vector.tobytes(), answer, json.dumps(sources, default=str), now, now)
+            )
+
+            # Evict the least recently used answers beyond the size bound
+            entry_count = self._connection.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+            overflow = entry_count - self.max_entries
+            if overflow > 0:
+                self._connection.execute(
+                    'DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_access LIMIT ?)', (overflow,)
+                )
+            self._connection.commit()
+
+            if overflow > 0 or version != self._loaded_version:
+                self._load_version(version)
+            else:
+                self._row_ids.append(cursor.lastrowid)
+                self._created_at = np.append(self._created_at, now)
+                self._vectors = (
+                    np.vstack([self._vectors, query_vector]) if self._vectors.size else query_vector[np.newaxis, :]
+                )
+
+    def stats(self):
+        """
+        Returns the cache's hit/miss counters.
+
+        Returns
+        -------
+        dict
+            Hits, misses and hit rate since the cache was opened.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def log_stats(self):
+        """
+        Logs the cache's hit/miss counters.
+        """
+        stats = self.stats()
+        logger_for_answer_cache.info(
+            'Answer cache hits: %s, misses: %s, hit rate: %.2f%%', stats['hits'], stats['misses'], stats['hit_rate'] * 100
+        )
+
+def build_answer_cache():
+    """
+    Builds the semantic answer cache from the config.
+
+    Returns
+    -------
+    SemanticAnswerCache or None
+        The cache, or None when `answer_cache -> enabled` is false.
+    """
+    cache_config = get_config()['answer_cache']
+    if not cache_config['enabled']:
+        return None
+    return SemanticAnswerCache(
+        cache_path=cache_config['cache_path'],
+        similarity_threshold=cache_config['similarity_threshold'],
+        ttl_seconds=cache_config['ttl_seconds'],
+        max_entries=cache_config['max_entries']
+    )
@@ -0,0 +1,150 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.embedder import embed_in_batches
+from src.vectordb_builder import search_by_vectors
+from src.prompt_builder import build_document_chain
+from src.context_packer import pack_documents
+from src.config_loader import get_config
+from src.metrics import instrument
+from src.logger import log_component_start, log_component_end, logger_for_batch_query
+
+def load_questions(questions_path):
+    """
+    Reads evaluation questions from a JSONL or CSV file.
+
+    Parameters
+    ----------
+    questions_path : str
+        Path to a `.jsonl` file (one object with a `question` key per line) or a `.csv` file with a `question` column.
+
+    Returns
+    -------
+    list of dict
+        One record per question. Every other field of the record (e.g. an `id`) is kept and copied to the output.
+    """
+    if questions_path.endswith('.csv'):
+        with open(questions_path, 'r', encoding='utf-8', newline='') as file:
+            return [dict(row) for row in csv.DictReader(file)]
+
+    with open(questions_path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def _generate_answer(doc_chain, question, documents):
+    # Runs on a worker thread; errors are recorded per question instead of aborting the batch
+    started_at = time.perf_counter()
+    try:
+        answer, error = doc_chain.invoke({"input": question, "context": documents}), None
+    except Exception as e:
+        answer, error = None, str(e)
+    return answer, error, (time.perf_counter() - started_at) * 1000
+
+def run_batch_queries(retriever):
+    """
+    Answers a file of questions against the freshly built index and writes the results as JSONL.
+
+    Parameters
+    ----------
+    retriever : VectorStoreRetriever
+        The retriever returned by `create_vector_store_db`; its vector store is searched directly.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    - Paths, `k` and the generation concurrency are read from `batch_query` in the config.
+    - All questions are embedded in one batched call and retrieved with a single matrix search.
+    - With `context_packing -> enabled`, each question's chunks are packed into the token budget, as in the retrieval chain.
+    - Answers are generated with at most `max_concurrency` LLM calls in flight.
+    - Each output line holds the question record, the answer, the retrieved chunk ids and per-stage latencies.
+      Embedding and retrieval latencies are the batch totals divided evenly over the questions.
+    """
+    try:
+        log_component_start(logger_for_batch_query, 'Batch Query Component')
+
+        with instrument('batch_query') as span:
+            config = get_config()
+            batch_config = config['batch_query']
+            packing_config = config['context_packing']
+            k = int(batch_config['k'])
+            max_concurrency = int(batch_config['max_concurrency'])
+            vector_db = retriever.vectorstore
+
+            records = load_questions(batch_config['questions_path'])
+            questions = [record['question'] for record in records]
+            logger_for_batch_query.info('Loaded %s questions from %s', len(questions), batch_config['questions_path'])
+            if not questions:
+                log_component_end(logger_for_batch_query, 'Batch Query Component')
+                return
+            started_at = time.perf_counter()
+
+            # Embed every question in one batched call
+            query_vectors = embed_in_batches(questions, vector_db.embeddings, as_queries=True)
+            embedded_at = time.perf_counter()
+
+            # Retrieve the chunks for every question with a single matrix search
+            retrieved = search_by_vectors(vector_db, query_vectors, k)
+            retrieved_at = time.perf_counter()
+
+            # Pack each question's chunks into the token budget, as the retrieval chain does
+            contexts = [[document for _, document in hits] for hits in retrieved]
+            if packing_config['enabled']:
+                contexts = [
+                    pack_documents(
+                        documents,
+                        token_budget=int(packing_config['token_budget']),
+                        chars_per_token=float(packing_config['chars_per_token']),
+                        max_merge_gap=int(packing_config['max_merge_gap']),
+                        min_piece_tokens=int(packing_config['min_piece_tokens'])
+                    )[0]
+                    for documents in contexts
+                ]
+
+            # Generate answers with bounded concurrency
+            doc_chain = build_document_chain()
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                generations = list(executor.map(
+                    lambda item: _generate_answer(doc_chain, item[0], item[1]),
+                    zip(questions, contexts)
+                ))
+            finished_at = time.perf_counter()
+
+            embedding_ms = (embedded_at - started_at) * 1000 / len(questions)
+            retrieval_ms = (retrieved_at - embedded_at) * 1000 / len(questions)
+
+            output_path = batch_config['output_path']
+            output_directory = os.path.dirname(output_path)
+            if output_directory:
+                os.makedirs(output_directory, exist_ok=True)
+            with open(output_path, 'w', encoding='utf-8') as file:
+                for record, hits, (answer, error, generation_ms) in zip(records, retrieved, generations):
+                    file.write(json.dumps({
+                        **record,
+                        'answer': answer,
+                        'error': error,
+                        'chunk_ids': [chunk_id for chunk_id, _ in hits],
+                        'latency_ms': {
+                            'embedding': round(embedding_ms, 2),
+                            'retrieval': round(retrieval_ms, 2),
+                            'generation': round(generation_ms, 2)
+                        }
+                    }) + '\n')
+
+            elapsed = finished_at - started_at
+            failed = sum(1 for _, error, _ in generations if error is not None)
+            span.add('questions', len(questions))
+            span.add('failed_questions', failed)
+            logger_for_batch_query.info(
+                'Answered %s questions in %.2fs '
+                '(%.2f questions/sec, %s failed). results written to: %s',
+                len(questions), elapsed, len(questions) / elapsed, failed, output_path
+            )
+            log_component_end(logger_for_batch_query, 'Batch Query Component')
+
+    except Exception as e:
+        logger_for_batch_query.debug('Error encountered in batch query component. error: %s', e)
+        log_component_end(logger_for_batch_query, 'Batch Query Component')
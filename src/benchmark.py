@@ -0,0 +1,332 @@
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListLLM
+from src.data_loader import data_loader
+from src.data_splitter import data_splitter, get_chunk_settings
+from src.vectordb_builder import create_vector_store_db
+from src.hybrid_retriever import build_hybrid_retriever
+from src.prompt_builder import build_prompt_chain
+from src.config_loader import get_config
+from src.logger import log_component_start, log_component_end, logger_for_benchmark
+from src.metrics import MetricsRegistry, Span
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then reported as None
+    resource = None
+
+# Number of chunks of text written per synthetic corpus file
+CHUNKS_PER_FILE = 10000
+
+# Seed of the synthetic corpora and queries, so every run benchmarks the same data
+BENCHMARK_SEED = 42
+
+def peak_rss_mb():
+    """
+    Returns the process's peak resident set size so far in MB, or None where it cannot be read.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+def latency_percentiles(latencies_ms):
+    """
+    Summarizes per-item latencies as p50/p95/p99 in milliseconds.
+    """
+    latencies_ms = np.asarray(latencies_ms)
+    return {
+        f'p{percentile}': round(float(np.percentile(latencies_ms, percentile)), 3)
+        for percentile in (50, 95, 99)
+    }
+
+def make_vocabulary(word_count, rng):
+    """
+    Builds a deterministic vocabulary of pronounceable pseudo-words.
+    """
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'xe', 'zu', 'ba', 'de', 'fi', 'go', 'hu', 'pa']
+    vocabulary = set()
+    while len(vocabulary) < word_count:
+        vocabulary.add(''.join(rng.choice(syllables) for _ in range(rng.randint(1, 4))))
+    return sorted(vocabulary)
+
+def generate_corpus(corpus_directory, chunk_count, chars_per_chunk, vocabulary, rng):
+    """
+    Writes a synthetic .txt corpus holding about `chunk_count` chunks worth of text.
+
+    Parameters
+    ----------
+    corpus_directory : str
+        Directory the corpus files are written to.
+    chunk_count : int
+        Number of chunks the corpus should split into.
+    chars_per_chunk : int
+        Characters of new text per chunk (chunk size minus overlap).
+    vocabulary : list of str
+        Words the text is drawn from, with a Zipf-like frequency skew.
+    rng : random.Random
+        Source of randomness.
+
+    Returns
+    -------
+    int
+        Number of characters written.
+    """
+    os.makedirs(corpus_directory, exist_ok=True)
+    # Cumulative weights computed once; passing `weights` makes every draw rebuild them over the whole vocabulary
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    characters_written = 0
+    for file_number, start in enumerate(range(0, chunk_count, CHUNKS_PER_FILE)):
+        target_chars = min(CHUNKS_PER_FILE, chunk_count - start) * chars_per_chunk
+        lines = []
+        file_chars = 0
+        while file_chars < target_chars:
+            line = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=12)) + '.'
+            lines.append(line)
+            file_chars += len(line) + 1
+        with open(os.path.join(corpus_directory, f'corpus_{file_number:05d}.txt'), 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        characters_written += file_chars
+    return characters_written
+
+@contextmanager
+def benchmark_environment(work_directory, corpus_directory, vector_storedb):
+    """
+    Points the data path and the persist directories at the benchmark's scratch directory.
+
+    The config dict returned by `get_config` is shared by every component, so overriding its entries
+    here redirects the whole pipeline; everything is restored on exit.
+    """
+    config = get_config()
+    saved_config = {
+        'paths': config['paths'],
+        'data_file': config['data_file'],
+        'embedding_cache': config['embedding_cache'],
+        'answer_cache': config['answer_cache'],
+        'vector_store_db': config['vector_store_db']
+    }
+    try:
+        config['paths'] = {**config['paths'], 'vector_store_dir': work_directory}
+        config['data_file'] = {**config['data_file'], 'data_file_path': corpus_directory}
+        config['embedding_cache'] = {**config['embedding_cache'], 'enabled': False}
+        config['answer_cache'] = {**config['answer_cache'], 'enabled': False}
+        config['vector_store_db'] = vector_storedb
+        yield
+    finally:
+        config.update(saved_config)
+
+def stage_summary(seconds, item_count, unit, latencies_ms=None):
+    """
+    Summarizes a stage's duration, throughput, the process's peak RSS so far and, if given, per-item latencies.
+    """
+    summary = {
+        'seconds': round(seconds, 3),
+        'items': item_count,
+        'unit': unit,
+        'throughput_per_sec': round(item_count / seconds, 2) if seconds else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+    if latencies_ms is not None:
+        summary['latency_ms'] = latency_percentiles(latencies_ms)
+    return summary
+
+def run_stage(stage_results, stage_name, unit, function):
+    """
+    Runs one benchmark stage and records its duration, throughput and peak RSS.
+
+    Parameters
+    ----------
+    stage_results : dict
+        Results of the stages run so far; this stage's result is added under `stage_name`.
+    stage_name : str
+        Name of the stage.
+    unit : str
+        What the stage's items are, e.g. 'chunks'.
+    function : callable
+        The stage; returns `(result, item_count)` or `(result, item_count, latencies_ms)`.
+
+    Returns
+    -------
+    object
+        The stage's result.
+    """
+    logger_for_benchmark.info('Benchmark stage started: %s', stage_name)
+    started_at = time.perf_counter()
+    result, item_count, *latencies = function()
+    seconds = time.perf_counter() - started_at
+
+    stage_results[stage_name] = stage_summary(seconds, item_count, unit, *latencies)
+    logger_for_benchmark.info('Benchmark stage finished: %s %s', stage_name, stage_results[stage_name])
+    return result
+
+def timed_stream(span, items, unit, size=None):
+    """
+    Passes a stream through, timing it with `span` and counting its items as `unit`.
+
+    Only the time spent producing each item is counted, not the time the consumer holds it (see
+    `src.metrics.Span.yielding`); `size(item)` is counted per item instead of 1 when given.
+    """
+    with span:
+        for item in span.yielding(items):
+            span.add(unit, size(item) if size is not None else 1)
+            yield item
+
+def time_queries(function, queries):
+    """
+    Calls `function` once per query and returns the per-query latencies in milliseconds.
+    """
+    latencies = []
+    for query in queries:
+        started_at = time.perf_counter()
+        function(query)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+    return latencies
+
+def benchmark_corpus_size(chunk_count, benchmark_config, vocabulary, rng):
+    """
+    Benchmarks every pipeline stage on a fresh synthetic corpus of `chunk_count` chunks.
+
+    Returns
+    -------
+    dict
+        The stage results of this corpus size.
+    """
+    work_directory = os.path.join(benchmark_config['work_dir'], f'chunks_{chunk_count}')
+    corpus_directory = os.path.join(work_directory, 'corpus')
+    shutil.rmtree(work_directory, ignore_errors=True)
+
+    chunk_settings = get_chunk_settings()
+    corpus_chars = generate_corpus(
+        corpus_directory, chunk_count, chunk_settings['chunk_size'] - chunk_settings['chunk_overlap'], vocabulary, rng
+    )
+    queries = [' '.join(rng.sample(vocabulary[:2000], 5)) for _ in range(int(benchmark_config['num_queries']))]
+    embedding = DeterministicFakeEmbedding(size=int(benchmark_config['embedding_dim']))
+    llm = FakeListLLM(responses=['This is a benchmark answer from the fake LLM.'])
+    vector_storedb = benchmark_config['vector_store_db']
+
+    stages = {}
+    try:
+        with benchmark_environment(work_directory, corpus_directory, vector_storedb):
+            # Loading, splitting and the index build run as one stream, as in the pipeline, so the corpus is
+            # never held in memory; the load and split stages are timed only while they produce items
+            stream_metrics = MetricsRegistry()
+            documents = timed_stream(
+                Span('load', stream_metrics), data_loader(), 'chars', size=lambda document: len(document.page_content)
+            )
+            split_span = Span('split', stream_metrics)
+            chunks = timed_stream(split_span, data_splitter(split_span.excluding(documents)), 'chunks')
+
+            logger_for_benchmark.info('Benchmark stage started: load, split and index')
+            started_at = time.perf_counter()
+            retriever = create_vector_store_db(chunks, embedding, vector_storedb)
+            if retriever is None:
+                raise RuntimeError('Index build failed, see the vectordb builder logs')
+            retriever = build_hybrid_retriever(retriever, vector_storedb)
+            build_seconds = time.perf_counter() - started_at
+
+            # The index stage is what the build took besides loading and splitting its input
+            for stage_name, unit in (('load', 'chars'), ('split', 'chunks')):
+                seconds = stream_metrics.wall_seconds[stage_name].total
+                stages[stage_name] = stage_summary(seconds, stream_metrics.items.get((stage_name, unit), 0), unit)
+                build_seconds -= seconds
+            stages['index'] = stage_summary(build_seconds, stream_metrics.items.get(('split', 'chunks'), 0), 'chunks')
+            logger_for_benchmark.info(
+                'Benchmark stage finished: load %s, split %s, index %s', stages['load'], stages['split'], stages['index']
+            )
+
+            def retrieve():
+                return None, len(queries), time_queries(retriever.invoke, queries)
+            run_stage(stages, 'retrieve', 'queries', retrieve)
+
+            chain = build_prompt_chain(retriever, llm=llm)
+            def answer():
+                return None, len(queries), time_queries(lambda query: chain.invoke({"input": query}), queries)
+            run_stage(stages, 'chain', 'queries', answer)
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    return {'chunk_count': chunk_count, 'corpus_chars': corpus_chars, 'stages': stages}
+
+def get_git_commit():
+    """
+    Returns the current git commit of the repository, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark():
+    """
+    Benchmarks data loading, splitting, index build, retrieval and chain invocation on synthetic corpora.
+
+    Returns
+    -------
+    dict
+        The benchmark report, also written as JSON to `benchmark -> output_path`.
+
+    Notes
+    -----
+    - Runs offline: chunks are embedded with LangChain's `DeterministicFakeEmbedding` and answers come
+      from a `FakeListLLM`, so neither Ollama nor a network is needed and results are reproducible.
+    - For every size in `benchmark -> corpus_sizes` (in chunks), a fresh .txt corpus is generated in
+      `benchmark -> work_dir`, which also holds the vector store, and deleted afterwards.
+    - Every stage reports its duration, items per second and the process's peak RSS so far; the
+      retrieval and chain stages also report p50/p95/p99 per-query latency.
+    - The corpus is streamed from the loader through the splitter into the index build, as in the
+      pipeline; the load and split stages only count the time spent producing their items, and the
+      index stage the rest of the build, so the three add up to the build's wall time.
+    - The embedding and answer caches are disabled while benchmarking; the retriever is built as
+      configured otherwise (hybrid retrieval, re-ranking, context packing).
+    - The report records the git commit, so results can be compared across commits.
+    """
+    try:
+        log_component_start(logger_for_benchmark, 'Benchmark Component')
+
+        benchmark_config = get_config()['benchmark']
+        rng = random.Random(BENCHMARK_SEED)
+        vocabulary = make_vocabulary(int(benchmark_config['vocabulary_size']), rng)
+
+        results = []
+        for chunk_count in benchmark_config['corpus_sizes']:
+            logger_for_benchmark.info('Benchmarking a synthetic corpus of %s chunks', chunk_count)
+            results.append(benchmark_corpus_size(int(chunk_count), benchmark_config, vocabulary, rng))
+
+        report = {
+            'git_commit': get_git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'vector_store_db': benchmark_config['vector_store_db'],
+            'embedding_dim': int(benchmark_config['embedding_dim']),
+            'chunk_settings': get_chunk_settings(),
+            'results': results
+        }
+
+        output_path = benchmark_config['output_path']
+        output_directory = os.path.dirname(output_path)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        logger_for_benchmark.info('Benchmark report written to: %s', output_path)
+
+        log_component_end(logger_for_benchmark, 'Benchmark Component')
+        return report
+
+    except Exception as e:
+        logger_for_benchmark.debug('Error encountered in benchmark component. error: %s', e)
+        log_component_end(logger_for_benchmark, 'Benchmark Component')
+        raise
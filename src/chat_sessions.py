@@ -0,0 +1,316 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from src.context_packer import estimate_tokens
+from src.config_loader import get_config
+from src.metrics import instrument
+from src.model_clients import build_ollama_llm
+from src.logger import logger_for_chat_sessions
+
+# Prompt folding older turns into the running summary; only the previous summary and the folded turns are sent
+SUMMARY_PROMPT_TEMPLATE = (
+    "Summarize the conversation between a user and an assistant below, keeping the facts, names and open "
+    "questions the user may refer back to. Reply with the summary only, in at most {max_words} words.\n\n"
+    "Summary so far:\n{summary}\n\nNew turns:\n{turns}\n\nUpdated summary:"
+)
+
+# Words per token assumed when asking the LLM for a summary of at most so many tokens
+WORDS_PER_TOKEN = 0.75
+
+def format_turns(turns):
+    """
+    Formats `(question, answer)` turns as `User:` / `Assistant:` lines.
+    """
+    return '\n'.join(f'User: {question}\nAssistant: {answer}' for question, answer in turns)
+
+def trim_to_tokens(text, max_tokens, chars_per_token):
+    """
+    Cuts a text to at most `max_tokens` estimated tokens, at a word boundary.
+    """
+    if estimate_tokens(text, chars_per_token) <= max_tokens:
+        return text
+    text = text[:int(max_tokens * chars_per_token)]
+    return text[:text.rfind(' ')] if ' ' in text else text
+
+def get_history_settings():
+    """
+    Returns the settings that bound a session's history.
+
+    Returns
+    -------
+    dict
+        `history_token_budget`, `summary_token_budget` and `recent_turns` from the `conversation` section,
+        and the `chars_per_token` of `context_packing`, used to estimate token counts.
+    """
+    config = get_config()
+    conversation_config = config['conversation']
+    return {
+        'history_token_budget': int(conversation_config['history_token_budget']),
+        'summary_token_budget': int(conversation_config['summary_token_budget']),
+        'recent_turns': int(conversation_config['recent_turns']),
+        'chars_per_token': float(config['context_packing']['chars_per_token'])
+    }
+
+def summarize_turns(llm, summary, turns, max_tokens, chars_per_token):
+    """
+    Folds turns into a running summary with one LLM call.
+
+    Parameters
+    ----------
+    llm : BaseLanguageModel
+        The LLM writing the summary.
+    summary : str
+        The summary of the turns folded so far (may be empty).
+    turns : list of tuple
+        The `(question, answer)` turns to fold in.
+    max_tokens : int
+        Maximum estimated tokens of the new summary; a longer reply is cut.
+    chars_per_token : float
+        Characters per token used to estimate token counts.
+
+    Returns
+    -------
+    str
+        The updated summary.
+    """
+    prompt = SUMMARY_PROMPT_TEMPLATE.format(
+        max_words=max(1, int(max_tokens * WORDS_PER_TOKEN)), summary=summary or '(none)', turns=format_turns(turns)
+    )
+    reply = llm.invoke(prompt)
+    return trim_to_tokens(getattr(reply, 'content', reply).strip(), max_tokens, chars_per_token)
+
+class ChatSession:
+    """
+    One conversation: a running summary of its older turns, and its recent turns verbatim.
+
+    Parameters
+    ----------
+    session_id : str
+        Id of the session.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.summary = ''
+        self.turns = []
+        self.turn_count = 0
+        self.last_used = time.monotonic()
+        # Held while a turn is answered, so the turns of a session never interleave
+        self.lock = threading.Lock()
+
+    def history_text(self):
+        """
+        Returns the conversation as put into prompts: the summary of older turns, then the recent turns.
+
+        Between summarizations new turns are only appended, so the text of one turn is a prefix of the next one's.
+        """
+        parts = []
+        if self.summary:
+            parts.append(f'Summary of earlier turns: {self.summary}')
+        if self.turns:
+            parts.append(format_turns(self.turns))
+        return '\n'.join(parts)
+
+    def chain_input(self, question):
+        """
+        Returns the input of a conversational chain (see `build_conversational_chain`) for a question.
+        """
+        return {'input': question, 'chat_history': self.history_text()}
+
+    def add_turn(self, question, answer, llm=None):
+        """
+        Records an answered question and summarizes older turns if the history exceeds its token budget.
+
+        Parameters
+        ----------
+        question : str
+            The user's question.
+        answer : str
+            The answer given.
+        llm : BaseLanguageModel, optional
+            The LLM summarizing older turns. Defaults to the Ollama model set in the config.
+        """
+        self.turns.append((question, answer))
+        self.turn_count += 1
+        compact_history(self, get_history_settings(), llm)
+
+def compact_history(session, history_settings, llm=None):
+    """
+    Keeps a session's history within `history_token_budget` by folding older turns into its summary.
+
+    Parameters
+    ----------
+    session : ChatSession
+        The session whose history is compacted.
+    history_settings : dict
+        As returned by `get_history_settings`.
+    llm : BaseLanguageModel, optional
+        The LLM summarizing older turns. Defaults to the Ollama model set in the config.
+
+    Notes
+    -----
+    - Nothing happens while the history fits its budget, so the prompt prefix stays the same from turn
+      to turn; once it does not, every turn but the `recent_turns` most recent ones is folded at once,
+      and the history is stable again for the next several turns.
+    - Summarization is incremental: only the previous summary and the folded turns are sent to the LLM.
+    - If the recent turns alone still exceed the budget, they are folded as well. The summary is capped
+      at `summary_token_budget`, which is below the history budget, so the history always ends up within it.
+    """
+    chars_per_token = history_settings['chars_per_token']
+    def over_budget():
+        return estimate_tokens(session.history_text(), chars_per_token) > history_settings['history_token_budget']
+
+    if not over_budget():
+        return
+
+    with instrument('history_summarizer') as span:
+        if llm is None:
+            llm = build_ollama_llm(get_config()['ollama_model']['ollama_llm'])
+        for keep in (history_settings['recent_turns'], 0):
+            fold_count = len(session.turns) - keep
+            if fold_count <= 0 or not over_budget():
+                continue
+            session.summary = summarize_turns(
+                llm, session.summary, session.turns[:fold_count], history_settings['summary_token_budget'], chars_per_token
+            )
+            session.turns = session.turns[fold_count:]
+            span.add('summarized_turns', fold_count)
+            logger_for_chat_sessions.info(
+                'Session %s: %s turns folded into the summary, history now %s tokens',
+                session.session_id, fold_count, estimate_tokens(session.history_text(), chars_per_token)
+            )
+
+class SessionStore:
+    """
+    Bounded, thread-safe LRU store of chat sessions.
+
+    Parameters
+    ----------
+    max_sessions : int
+        Maximum number of sessions kept; the least recently used one is dropped first.
+    ttl_seconds : float
+        Sessions idle for longer than this are dropped; 0 keeps them until they are evicted.
+    """
+
+    def __init__(self, max_sessions, ttl_seconds):
+        self.max_sessions = int(max_sessions)
+        self.ttl_seconds = float(ttl_seconds)
+        self.evicted = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id=None):
+        """
+        Returns the session with the given id, starting a new one if it does not exist (anymore).
+
+        Parameters
+        ----------
+        session_id : str, optional
+            Id of the session; a new session gets a random id when it is not given.
+
+        Returns
+        -------
+        ChatSession
+            The session, marked as most recently used.
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Sessions are kept in last-use order, so the expired ones are at the front
+            while self.ttl_seconds and self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_used <= self.ttl_seconds:
+                    break
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(session_id or uuid.uuid4().hex)
+                self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            session.last_used = now
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            return session
+
+    def resize(self, max_sessions, ttl_seconds):
+        """
+        Changes the store's limits, keeping its sessions; sessions above the new maximum are dropped, least recently used first.
+        """
+        with self._lock:
+            self.max_sessions = int(max_sessions)
+            self.ttl_seconds = float(ttl_seconds)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def delete(self, session_id):
+        """
+        Drops a session; unknown ids are ignored.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+def build_session_store():
+    """
+    Builds the session store from the `conversation` section of the config.
+
+    Returns
+    -------
+    SessionStore or None
+        The store, or None when `conversation -> enabled` is false.
+    """
+    conversation_config = get_config()['conversation']
+    if not conversation_config['enabled']:
+        return None
+    return SessionStore(conversation_config['max_sessions'], conversation_config['session_ttl_seconds'])
+
+def update_session_store(session_store):
+    """
+    Applies the `conversation` section of the config to a session store, e.g. after a hot reload.
+
+    Parameters
+    ----------
+    session_store : SessionStore or None
+        The store in use, None when conversations were disabled.
+
+    Returns
+    -------
+    SessionStore or None
+        The same store with its sessions and the new limits, a new store if conversations were just
+        enabled, or None when they are disabled.
+    """
+    conversation_config = get_config()['conversation']
+    if session_store is None or not conversation_config['enabled']:
+        return build_session_store()
+    session_store.resize(conversation_config['max_sessions'], conversation_config['session_ttl_seconds'])
+    return session_store
+
+def answer_in_session(retrieval_chain, session, question):
+    """
+    Answers a question within a session and records the turn.
+
+    Parameters
+    ----------
+    retrieval_chain : RetrievalChain
+        A chain built by `build_conversational_chain`.
+    session : ChatSession
+        The session the question is asked in.
+    question : str
+        The user's question.
+
+    Returns
+    -------
+    dict
+        The chain's response, with its `answer` and `context`.
+    """
+    with session.lock:
+        response = retrieval_chain.invoke(session.chain_input(question))
+        session.add_turn(question, response['answer'])
+    return response
@@ -1,49 +1,254 @@
+import argparse
+import os
+import threading
+import time
 import yaml
-from src.logger import logger_for_config_file, log_component_start, log_component_end
+from src.config_schema import QUERY_TIME_SECTIONS, validate_config
+from src.logger import logger_for_config_file, log_component_start, log_component_end, configure_logging
+
+# Root of the project; relative paths in the config file are resolved against it by default
+PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Config file used unless another one is given on the command line or in GENAI_PIPELINE_CONFIG
+DEFAULT_CONFIG_FILE_PATH = os.path.join(PROJECT_DIRECTORY, 'config', 'config.yaml')
+
+# Environment variable holding the path of the config file
+CONFIG_FILE_ENV_VAR = 'GENAI_PIPELINE_CONFIG'
+
+# Prefix of environment variables overriding single settings, e.g. GENAI_PIPELINE__QUERY_SERVER__PORT=8081
+OVERRIDE_ENV_PREFIX = 'GENAI_PIPELINE__'
+
+# Config file path and `section.key=value` overrides given on the command line
+command_line_options = {'config_file_path': None, 'overrides': []}
+
+def get_config_file_path():
+    """
+    Returns the config file in use: the command line's, else GENAI_PIPELINE_CONFIG's, else config/config.yaml.
+    """
+    return command_line_options['config_file_path'] or os.environ.get(CONFIG_FILE_ENV_VAR) or DEFAULT_CONFIG_FILE_PATH
+
+def apply_override(raw_config, key_path, value):
+    """
+    Sets one setting of a raw config dictionary.
+
+    Parameters
+    ----------
+    raw_config : dict
+        The parsed config file.
+    key_path : list of str
+        Section and key names, e.g. `['query_server', 'port']`.
+    value : str
+        The new value, parsed as YAML so numbers, booleans and lists keep their types.
+    """
+    section = raw_config
+    for key in key_path[:-1]:
+        section = section.setdefault(key, {})
+    section[key_path[-1]] = yaml.safe_load(value)
+
+def read_config_file(config_file_path):
+    """
+    Reads, overrides and validates a config file.
+
+    Environment overrides (`GENAI_PIPELINE__<SECTION>__<KEY>=value`) are applied on top of the file,
+    and command line overrides (`--set section.key=value`) on top of those.
+
+    Returns
+    -------
+    dict
+        The validated configuration; see `src.config_schema.validate_config`.
+    """
+    with open(config_file_path, 'r', encoding='utf-8') as file:
+        raw_config = yaml.safe_load(file)
+
+    for variable, value in sorted(os.environ.items()):
+        if variable.startswith(OVERRIDE_ENV_PREFIX):
+            apply_override(raw_config, variable[len(OVERRIDE_ENV_PREFIX):].lower().split('__'), value)
+    for override in command_line_options['overrides']:
+        key_path, _, value = override.partition('=')
+        apply_override(raw_config, key_path.split('.'), value)
+
+    return validate_config(raw_config, PROJECT_DIRECTORY)
 
 def load_config_file():
     """
-    Loads the project's configuration from a JSON file located at a hard-coded path.
-    This function opens and reads the `config.json` file from a specified location, parses its contents using the `json` module, and returns the resulting dictionary.
+    Loads the project's configuration from the config file.
+    The file is parsed as YAML, overridden from the environment and the command line, and validated
+    against the schema in `src.config_schema`; relative paths are resolved against the project directory.
     It also logs success and failure messages for debugging and monitoring.
     Returns:
-        dict: The contents of the configuration file as a Python dictionary.
+        dict: The validated configuration.
     Raises:
-        Exception: If the file cannot be loaded or parsed, an exception is raised and logged.
+        Exception: If the file cannot be loaded, parsed or validated, an exception is raised and logged.
     """
+    global config_file_mtime
     try:
     # Log the attempt to load the config file
         log_component_start(logger_for_config_file, 'Config File Component')
         logger_for_config_file.info('Trying to load the config file to access the data inside it')
 
-        # NOTE: Update this hard-coded path if the project is moved to another directory
-        config_file_path = r'C:\Users\BW\Desktop\Basic gen ai chatbot project\config\config.yaml'
-        
-        # Open and load the contents of the config file using JSON
-        with open(config_file_path, 'r') as file:
-            config_file = yaml.safe_load(file)
-            logger_for_config_file.info('Config file has been succesfully loaded')
-            log_component_end(logger_for_config_file, 'Config File Component')
-
-            # Return the parsed configuration data
-            return config_file
+        config_file_path = get_config_file_path()
+        config_file_mtime = os.stat(config_file_path).st_mtime_ns
+        config_file = read_config_file(config_file_path)
+
+        # Start the background log writer with the log file, rotation and levels from the config
+        configure_logging(config_file['logging'])
+        logger_for_config_file.info('Config file has been succesfully loaded from: %s', config_file_path)
+        log_component_end(logger_for_config_file, 'Config File Component')
+
+        # Return the parsed configuration data
+        return config_file
     except Exception as cfg_e:
         # Log any exception encountered and re-raise it to halt execution
-        logger_for_config_file.debug(f'Error loading config file. error: {cfg_e}')
+        logger_for_config_file.debug('Error loading config file. error: %s', cfg_e)
         log_component_end(logger_for_config_file, 'Config File Component')
         raise
 
-# Global configuration dictionary loaded once for reuse across the codebase
-config = load_config_file()
+# Global configuration dictionary, loaded on the first `get_config` call and reused across the codebase
+config = None
+config_file_mtime = None
+_config_lock = threading.RLock()
+
+# Callbacks told which query-time sections a hot reload changed
+_config_listeners = []
+_config_watcher = None
 
 def get_config():
     """
     Provides access to the loaded config file.
 
-    This is a getter function that returns the global config variable loaded
-    during module initialization.
+    The config file is read on the first call and cached, so importing a module does not touch the
+    filesystem. Every caller receives the same dictionary.
 
     Returns:
         dict: The configuration settings.
     """
-    return config
\ No newline at end of file
+    global config
+    if config is None:
+        with _config_lock:
+            if config is None:
+                config = load_config_file()
+    return config
+
+def set_config(config_file):
+    """
+    Installs an already loaded configuration in this process and starts its log writer.
+
+    Used as the initializer of worker processes, so they run with the parent's configuration
+    (including its command line overrides) instead of reading the config file again.
+
+    Parameters
+    ----------
+    config_file : dict
+        The validated configuration, as returned by `get_config` in the parent process.
+    """
+    global config
+    with _config_lock:
+        config = config_file
+    configure_logging(config_file['logging'])
+
+def apply_command_line_overrides(argv=None):
+    """
+    Applies the config options of a script's command line.
+
+    Options
+    -------
+    --config PATH
+        Config file to use instead of config/config.yaml.
+    --instance NAME
+        Instance name; its vector stores and logs are kept in their own sub-directories.
+    --set SECTION.KEY=VALUE
+        Overrides a single setting; may be repeated.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The arguments to parse; defaults to `sys.argv[1:]`.
+    """
+    global config
+    parser = argparse.ArgumentParser(description='Options overriding config.yaml')
+    parser.add_argument('--config', dest='config_file_path', help='config file to use')
+    parser.add_argument('--instance', help='instance name, separating its vector stores and logs from other instances')
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='SECTION.KEY=VALUE',
+                        help='override a single setting (repeatable)')
+    arguments = parser.parse_args(argv)
+
+    with _config_lock:
+        command_line_options['config_file_path'] = arguments.config_file_path
+        command_line_options['overrides'] = arguments.overrides + (
+            [f'paths.instance={arguments.instance}'] if arguments.instance else []
+        )
+        # Load again on the next `get_config` call, with these options
+        config = None
+
+def add_config_listener(callback):
+    """
+    Registers a callback run after a hot reload, with the set of query-time sections that changed.
+    """
+    _config_listeners.append(callback)
+
+def reload_config_if_changed():
+    """
+    Re-reads the config file if it changed since it was loaded, and applies its query-time settings.
+
+    Sections listed in `QUERY_TIME_SECTIONS` (LLM, prompt, retrieval k, re-ranking, context packing,
+    conversations) are updated in place in the shared config dictionary; changes to any other section are logged as
+    needing a restart and not applied. A file that fails validation is logged and ignored, keeping the
+    current settings.
+
+    Returns
+    -------
+    set of str
+        The query-time sections that changed; listeners registered with `add_config_listener` are
+        called with it when it is not empty.
+    """
+    global config_file_mtime
+    current_config = get_config()
+    with _config_lock:
+        config_file_path = get_config_file_path()
+        try:
+            mtime = os.stat(config_file_path).st_mtime_ns
+            if mtime == config_file_mtime:
+                return set()
+            config_file_mtime = mtime
+            new_config = read_config_file(config_file_path)
+        except Exception as e:
+            logger_for_config_file.warning('Config file changed but could not be reloaded, keeping the current settings. error: %s', e)
+            return set()
+
+        changed_sections = {section for section, value in new_config.items() if current_config.get(section) != value}
+        reloaded_sections = changed_sections.intersection(QUERY_TIME_SECTIONS)
+        for section in reloaded_sections:
+            current_config[section] = new_config[section]
+
+    if changed_sections - reloaded_sections:
+        logger_for_config_file.warning(
+            'Config changes to %s only take effect after a restart', ', '.join(sorted(changed_sections - reloaded_sections))
+        )
+    if reloaded_sections:
+        logger_for_config_file.info('Reloaded query-time settings: %s', ', '.join(sorted(reloaded_sections)))
+        for callback in _config_listeners:
+            callback(reloaded_sections)
+    return reloaded_sections
+
+def start_config_watcher():
+    """
+    Starts a background thread polling the config file and hot-reloading its query-time settings.
+
+    Does nothing when `config_reload -> enabled` is false or the watcher is already running.
+    """
+    global _config_watcher
+    reload_config = get_config()['config_reload']
+    if not reload_config['enabled'] or _config_watcher is not None:
+        return
+
+    def watch():
+        while True:
+            time.sleep(reload_config['poll_seconds'])
+            try:
+                reload_config_if_changed()
+            except Exception as e:
+                logger_for_config_file.debug('Error encountered while hot-reloading the config file. error: %s', e)
+
+    _config_watcher = threading.Thread(target=watch, name='config-watcher', daemon=True)
+    _config_watcher.start()
+    logger_for_config_file.info('Watching %s for query-time setting changes', get_config_file_path())
@@ -0,0 +1,335 @@
+import os
+import re
+from typing import Annotated, Dict, List, Literal, Union
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field, ValidationInfo, field_validator, model_validator
+
+# Top-level sections that may change while a process runs; `reload_config_if_changed` applies these
+# and reports every other change as needing a restart
+QUERY_TIME_SECTIONS = (
+    'ollama_model', 'chatprompttemplate_system_instruction', 'hybrid_retrieval', 'reranking', 'context_packing',
+    'conversation'
+)
+
+LogLevel = Literal['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+FaissIndexType = Literal['flat', 'ivf', 'hnsw', 'ivf_pq', 'ivf_sq8', 'hnsw_sq8']
+
+VectorStoreDb = Literal['faiss', 'chroma', 'numpy']
+
+def resolve_config_path(value, info: ValidationInfo):
+    """
+    Resolves a path from the config file.
+
+    `{base_dir}`, `{vector_store_dir}` and `{logs_dir}` placeholders are filled in from the `paths`
+    section, `~` and environment variables are expanded, and relative paths are taken relative to
+    `paths -> base_dir`. Empty paths stay empty (they disable the output they configure).
+    """
+    if not value:
+        return value
+    directories = info.context['directories']
+    value = os.path.expandvars(os.path.expanduser(value.format(**directories)))
+    return os.path.normpath(os.path.join(directories['base_dir'], value))
+
+# A filesystem path resolved by `resolve_config_path`
+ConfigPath = Annotated[str, AfterValidator(resolve_config_path)]
+
+class Section(BaseModel):
+    """
+    Base of every config section; unknown keys are rejected so typos fail at start-up.
+    """
+
+    model_config = ConfigDict(extra='forbid')
+
+class PathsSection(Section):
+    base_dir: str = ''
+    instance: str = ''
+    vector_store_dir: str = 'vector_store_dbs'
+    logs_dir: str = 'logs'
+
+    @field_validator('instance')
+    @classmethod
+    def check_instance(cls, instance):
+        if not re.fullmatch(r'[A-Za-z0-9_.-]*', instance):
+            raise ValueError('may only contain letters, digits, "_", "." and "-"')
+        return instance
+
+class ConfigReloadSection(Section):
+    enabled: bool = True
+    poll_seconds: float = Field(2.0, gt=0)
+
+class LoggingSection(Section):
+    log_file: ConfigPath
+    max_bytes: int = Field(gt=0)
+    backup_count: int = Field(ge=0)
+    level: LogLevel
+    file_level: LogLevel
+    console_level: LogLevel
+    component_levels: Dict[str, LogLevel] = {}
+
+class DataFileSection(Section):
+    data_file_path: ConfigPath
+    file_workers: int = Field(ge=0)
+    pdf_workers: int = Field(ge=0)
+    pages_per_task: int = Field(gt=0)
+    text_window_chars: int = Field(gt=0)
+
+class TextSplitterSection(Section):
+    chunk_size: int = Field(gt=0)
+    chunk_overlap: int = Field(ge=0)
+    mode: Literal['character', 'token'] = 'character'
+    tokenizer: str = ''
+    split_workers: int = Field(0, ge=0)
+    documents_per_task: int = Field(64, gt=0)
+
+    @model_validator(mode='after')
+    def check_overlap(self):
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError('chunk_overlap must be smaller than chunk_size')
+        if self.mode == 'token' and not self.tokenizer:
+            raise ValueError('token mode needs a tokenizer')
+        return self
+
+class OllamaEmbeddingSection(Section):
+    embedding_model: str
+    base_url: str
+
+class ModelClientsSection(Section):
+    endpoints: List[str] = []
+    pool_maxsize: int = Field(8, gt=0)
+    max_concurrency: int = Field(4, gt=0)
+    model_concurrency: Dict[str, Annotated[int, Field(gt=0)]] = {}
+    timeout_seconds: float = Field(120, gt=0)
+    coalesce: bool = True
+
+class EmbeddingCacheSection(Section):
+    enabled: bool
+    cache_path: ConfigPath
+    max_entries: int = Field(gt=0)
+
+class EmbeddingBatchingSection(Section):
+    batch_size: int = Field(gt=0)
+    max_workers: int = Field(gt=0)
+    max_retries: int = Field(ge=0)
+    retry_backoff_seconds: float = Field(ge=0)
+
+class AnswerCacheSection(Section):
+    enabled: bool
+    cache_path: ConfigPath
+    similarity_threshold: float = Field(ge=0, le=1)
+    ttl_seconds: float = Field(gt=0)
+    max_entries: int = Field(gt=0)
+
+class OllamaModelSection(Section):
+    ollama_llm: str
+    keep_alive: Union[str, int]
+
+class FaissIndexSection(Section):
+    index_type: FaissIndexType
+    nlist: int = Field(gt=0)
+    pq_m: int = Field(gt=0)
+    pq_nbits: int = Field(gt=0)
+    hnsw_m: int = Field(gt=0)
+    ef_construction: int = Field(gt=0)
+    training_sample_size: int = Field(gt=0)
+    nprobe: int = Field(gt=0)
+    ef_search: int = Field(gt=0)
+
+class AnnReportSection(Section):
+    index_types: List[FaissIndexType]
+    num_queries: int = Field(gt=0)
+    k: int = Field(gt=0)
+    nprobe_values: List[Annotated[int, Field(gt=0)]]
+    ef_search_values: List[Annotated[int, Field(gt=0)]]
+    output_path: ConfigPath
+
+class ImportProfileSection(Section):
+    modules: List[str]
+    runs: int = Field(gt=0)
+    budget_ms: float = Field(gt=0)
+    top_n: int = Field(gt=0)
+    output_path: ConfigPath
+
+class HybridRetrievalSection(Section):
+    enabled: bool
+    k: int = Field(gt=0)
+    fetch_k: int = Field(gt=0)
+    rrf_k: int = Field(gt=0)
+    bm25_k1: float = Field(ge=0)
+    bm25_b: float = Field(ge=0, le=1)
+
+class RerankingSection(Section):
+    enabled: bool
+    method: Literal['cross_encoder', 'mmr']
+    cross_encoder_model: str
+    fetch_k: int = Field(gt=0)
+    top_n: int = Field(gt=0)
+    batch_size: int = Field(gt=0)
+    mmr_lambda: float = Field(ge=0, le=1)
+    score_cache_size: int = Field(gt=0)
+
+class ContextPackingSection(Section):
+    enabled: bool
+    token_budget: int = Field(gt=0)
+    chars_per_token: float = Field(gt=0)
+    max_merge_gap: int = Field(ge=0)
+    min_piece_tokens: int = Field(ge=0)
+
+class ConversationSection(Section):
+    enabled: bool = True
+    system_instruction: str
+    rewrite_questions: bool = True
+    history_token_budget: int = Field(600, gt=0)
+    summary_token_budget: int = Field(200, gt=0)
+    recent_turns: int = Field(2, ge=0)
+    max_sessions: int = Field(1000, gt=0)
+    session_ttl_seconds: float = Field(3600, ge=0)
+
+    @model_validator(mode='after')
+    def check_budgets(self):
+        if self.summary_token_budget >= self.history_token_budget:
+            raise ValueError('summary_token_budget must be smaller than history_token_budget')
+        return self
+
+class NumpyVecdbSection(Section):
+    dtype: Literal['float32', 'float16', 'int8']
+    dimensions: int = Field(0, ge=0)
+    rescore_factor: int = Field(4, ge=0)
+
+class VectorShardsSection(Section):
+    shard_count: int = Field(0, ge=0)
+    build_workers: int = Field(4, gt=0)
+    search_workers: int = Field(4, ge=0)
+    rebuild_shards: List[Annotated[int, Field(ge=0)]] = []
+
+class IndexSnapshotsSection(Section):
+    enabled: bool = True
+    keep_snapshots: int = Field(3, ge=2)
+    poll_seconds: float = Field(5, gt=0)
+    drain_seconds: float = Field(60, ge=0)
+
+class QuantizationReportSection(Section):
+    variants: List[NumpyVecdbSection]
+    num_queries: int = Field(gt=0)
+    k: int = Field(gt=0)
+    output_path: ConfigPath
+
+class QueryServerSection(Section):
+    host: str
+    port: int = Field(ge=0, le=65535)
+    max_workers: int = Field(gt=0)
+    max_pending: int = Field(ge=0)
+
+class MetricsSection(Section):
+    enabled: bool
+    trace_path: ConfigPath
+    prometheus_path: ConfigPath
+
+class BatchQuerySection(Section):
+    enabled: bool
+    questions_path: ConfigPath
+    output_path: ConfigPath
+    k: int = Field(gt=0)
+    max_concurrency: int = Field(gt=0)
+
+class BenchmarkSection(Section):
+    corpus_sizes: List[Annotated[int, Field(gt=0)]]
+    vector_store_db: VectorStoreDb
+    embedding_dim: int = Field(gt=0)
+    vocabulary_size: int = Field(gt=0)
+    num_queries: int = Field(gt=0)
+    work_dir: ConfigPath
+    output_path: ConfigPath
+
+class PipelineConfig(Section):
+    """
+    Schema of config.yaml; see the comments in the file for what every setting does.
+    """
+
+    paths: PathsSection = PathsSection()
+    config_reload: ConfigReloadSection = ConfigReloadSection()
+    logging: LoggingSection
+    data_file: DataFileSection
+    revursive_text_splitter: TextSplitterSection
+    ollama_embedding: OllamaEmbeddingSection
+    model_clients: ModelClientsSection = ModelClientsSection()
+    embedding_cache: EmbeddingCacheSection
+    embedding_batching: EmbeddingBatchingSection
+    answer_cache: AnswerCacheSection
+    ollama_model: OllamaModelSection
+    vector_store_db: VectorStoreDb
+    faiss_index: FaissIndexSection
+    ann_report: AnnReportSection
+    quantization_report: QuantizationReportSection
+    import_profile: ImportProfileSection
+    hybrid_retrieval: HybridRetrievalSection
+    reranking: RerankingSection
+    context_packing: ContextPackingSection
+    conversation: ConversationSection
+    numpy_vecdb: NumpyVecdbSection
+    vector_shards: VectorShardsSection = VectorShardsSection()
+    index_snapshots: IndexSnapshotsSection = IndexSnapshotsSection()
+    query_server: QueryServerSection
+    metrics: MetricsSection
+    chatprompttemplate_system_instruction: str
+    query: str
+    batch_query: BatchQuerySection
+    benchmark: BenchmarkSection
+
+    @field_validator('chatprompttemplate_system_instruction')
+    @classmethod
+    def check_prompt_variables(cls, instruction):
+        for variable in ('{context}', '{input}'):
+            if variable not in instruction:
+                raise ValueError(f'must contain the {variable} placeholder')
+        return instruction
+
+def resolve_directories(paths, project_directory):
+    """
+    Resolves the directories of the `paths` section into absolute paths.
+
+    Parameters
+    ----------
+    paths : PathsSection
+        The validated `paths` section.
+    project_directory : str
+        Directory `paths -> base_dir` defaults to (and is relative to).
+
+    Returns
+    -------
+    dict
+        `base_dir`, plus `vector_store_dir` and `logs_dir` with the instance name appended when one is set.
+    """
+    base_dir = os.path.normpath(os.path.join(project_directory, os.path.expanduser(paths.base_dir)))
+    return {
+        'base_dir': base_dir,
+        'vector_store_dir': os.path.normpath(os.path.join(base_dir, paths.vector_store_dir, paths.instance)),
+        'logs_dir': os.path.normpath(os.path.join(base_dir, paths.logs_dir, paths.instance))
+    }
+
+def validate_config(raw_config, project_directory):
+    """
+    Validates a raw config dictionary and resolves its paths.
+
+    Parameters
+    ----------
+    raw_config : dict
+        The parsed config file, with any overrides applied.
+    project_directory : str
+        Directory relative paths are resolved against, unless `paths -> base_dir` says otherwise.
+
+    Returns
+    -------
+    dict
+        The validated config with defaults filled in, values converted to their declared types and
+        paths made absolute. The `paths` section holds the resolved directories.
+
+    Raises
+    ------
+    pydantic.ValidationError
+        If a setting is missing, unknown, of the wrong type or out of range.
+    """
+    paths = PathsSection.model_validate(raw_config.get('paths') or {})
+    directories = resolve_directories(paths, project_directory)
+    validated = PipelineConfig.model_validate(raw_config, context={'directories': directories}).model_dump()
+    validated['paths'].update(directories)
+    return validated
@@ -0,0 +1,181 @@
+import math
+from typing import Any
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.config_loader import get_config
+from src.metrics import instrument
+from src.logger import logger_for_context_packer
+
+def estimate_tokens(text, chars_per_token):
+    """
+    Estimates the number of LLM tokens in a text from its length.
+    """
+    return math.ceil(len(text) / chars_per_token)
+
+def merge_neighbouring_chunks(documents, max_merge_gap):
+    """
+    Merges retrieved chunks that overlap or touch within the same page (or .txt file) into spans.
+
+    Parameters
+    ----------
+    documents : list of Document
+        Retrieved chunks, most relevant first.
+    max_merge_gap : int
+        Chunks separated by at most this many characters are merged.
+
+    Returns
+    -------
+    list of dict
+        One span per group of merged chunks, with its `text`, `metadata`, `rank` (best rank of its chunks)
+        and `chunk_count`, ordered by rank. Exact duplicate chunks are collapsed as well.
+    """
+    spans_by_page = {}
+    unplaced_spans = []
+    seen_texts = set()
+    for rank, document in enumerate(documents):
+        if document.page_content in seen_texts:
+            continue
+        seen_texts.add(document.page_content)
+
+        span = {'text': document.page_content, 'metadata': dict(document.metadata), 'rank': rank, 'chunk_count': 1}
+        start_index = document.metadata.get('start_index', -1)
+        if start_index is None or start_index < 0:
+            unplaced_spans.append(span)
+            continue
+        span['start'] = start_index
+        page_key = (document.metadata.get('source'), document.metadata.get('page'))
+        spans_by_page.setdefault(page_key, []).append(span)
+
+    merged_spans = list(unplaced_spans)
+    for page_spans in spans_by_page.values():
+        page_spans.sort(key=lambda span: span['start'])
+        current = page_spans[0]
+        for span in page_spans[1:]:
+            offset = span['start'] - current['start']
+            overlap = len(current['text']) - offset
+            if overlap >= len(span['text']) and current['text'][offset:offset + len(span['text'])] == span['text']:
+                # The chunk lies entirely within the span already
+                pass
+            elif overlap >= 0 and current['text'][offset:] == span['text'][:overlap]:
+                # Overlapping (or exactly touching) chunks: keep the shared text once
+                current['text'] += span['text'][overlap:]
+            elif -max_merge_gap <= overlap < 0:
+                # Adjacent chunks separated by whitespace the splitter stripped; keep offsets aligned
+                current['text'] += ' ' * -overlap + span['text']
+            else:
+                merged_spans.append(current)
+                current = span
+                continue
+            current['rank'] = min(current['rank'], span['rank'])
+            current['chunk_count'] += span['chunk_count']
+        merged_spans.append(current)
+
+    return sorted(merged_spans, key=lambda span: span['rank'])
+
+def pack_documents(documents, token_budget, chars_per_token, max_merge_gap, min_piece_tokens):
+    """
+    Packs retrieved chunks into as few prompt tokens as possible.
+
+    Overlapping and adjacent chunks of the same page are merged, then the merged spans are
+    taken in relevance order until the token budget is spent; the span that does not fit
+    is trimmed to the remaining budget.
+
+    Parameters
+    ----------
+    documents : list of Document
+        Retrieved chunks, most relevant first.
+    token_budget : int
+        Maximum number of estimated tokens of context.
+    chars_per_token : float
+        Characters per token used to estimate token counts.
+    max_merge_gap : int
+        Chunks of the same page separated by at most this many characters are merged.
+    min_piece_tokens : int
+        A trimmed span shorter than this is dropped instead of included.
+
+    Returns
+    -------
+    tuple
+        `(packed_documents, tokens_before, tokens_after)`.
+    """
+    tokens_before = sum(estimate_tokens(document.page_content, chars_per_token) for document in documents)
+
+    packed_documents = []
+    tokens_left = token_budget
+    for span in merge_neighbouring_chunks(documents, max_merge_gap):
+        text = span['text']
+        span_tokens = estimate_tokens(text, chars_per_token)
+        if span_tokens > tokens_left:
+            if tokens_left < min_piece_tokens:
+                break
+            # Trim the span to the remaining budget, cutting at a word boundary
+            text = text[:int(tokens_left * chars_per_token)]
+            text = text[:text.rfind(' ')] if ' ' in text else text
+            span_tokens = estimate_tokens(text, chars_per_token)
+        tokens_left -= span_tokens
+        packed_documents.append(Document(page_content=text, metadata={**span['metadata'], 'merged_chunks': span['chunk_count']}))
+
+    return packed_documents, tokens_before, token_budget - tokens_left
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Retriever that packs another retriever's chunks into a token budget before they reach the prompt.
+
+    See `pack_documents` for how chunks are merged and trimmed. The tokens saved are logged per query.
+    """
+
+    retriever: Any
+    """The retriever whose chunks are packed."""
+    token_budget: int = 600
+    """Maximum number of estimated tokens of context."""
+    chars_per_token: float = 4.0
+    """Characters per token used to estimate token counts."""
+    max_merge_gap: int = 2
+    """Chunks of the same page separated by at most this many characters are merged."""
+    min_piece_tokens: int = 32
+    """A trimmed span shorter than this is dropped instead of included."""
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        documents = self.retriever.invoke(query, config={'callbacks': run_manager.get_child()} if run_manager else None)
+        with instrument('context_packer') as span:
+            packed_documents, tokens_before, tokens_after = pack_documents(
+                documents,
+                token_budget=self.token_budget,
+                chars_per_token=self.chars_per_token,
+                max_merge_gap=self.max_merge_gap,
+                min_piece_tokens=self.min_piece_tokens
+            )
+            span.add('chunks', len(documents))
+            span.add('prompt_tokens', tokens_after)
+            span.add('tokens_saved', tokens_before - tokens_after)
+        logger_for_context_packer.info(
+            'Context packed. chunks: %s -> %s, '
+            'tokens: %s -> %s (saved %s)',
+            len(documents), len(packed_documents), tokens_before, tokens_after, tokens_before - tokens_after
+        )
+        return packed_documents
+
+def build_context_packing_retriever(retriever):
+    """
+    Wraps a retriever so its chunks are packed into a token budget, when enabled in the config.
+
+    Parameters
+    ----------
+    retriever : BaseRetriever
+        The retriever whose chunks are packed.
+
+    Returns
+    -------
+    BaseRetriever
+        A ContextPackingRetriever, or the given retriever when `context_packing -> enabled` is false.
+    """
+    packing_config = get_config()['context_packing']
+    if not packing_config['enabled']:
+        return retriever
+    return ContextPackingRetriever(
+        retriever=retriever,
+        token_budget=int(packing_config['token_budget']),
+        chars_per_token=float(packing_config['chars_per_token']),
+        max_merge_gap=int(packing_config['max_merge_gap']),
+        min_piece_tokens=int(packing_config['min_piece_tokens'])
+    )
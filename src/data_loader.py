@@ -1,61 +1,369 @@
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+import glob
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain_core.documents import Document
 from src.logger import log_component_start, log_component_end, logger_for_loading_data
 from src.config_loader import get_config
+from src.metrics import instrument
 
-def data_loader():
+# File extensions the data loader knows how to parse
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf')
+
+class IngestLedger:
+    """
+    Small ledger of the (mtime, size) of every data file that made it into the vector store.
+
+    Files whose mtime and size match the ledger are skipped by `data_loader`, and the vector store
+    builder keeps their previously indexed chunks instead of deleting them. The ledger is only
+    written after the vector store has been updated successfully.
+
+    Parameters
+    ----------
+    ledger_path : str
+        Path of the JSON file the ledger is persisted to.
+    """
+
+    def __init__(self, ledger_path):
+        self.ledger_path = ledger_path
+        self.previous_entries = {}
+        self.current_entries = {}
+        self.unchanged_sources = set()
+        if os.path.exists(ledger_path):
+            with open(ledger_path, 'r', encoding='utf-8') as file:
+                self.previous_entries = json.load(file)
+
+    def check(self, data_file_path):
+        """
+        Records a file's current mtime and size and reports whether it is unchanged since the last ingest.
+
+        Parameters
+        ----------
+        data_file_path : str
+            Path of the data file.
+
+        Returns
+        -------
+        bool
+            True if the file was ingested before and has not changed since.
+        """
+        stat = os.stat(data_file_path)
+        entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+        self.current_entries[data_file_path] = entry
+        if self.previous_entries.get(data_file_path) == entry:
+            self.unchanged_sources.add(data_file_path)
+            return True
+        return False
+
+    def reset(self):
+        """
+        Forgets the previous ingest, so every file checked from now on is treated as changed.
+        """
+        self.previous_entries = {}
+        self.unchanged_sources.clear()
+
+    def save(self):
+        """
+        Atomically persists the entries recorded during this run; files no longer present are dropped.
+        """
+        ledger_directory = os.path.dirname(self.ledger_path)
+        if ledger_directory:
+            os.makedirs(ledger_directory, exist_ok=True)
+        temp_path = self.ledger_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.current_entries, file)
+        os.replace(temp_path, self.ledger_path)
+
+def resolve_data_files(data_file_path):
+    """
+    Expands a data path into the list of data files it refers to.
+
+    Parameters
+    ----------
+    data_file_path : str
+        A single file, a directory (crawled recursively) or a glob pattern (`**` is supported).
+
+    Returns
+    -------
+    list of str
+        Sorted paths of the supported (.txt/.pdf) files found.
     """
-    Loads data from a file (either .txt or .pdf) and returns it as a list of LangChain Document objects.
+    if os.path.isdir(data_file_path):
+        data_files = []
+        for directory, _, file_names in os.walk(data_file_path):
+            for file_name in file_names:
+                if file_name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    data_files.append(os.path.join(directory, file_name))
+        return sorted(data_files)
+
+    if glob.has_magic(data_file_path):
+        return sorted(
+            path for path in glob.glob(data_file_path, recursive=True)
+            if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS)
+        )
+
+    if not data_file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise ValueError(f'Unsupported data file type: {data_file_path}')
+    return [data_file_path]
+
+def bounded_map(executor, function, argument_tuples, window):
+    """
+    Maps a function over argument tuples in an executor, yielding results in submission order.
+
+    At most `window` calls are in flight at once, so results never pile up in memory
+    faster than the consumer takes them.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        The executor the calls are submitted to.
+    function : callable
+        The function to call.
+    argument_tuples : iterable of tuple
+        Positional arguments for each call.
+    window : int
+        Maximum number of outstanding calls.
+
+    Yields
+    ------
+    object
+        The result of each call, in submission order.
+    """
+    pending = deque()
+    for arguments in argument_tuples:
+        pending.append(executor.submit(function, *arguments))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def extract_pdf_pages(data_file_path, start_page, end_page):
+    """
+    Extracts a range of PDF pages as Document objects, one per page.
+
+    Parameters
+    ----------
+    data_file_path : str
+        Path to the PDF file.
+    start_page : int
+        Index of the first page to extract.
+    end_page : int
+        Index one past the last page to extract.
 
     Returns
     -------
     list
-        A list of Document objects representing the loaded data.
-        
+        A list of Document objects with `source`, `page`, `page_label` and `total_pages` metadata.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(data_file_path)
+    total_pages = len(reader.pages)
+    documents = []
+    for page_number in range(start_page, min(end_page, total_pages)):
+        documents.append(Document(
+            page_content=reader.pages[page_number].extract_text().strip(),
+            metadata={
+                "source": data_file_path,
+                "page": page_number,
+                "page_label": reader.page_labels[page_number],
+                "total_pages": total_pages
+            }
+        ))
+    return documents
+
+def stream_pdf_pages(data_file_path, pdf_workers, pages_per_task):
+    """
+    Lazily yields the pages of a PDF, optionally parsing page ranges in a process pool.
+
+    Parameters
+    ----------
+    data_file_path : str
+        Path to the PDF file.
+    pdf_workers : int
+        Number of worker processes. 0 or 1 parses the pages in the current process.
+    pages_per_task : int
+        Number of pages each worker task parses.
+
+    Yields
+    ------
+    Document
+        One Document per page, in page order.
+    """
+    from pypdf import PdfReader
+
+    total_pages = len(PdfReader(data_file_path).pages)
+    page_ranges = [
+        (data_file_path, start_page, start_page + pages_per_task)
+        for start_page in range(0, total_pages, pages_per_task)
+    ]
+
+    if pdf_workers <= 1:
+        for page_range in page_ranges:
+            yield from extract_pdf_pages(*page_range)
+        return
+
+    with ProcessPoolExecutor(max_workers=pdf_workers) as executor:
+        for documents in bounded_map(executor, extract_pdf_pages, page_ranges, window=pdf_workers * 2):
+            yield from documents
+
+def stream_text_windows(data_file_path, text_window_chars):
+    """
+    Lazily yields a text file as fixed-size windows, cut at line boundaries.
+
+    Parameters
+    ----------
+    data_file_path : str
+        Path to the text file.
+    text_window_chars : int
+        Approximate number of characters per window.
+
+    Yields
+    ------
+    Document
+        One Document per window of text, with the window's character offset in the file as `window_start`.
+    """
+    with open(data_file_path, "r", encoding="utf-8") as f:
+        carry = ''
+        window_start = 0
+        while True:
+            block = f.read(text_window_chars)
+            if not block:
+                break
+            text = carry + block
+
+            # Cut at the last line break (or space) so no word is split across windows
+            cut = text.rfind('\n')
+            if cut <= 0:
+                cut = text.rfind(' ')
+            if cut <= 0:
+                cut = len(text) - 1
+            carry = text[cut + 1:]
+            yield Document(page_content=text[:cut + 1], metadata={"source": data_file_path, "window_start": window_start})
+            window_start += cut + 1
+
+        if carry:
+            yield Document(page_content=carry, metadata={"source": data_file_path, "window_start": window_start})
+
+def stream_data_file(data_file_path, data_file_config):
+    """
+    Lazily yields the Documents of a single .txt or .pdf file.
+
+    Parameters
+    ----------
+    data_file_path : str
+        Path to the data file.
+    data_file_config : dict
+        The `data_file` section of the config.
+
+    Yields
+    ------
+    Document
+        Text windows of a .txt file, or pages of a .pdf file.
+    """
+    if data_file_path.lower().endswith(".txt"):
+        yield from stream_text_windows(data_file_path, text_window_chars=int(data_file_config['text_window_chars']))
+    else:
+        yield from stream_pdf_pages(
+            data_file_path,
+            pdf_workers=int(data_file_config['pdf_workers']),
+            pages_per_task=int(data_file_config['pages_per_task'])
+        )
+
+def load_data_file(data_file_path, data_file_config):
+    """
+    Loads all Documents of a single .txt or .pdf file; used by the file-level process pool.
+
+    Parameters
+    ----------
+    data_file_path : str
+        Path to the data file.
+    data_file_config : dict
+        The `data_file` section of the config.
+
+    Returns
+    -------
+    list
+        The Documents of the file.
+    """
+    return list(stream_data_file(data_file_path, {**data_file_config, 'pdf_workers': 0}))
+
+def data_loader(ingest_ledger=None, source_filter=None):
+    """
+    Lazily loads data from one or many .txt/.pdf files as a stream of LangChain Document objects.
+
+    Parameters
+    ----------
+    ingest_ledger : IngestLedger, optional
+        Ledger of previously ingested files. Files whose mtime and size are unchanged are skipped.
+    source_filter : callable, optional
+        Called with every data file path; only files it returns True for are loaded.
+
+    Yields
+    ------
+    Document
+        Document objects representing the loaded data, in file order.
+
     Notes
     -----
-    - The file path is retrieved from the configuration file under `data_file -> data_file_path`.
-    - Supports loading of `.txt` and `.pdf` files.
-    - For `.txt`, it reads the entire content as a single Document.
-    - For `.pdf`, it uses PyPDFLoader to load and split the document.
+    - The data path is retrieved from the configuration file under `data_file -> data_file_path`.
+      It may be a single file, a directory (crawled recursively) or a glob pattern.
+    - Supports loading of `.txt` and `.pdf` files; every Document carries its file path as `source`,
+      and PDF pages also carry their `page` number.
+    - For `.txt`, the file is read in windows of `data_file -> text_window_chars` characters.
+    - For `.pdf`, pages are yielded as they are parsed; with `data_file -> pdf_workers` above 1,
+      page ranges of `data_file -> pages_per_task` pages are parsed in a process pool.
+    - With several files to load and `data_file -> file_workers` above 1, whole files are parsed in a process pool.
+    - Nothing is read until the stream is consumed, so peak memory is bounded by what the consumer holds.
     - Logs the start, success, and any exceptions encountered during the data loading process.
+      Errors are re-raised, since silently truncating the stream would make the indexer drop chunks.
     """
     try:
         # Log start of the data loader component
         log_component_start(logger_for_loading_data, 'Data Loader Component')
 
-        # Load configuration and fetch the path to the data file
-        config = get_config()
-        data_file_path = config['data_file']['data_file_path']
+        with instrument('data_loader') as span:
+            # Load configuration and resolve the data path into data files
+            config = get_config()
+            data_file_config = config['data_file']
+            data_files = resolve_data_files(data_file_config['data_file_path'])
+            if source_filter is not None:
+                data_files = [path for path in data_files if source_filter(path)]
 
-        # Load text file and wrap content in a Document object
-        if data_file_path.endswith(".txt"):
-            logger_for_loading_data.info('Data is being loaded')
-            with open(data_file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            doc = Document(page_content=content, metadata={"source": "SEP_critical_thinking.txt"}) # change source depending on the .txt file used
-            loaded_data = [doc]
-            
-            # Log successful loading
-            logger_for_loading_data.info('Data successfully loaded from .txt file')
+            # Skip files that have not changed since the last ingest
+            if ingest_ledger is not None:
+                files_to_load = [path for path in data_files if not ingest_ledger.check(path)]
+            else:
+                files_to_load = data_files
+            span.add('files', len(files_to_load))
+            logger_for_loading_data.info(
+                'Data files found: %s, unchanged and skipped: %s', len(data_files), len(data_files) - len(files_to_load)
+            )
 
-        # Use PyPDFLoader for PDF files
-        elif data_file_path.endswith(".pdf"):
             logger_for_loading_data.info('Data is being loaded')
-            pdf_loader = PyPDFLoader(data_file_path)
-            loaded_data = pdf_loader.load()
+            file_workers = int(data_file_config['file_workers'])
+            if len(files_to_load) > 1 and file_workers > 1:
+                # Parse whole files in a process pool, keeping only a bounded number of files in flight
+                with ProcessPoolExecutor(max_workers=file_workers) as executor:
+                    file_arguments = [(path, data_file_config) for path in files_to_load]
+                    for documents in bounded_map(executor, load_data_file, file_arguments, window=file_workers * 2):
+                        span.add('documents', len(documents))
+                        yield from span.yielding(documents)
+            else:
+                for path in files_to_load:
+                    yield from span.yielding(stream_data_file(path, data_file_config), 'documents')
 
             # Log successful loading
-            logger_for_loading_data.info('Data successfully loaded from .pdf file')
-
-        # Log end of the data loader component
-        log_component_end(logger_for_loading_data, 'Data Loader Component')
+            logger_for_loading_data.info('Data successfully loaded from %s files', len(files_to_load))
 
-        return loaded_data
+            # Log end of the data loader component
+            log_component_end(logger_for_loading_data, 'Data Loader Component')
 
     except Exception as e:
         # Log any error encountered during data loading
-        logger_for_loading_data.debug(f'Error encountered in data loader component. error: {e}')
+        logger_for_loading_data.debug('Error encountered in data loader component. error: %s', e)
 
         # Ensure the component end is always logged
         log_component_end(logger_for_loading_data, 'Data Loader Component')
+        raise
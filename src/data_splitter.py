@@ -1,57 +1,324 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter, HTMLHeaderTextSplitter, RecursiveJsonSplitter
+import functools
+import os
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from langchain_core.documents import Document
 from src.logger import log_component_start, log_component_end, logger_for_data_splitter
 from src.config_loader import get_config
+from src.data_loader import bounded_map
+from src.metrics import instrument
 
-def data_splitter(loaded_data):
+def get_chunk_settings():
+    """
+    Returns the settings the chunks are split with.
+
+    Returns
+    -------
+    dict
+        `chunk_size`, `chunk_overlap`, `add_start_index`, `mode` and `tokenizer`. The vector store builder
+        records these in its manifest, so any change to them triggers a full rebuild.
     """
-    Splits input documents into smaller chunks using RecursiveCharacterTextSplitter.
+    splitter_config = get_config()['revursive_text_splitter']
+    tokenizer = splitter_config['tokenizer']
+    if tokenizer and not os.path.isabs(tokenizer):
+        # A tokenizer.json relative to the base directory, else a Hugging Face Hub name
+        tokenizer_path = os.path.join(get_config()['paths']['base_dir'], tokenizer)
+        tokenizer = tokenizer_path if os.path.isfile(tokenizer_path) else tokenizer
+    return {
+        'chunk_size': int(splitter_config['chunk_size']),
+        'chunk_overlap': int(splitter_config['chunk_overlap']),
+        'add_start_index': True,
+        'mode': splitter_config['mode'],
+        'tokenizer': tokenizer if splitter_config['mode'] == 'token' else ''
+    }
+
+@functools.lru_cache(maxsize=4)
+def get_text_splitter(chunk_size, chunk_overlap):
+    """
+    Returns a RecursiveCharacterTextSplitter, built once per process and settings.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+@functools.lru_cache(maxsize=4)
+def load_tokenizer(tokenizer):
+    """
+    Loads a fast (Rust) tokenizer from a tokenizer.json file or the Hugging Face Hub, once per process.
+    """
+    try:
+        from tokenizers import Tokenizer
+    except ImportError as e:
+        raise ImportError('Token-aware splitting needs the "tokenizers" package: pip install tokenizers') from e
+    if os.path.isfile(tokenizer):
+        return Tokenizer.from_file(tokenizer)
+    return Tokenizer.from_pretrained(tokenizer)
+
+def character_offsets(text, chunk_size, chunk_overlap):
+    """
+    Splits a text with RecursiveCharacterTextSplitter and locates every chunk in it.
+
+    Returns
+    -------
+    tuple
+        `(starts, ends, unlocated)`: the character span of every chunk, and the text of any chunk that
+        could not be found verbatim in `text` by its position (start -1), keyed by chunk number.
+    """
+    starts, ends, unlocated = [], [], {}
+    index = 0
+    previous_chunk_len = 0
+    for chunk in get_text_splitter(chunk_size, chunk_overlap).split_text(text):
+        # Same search as the splitter's own `add_start_index`, so offsets match `split_documents`
+        offset = index + previous_chunk_len - chunk_overlap
+        index = text.find(chunk, max(0, offset))
+        previous_chunk_len = len(chunk)
+        if index < 0:
+            unlocated[len(starts)] = chunk
+        starts.append(index)
+        ends.append(index + len(chunk) if index >= 0 else -1)
+    return starts, ends, unlocated
+
+def token_offsets(encoding, chunk_size, chunk_overlap):
+    """
+    Cuts a tokenized text into windows of `chunk_size` tokens overlapping by `chunk_overlap` tokens.
+
+    Returns
+    -------
+    tuple
+        `(starts, ends, unlocated)` as for `character_offsets`; every window maps back onto the text
+        through the tokenizer's character offsets, so nothing is unlocated.
+    """
+    offsets = [offset for offset in encoding.offsets if offset[1] > offset[0]]
+    starts, ends = [], []
+    step = chunk_size - chunk_overlap
+    for first in range(0, len(offsets), step):
+        window = offsets[first:first + chunk_size]
+        starts.append(window[0][0])
+        ends.append(window[-1][1])
+        if first + chunk_size >= len(offsets):
+            break
+    return starts, ends, {}
+
+def split_texts(texts, chunk_settings):
+    """
+    Splits a shard of page texts into chunk offsets; runs in the splitter's worker processes.
 
     Parameters
     ----------
-    loaded_data : list
-        A list of documents to be split. Each document should be a LangChain Document object or compatible with the splitter.
+    texts : list of str
+        The texts of the shard's pages.
+    chunk_settings : dict
+        As returned by `get_chunk_settings`.
 
     Returns
     -------
-    list
-        A list of smaller document chunks obtained after splitting the original input.
-        
+    list of tuple
+        `(starts, ends, unlocated)` per text. Only offsets travel back to the parent process, which
+        already holds the texts.
+    """
+    chunk_size = chunk_settings['chunk_size']
+    chunk_overlap = chunk_settings['chunk_overlap']
+    if chunk_settings['mode'] == 'token':
+        # One batched call into the Rust tokenizer for the whole shard
+        encodings = load_tokenizer(chunk_settings['tokenizer']).encode_batch(texts, add_special_tokens=False)
+        return [token_offsets(encoding, chunk_size, chunk_overlap) for encoding in encodings]
+    return [character_offsets(text, chunk_size, chunk_overlap) for text in texts]
+
+def make_chunk_id(metadata, start, chunk_number):
+    """
+    Returns a chunk's stable id, `<source>#<page>#<offset>`; pages of .txt files count as page 0.
+
+    Chunks without an offset use `~<chunk number>` instead, their position within the page.
+    """
+    offset = start if start >= 0 else f'~{chunk_number}'
+    return f"{metadata.get('source', '')}#{metadata.get('page', 0)}#{offset}"
+
+class ChunkColumns:
+    """
+    Chunks of a shard of pages, stored column-wise as offsets into the page texts.
+
+    A chunk is three integers (its page's row and its character span in the page) instead of a copied
+    string and metadata dictionary; its Document is only built when `documents` is iterated, right
+    before it is embedded.
+
+    Parameters
+    ----------
+    pages : list of Document
+        The shard's pages (PDF pages or .txt windows), as loaded.
+    offsets : list of tuple
+        `(starts, ends, unlocated)` per page, as returned by `split_texts`.
+    """
+
+    __slots__ = ('pages', 'page_rows', 'starts', 'ends', 'unlocated')
+
+    def __init__(self, pages, offsets):
+        self.pages = pages
+        self.page_rows = array('l')
+        self.starts = array('q')
+        self.ends = array('q')
+        # Text of the chunks that could not be located in their page, by row
+        self.unlocated = {}
+        for page_row, (starts, ends, unlocated) in enumerate(offsets):
+            for chunk_number, text in unlocated.items():
+                self.unlocated[len(self.starts) + chunk_number] = text
+            self.page_rows.extend([page_row] * len(starts))
+            self.starts.extend(starts)
+            self.ends.extend(ends)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def chunk_text(self, row):
+        """
+        Returns the text of the chunk in `row`.
+        """
+        if row in self.unlocated:
+            return self.unlocated[row]
+        return self.pages[self.page_rows[row]].page_content[self.starts[row]:self.ends[row]]
+
+    def documents(self):
+        """
+        Lazily builds the chunks' Documents, in page and offset order.
+
+        Yields
+        ------
+        Document
+            A chunk with its page's metadata, its `start_index` within the PDF page or .txt file and its
+            stable `chunk_id`.
+        """
+        chunk_number = 0
+        for row in range(len(self.starts)):
+            page = self.pages[self.page_rows[row]]
+            chunk_number = chunk_number + 1 if row and self.page_rows[row - 1] == self.page_rows[row] else 0
+            metadata = dict(page.metadata)
+            # Offsets of .txt windows are relative to the window; make them relative to the file
+            window_start = metadata.pop('window_start', 0)
+            start = self.starts[row] + window_start if self.starts[row] >= 0 else -1
+            metadata['start_index'] = start
+            metadata['chunk_id'] = make_chunk_id(metadata, start, chunk_number)
+            yield Document(page_content=self.chunk_text(row), metadata=metadata)
+
+def iterate_shards(loaded_data, documents_per_task):
+    """
+    Groups a document stream into lists of at most `documents_per_task` documents.
+    """
+    documents = iter(loaded_data)
+    while True:
+        shard = list(islice(documents, documents_per_task))
+        if not shard:
+            return
+        yield shard
+
+def split_into_columns(loaded_data, chunk_settings, split_workers, documents_per_task):
+    """
+    Splits a document stream shard by shard, optionally in a process pool.
+
+    Parameters
+    ----------
+    loaded_data : iterable
+        The documents to split.
+    chunk_settings : dict
+        As returned by `get_chunk_settings`.
+    split_workers : int
+        Number of worker processes. 0 or 1 splits in the current process.
+    documents_per_task : int
+        Number of documents per shard (and per worker task).
+
+    Yields
+    ------
+    ChunkColumns
+        The chunks of each shard, in input order.
+    """
+    shards = iterate_shards(loaded_data, documents_per_task)
+    if split_workers <= 1:
+        for shard in shards:
+            yield ChunkColumns(shard, split_texts([page.page_content for page in shard], chunk_settings))
+        return
+
+    # Shards are kept in submission order and matched with their offsets as the results arrive
+    pending_shards = deque()
+    def shard_tasks():
+        for shard in shards:
+            pending_shards.append(shard)
+            yield [page.page_content for page in shard], chunk_settings
+
+    with ProcessPoolExecutor(max_workers=split_workers) as executor:
+        for offsets in bounded_map(executor, split_texts, shard_tasks(), window=split_workers * 2):
+            yield ChunkColumns(pending_shards.popleft(), offsets)
+
+def data_splitter(loaded_data):
+    """
+    Lazily splits input documents into smaller chunks, by characters or by tokens.
+
+    Parameters
+    ----------
+    loaded_data : iterable
+        An iterable (typically the `data_loader` stream) of documents to be split. Each document should be a LangChain Document object or compatible with the splitter.
+
+    Yields
+    ------
+    Document
+        Smaller document chunks obtained after splitting the original input, in input order.
+
     Notes
     -----
     - Configuration for chunk size and chunk overlap is loaded from the application config.
-    - Uses LangChain's `RecursiveCharacterTextSplitter` for text segmentation.
+    - With `revursive_text_splitter -> mode` set to `character`, LangChain's `RecursiveCharacterTextSplitter`
+      is used for text segmentation and sizes are in characters. With `token`, sizes are in tokens of the
+      fast tokenizer `revursive_text_splitter -> tokenizer`, which encodes each shard in one batched call.
+    - Every page (or .txt window) is split independently. Documents are grouped into shards of
+      `revursive_text_splitter -> documents_per_task`; with `split_workers` above 1, shards are split in a
+      process pool that only sends chunk offsets back.
+    - Chunks are held as offsets into their page's text (see `ChunkColumns`) until they are consumed.
+    - Every chunk carries a `start_index` metadata: its character offset within the PDF page or the .txt file,
+      which the context packer uses to merge overlapping neighbours, and a stable `chunk_id` of the form
+      `<source>#<page>#<start_index>`.
+    - Documents are split one shard at a time as they arrive, so the whole corpus is never held in memory.
     - Logs the start and end of the component, and logs errors if any occur.
+      Errors are re-raised, since silently truncating the stream would make the indexer drop chunks.
     """
     try:
         # Log start of the data splitter component
         log_component_start(logger_for_data_splitter, 'Data Splitter Component')
 
-        # Load chunking configuration from config file
-        config = get_config()
-        chunk_size = config['revursive_text_splitter']['chunk_size']
-        chunk_overlap = config['revursive_text_splitter']['chunk_overlap']
+        with instrument('data_splitter') as span:
+            # Load chunking configuration from config file
+            splitter_config = get_config()['revursive_text_splitter']
+            chunk_settings = get_chunk_settings()
+            chunk_size = chunk_settings['chunk_size']
+            chunk_overlap = chunk_settings['chunk_overlap']
 
-        # Initialize text splitter with specified chunk size and overlap
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=int(chunk_size),
-            chunk_overlap=int(chunk_overlap)
-        )
+            # Log data splitting
+            logger_for_data_splitter.info(
+                'Data splitting started. mode: %s, chunk_size: %s and chunk_overlap: %s',
+                chunk_settings['mode'], chunk_size, chunk_overlap
+            )
 
-        # Log data splitting
-        logger_for_data_splitter.info(f'Data splitting started. chunk_size: {chunk_size} and chunk_overlap: {chunk_overlap}')
-        
-        # Perform the split operation
-        data_splits = splitter.split_documents(loaded_data)
+            # Split each shard as soon as it arrives from the stream
+            document_count = 0
+            chunk_count = 0
+            # The time spent loading the input is the data loader's, and is not counted here
+            for columns in split_into_columns(
+                span.excluding(loaded_data), chunk_settings,
+                split_workers=int(splitter_config['split_workers']),
+                documents_per_task=int(splitter_config['documents_per_task'])
+            ):
+                document_count += len(columns.pages)
+                chunk_count += len(columns)
+                yield from span.yielding(columns.documents())
 
-        # Log successful split
-        logger_for_data_splitter.info('Data split completed')
+            span.add('documents', document_count)
+            span.add('chunks', chunk_count)
 
-        # Log end of the data splitter component
-        log_component_end(logger_for_data_splitter, 'Data Splitter Component')
+            # Log successful split
+            logger_for_data_splitter.info('Data split completed. documents: %s, chunks: %s', document_count, chunk_count)
 
-        return data_splits
+            # Log end of the data splitter component
+            log_component_end(logger_for_data_splitter, 'Data Splitter Component')
 
     except Exception as e:
         # Log error if any exception is encountered
-        logger_for_data_splitter.debug(f'Error encounterd in data splitter component. error: {e}')
+        logger_for_data_splitter.debug('Error encounterd in data splitter component. error: %s', e)
         log_component_end(logger_for_data_splitter, 'Data Splitter Component')
+        raise
@@ -1,6 +1,111 @@
-from langchain_community.embeddings import OllamaEmbeddings
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 from src.logger import log_component_start, log_component_end, logger_for_embedder
 from src.config_loader import get_config
+from src.metrics import instrument
+from src.embedding_cache import CachedEmbeddings
+from src.model_clients import PooledOllamaEmbeddings
+
+def build_embedding_model(embedding_model):
+    """
+    Builds the Ollama embedding model, wrapped in the persistent embedding cache when it is enabled.
+
+    Requests go through the shared model client registry (`src.model_clients`), which pools keep-alive
+    connections, coalesces identical in-flight requests and limits concurrency per model.
+
+    Parameters
+    ----------
+    embedding_model : str
+        Name of the Ollama embedding model.
+
+    Returns
+    -------
+    Embeddings
+        A `PooledOllamaEmbeddings` instance, or a `CachedEmbeddings` wrapper around it.
+    """
+    config = get_config()
+    ollama_embedding = PooledOllamaEmbeddings(model=embedding_model)
+
+    cache_config = config['embedding_cache']
+    if not cache_config['enabled']:
+        return ollama_embedding
+
+    logger_for_embedder.info('Embedding cache enabled at: %s', cache_config['cache_path'])
+    return CachedEmbeddings(
+        embedding=ollama_embedding,
+        model_name=embedding_model,
+        cache_path=cache_config['cache_path'],
+        max_entries=cache_config['max_entries']
+    )
+
+def _embed_batch_with_retry(embedding, texts, as_queries, max_retries, retry_backoff_seconds):
+    # Retry transient embedding server failures with exponential backoff
+    for attempt in range(max_retries + 1):
+        try:
+            if as_queries:
+                return [embedding.embed_query(text) for text in texts]
+            return embedding.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff_seconds * (2 ** attempt)
+            logger_for_embedder.warning('Embedding batch failed (attempt %s), retrying in %.2fs. error: %s', attempt + 1, delay, e)
+            time.sleep(delay)
+
+def embed_in_batches(texts, embedding, as_queries=False):
+    """
+    Embeds texts concurrently in fixed-size batches and collects the vectors into one matrix.
+
+    Parameters
+    ----------
+    texts : list of str
+        Texts to embed, typically the page contents of the data splits.
+    embedding : Embeddings
+        The embedding model used for every batch.
+    as_queries : bool, optional
+        Embed the texts as search queries (`embed_query`) instead of documents. Defaults to False.
+
+    Returns
+    -------
+    numpy.ndarray
+        A float32 matrix of shape (len(texts), embedding_dim), row i holding the vector of texts[i].
+
+    Notes
+    -----
+    - Batch size, worker count and retry policy are read from `embedding_batching` in the config.
+    - Batches are sent through a bounded thread pool so the embedding server sees several requests at once.
+    - Failed batches are retried with exponential backoff; the last failure is re-raised.
+    """
+    batching_config = get_config()['embedding_batching']
+    batch_size = int(batching_config['batch_size'])
+    max_workers = int(batching_config['max_workers'])
+    max_retries = int(batching_config['max_retries'])
+    retry_backoff_seconds = float(batching_config['retry_backoff_seconds'])
+
+    texts = list(texts)
+    vectors = None
+    with instrument('embed_in_batches') as span, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_embed_batch_with_retry, embedding, texts[start:start + batch_size], as_queries, max_retries, retry_backoff_seconds): start
+            for start in range(0, len(texts), batch_size)
+        }
+        for future in as_completed(futures):
+            start = futures[future]
+            batch_vectors = np.asarray(future.result(), dtype=np.float32)
+
+            # Preallocate the result matrix once the embedding dimension is known
+            if vectors is None:
+                vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[start:start + len(batch_vectors)] = batch_vectors
+        span.add('texts', len(texts))
+        span.add('batches', len(futures))
+
+    if vectors is None:
+        return np.empty((0, 0), dtype=np.float32)
+
+    logger_for_embedder.info('Embedded %s texts in batches of %s using %s workers', len(texts), batch_size, max_workers)
+    return vectors
 
 def embedder(data_splits):
     """
@@ -15,7 +120,7 @@ def embedder(data_splits):
     -------
     tuple
         A tuple containing:
-        - ollama_embedding (OllamaEmbeddings): The initialized embedding model.
+        - ollama_embedding (Embeddings): The initialized embedding model, possibly wrapped in the embedding cache.
         - data_splits (list): The original list of documents passed into the function.
 
     Notes:
@@ -34,26 +139,27 @@ def embedder(data_splits):
         # Start logging for the Embedder component
         log_component_start(logger_for_embedder, 'Embedder Component')
 
-        # Load configuration to fetch the embedding model name
-        config = get_config()
-        embedding_model = config['ollama_embedding']['embedding_model']
+        with instrument('embedder'):
+            # Load configuration to fetch the embedding model name
+            config = get_config()
+            embedding_model = config['ollama_embedding']['embedding_model']
 
-        # Log the embedding model being used
-        logger_for_embedder.info(f'Embedding model in use: {embedding_model}')
+            # Log the embedding model being used
+            logger_for_embedder.info('Embedding model in use: %s', embedding_model)
 
-        # Initialize the Ollama embedding model using the model name from config
-        ollama_embedding = OllamaEmbeddings(model=embedding_model)
+            # Initialize the Ollama embedding model (behind the embedding cache, if enabled)
+            ollama_embedding = build_embedding_model(embedding_model)
 
-        # Confirm embedder object is ready to be passed forward
-        logger_for_embedder.info('Ollama embedder object passed to next component')
+            # Confirm embedder object is ready to be passed forward
+            logger_for_embedder.info('Ollama embedder object passed to next component')
 
-        # End logging for the Embedder component
-        log_component_end(logger_for_embedder, 'Embedder Component')
+            # End logging for the Embedder component
+            log_component_end(logger_for_embedder, 'Embedder Component')
 
-        # Return both the embedder and original data splits for downstream use
-        return ollama_embedding, data_splits
+            # Return both the embedder and original data splits for downstream use
+            return ollama_embedding, data_splits
     
     except Exception as e:
         # Log any exceptions encountered during initialization
-        logger_for_embedder.debug(f'Error encountered in embedder component. error: {e}')
+        logger_for_embedder.debug('Error encountered in embedder component. error: %s', e)
         log_component_end(logger_for_embedder, 'Embedder Component')
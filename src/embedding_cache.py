@@ -0,0 +1,188 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from langchain_core.embeddings import Embeddings
+from src.logger import logger_for_embedding_cache
+
+# SQLite caps the number of bound parameters per statement, so lookups are chunked
+SQLITE_LOOKUP_BATCH_SIZE = 500
+
+class CachedEmbeddings(Embeddings):
+    """
+    Drop-in LangChain `Embeddings` wrapper that persists vectors in a SQLite cache.
+
+    Vectors are keyed by (embedding model, text hash), so identical text is only embedded once
+    across pipeline runs, vector store backends and app sessions. The cache is bounded by
+    `max_entries` and evicts the least recently used vectors first.
+
+    Parameters
+    ----------
+    embedding : Embeddings
+        The underlying embedding model (e.g. PooledOllamaEmbeddings) used on cache misses.
+    model_name : str
+        Name of the embedding model, part of the cache key.
+    cache_path : str
+        Path of the SQLite file the vectors are stored in.
+    max_entries : int
+        Maximum number of vectors kept in the cache before LRU eviction kicks in.
+    """
+
+    def __init__(self, embedding, model_name, cache_path, max_entries):
+        self.embedding = embedding
+        self.model = model_name
+        self.cache_path = cache_path
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        cache_directory = os.path.dirname(cache_path)
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL, '
+            'PRIMARY KEY (model, text_hash))'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)')
+        self._connection.commit()
+        self._entry_count = self._connection.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    @staticmethod
+    def _text_hash(kind, text):
+        # Documents and queries are embedded with different instructions, so they never share a key
+        return hashlib.sha256(f'{kind}\x00{text}'.encode('utf-8')).hexdigest()
+
+    def _lookup(self, text_hashes):
+        found = {}
+        for start in range(0, len(text_hashes), SQLITE_LOOKUP_BATCH_SIZE):
+            batch = text_hashes[start:start + SQLITE_LOOKUP_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._connection.execute(
+                f'SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})',
+                [self.model, *batch]
+            ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = array('f', blob).tolist()
+        return found
+
+    def _touch(self, text_hashes, now):
+        self._connection.executemany(
+            'UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?',
+            [(now, self.model, text_hash) for text_hash in text_hashes]
+        )
+
+    def _store(self, entries, now):
+        cursor = self._connection.executemany(
+            'INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)',
+            [(self.model, text_hash, array('f', vector).tobytes(), now) for text_hash, vector in entries]
+        )
+        self._entry_count += max(cursor.rowcount, 0)
+
+    def _evict(self):
+        overflow = self._entry_count - self.max_entries
+        if overflow <= 0:
+            return
+        self._connection.execute(
+            'DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)',
+            (overflow,)
+        )
+        self._entry_count = self._connection.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        logger_for_embedding_cache.debug('Evicted %s least recently used embeddings from the cache', overflow)
+
+    def _embed(self, texts, kind, embed_function):
+        text_hashes = [self._text_hash(kind, text) for text in texts]
+
+        with self._lock:
+            cached = self._lookup(list(set(text_hashes)))
+
+        # Embed every distinct missing text once
+        missing = {}
+        for text, text_hash in zip(texts, text_hashes):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        new_vectors = {}
+        if missing:
+            # Round-trip through float32 so a vector looks the same whether it came from the cache or not
+            for text_hash, vector in zip(missing, embed_function(list(missing.values()))):
+                new_vectors[text_hash] = array('f', vector).tolist()
+
+        with self._lock:
+            now = time.time()
+            self.hits += len(texts) - sum(1 for text_hash in text_hashes if text_hash in missing)
+            self.misses += sum(1 for text_hash in text_hashes if text_hash in missing)
+            if cached:
+                self._touch(list(cached), now)
+            if new_vectors:
+                self._store(new_vectors.items(), now)
+                self._evict()
+            self._connection.commit()
+
+        return [cached[text_hash] if text_hash in cached else new_vectors[text_hash] for text_hash in text_hashes]
+
+    def embed_documents(self, texts):
+        """
+        Embeds a list of documents, serving previously seen texts from the cache.
+
+        Parameters
+        ----------
+        texts : list of str
+            Texts to embed.
+
+        Returns
+        -------
+        list of list of float
+            One embedding vector per input text.
+        """
+        return self._embed(list(texts), 'document', self.embedding.embed_documents)
+
+    def embed_query(self, text):
+        """
+        Embeds a single query, serving previously seen queries from the cache.
+
+        Parameters
+        ----------
+        text : str
+            The query text.
+
+        Returns
+        -------
+        list of float
+            The query embedding vector.
+        """
+        return self._embed([text], 'query', lambda missing: [self.embedding.embed_query(missing[0])])[0]
+
+    def stats(self):
+        """
+        Returns the cache's hit/miss counters.
+
+        Returns
+        -------
+        dict
+            Hits, misses, hit rate and the number of vectors currently stored.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': self._entry_count
+            }
+
+    def log_stats(self):
+        """
+        Logs the cache's hit/miss counters.
+        """
+        stats = self.stats()
+        logger_for_embedding_cache.info(
+            'Embedding cache hits: %s, misses: %s, '
+            'hit rate: %.2f%%, entries: %s',
+            stats['hits'], stats['misses'], stats['hit_rate'] * 100, stats['entries']
+        )
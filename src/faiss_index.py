@@ -0,0 +1,202 @@
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from src.logger import logger_for_vectordb_builder
+
+# FAISS index types selectable under `faiss_index -> index_type`
+FAISS_INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivf_pq', 'ivf_sq8', 'hnsw_sq8')
+
+# Settings that shape a built index; changing any of them requires a rebuild
+FAISS_BUILD_SETTINGS = ('index_type', 'nlist', 'pq_m', 'pq_nbits', 'hnsw_m', 'ef_construction')
+
+# Minimum number of training vectors per IVF centroid FAISS asks for
+MIN_POINTS_PER_CENTROID = 39
+
+def get_faiss_build_settings(index_config):
+    """
+    Returns the part of the `faiss_index` config that determines how the index is built.
+
+    Parameters
+    ----------
+    index_config : dict
+        The `faiss_index` section of the config.
+
+    Returns
+    -------
+    dict
+        The build settings; query-time knobs (nprobe, efSearch) are left out.
+    """
+    return {setting: index_config[setting] for setting in FAISS_BUILD_SETTINGS}
+
+def faiss_index_requires_training(index_config):
+    """
+    Tells whether the configured index type has centroids or codebooks to train before vectors are added.
+    """
+    return index_config['index_type'] in ('ivf', 'ivf_pq', 'ivf_sq8', 'hnsw_sq8')
+
+def build_index_factory_string(index_config, training_count):
+    """
+    Translates the `faiss_index` config into a `faiss.index_factory` description.
+
+    Parameters
+    ----------
+    index_config : dict
+        The `faiss_index` section of the config.
+    training_count : int
+        Number of vectors available to train the index on.
+
+    Returns
+    -------
+    str
+        The index factory description, e.g. 'IVF1024,PQ64x8'.
+    """
+    index_type = index_config['index_type']
+    if index_type not in FAISS_INDEX_TYPES:
+        raise ValueError(f'Unsupported faiss index type: {index_type}')
+
+    # Too few training vectors for the configured number of centroids makes FAISS fail, so use fewer
+    nlist = int(index_config['nlist'])
+    if index_type.startswith('ivf') and training_count < nlist * MIN_POINTS_PER_CENTROID:
+        nlist = max(1, min(nlist, training_count // MIN_POINTS_PER_CENTROID))
+        logger_for_vectordb_builder.info('Only %s training vectors available, using %s IVF centroids', training_count, nlist)
+
+    # A product quantizer needs at least one training vector per codebook entry
+    if index_type == 'ivf_pq' and training_count < 2 ** int(index_config['pq_nbits']):
+        logger_for_vectordb_builder.info(
+            'Only %s training vectors available, too few to train a product quantizer; using a flat index', training_count
+        )
+        return 'Flat'
+
+    hnsw_m = int(index_config['hnsw_m'])
+    return {
+        'flat': 'Flat',
+        'ivf': f'IVF{nlist},Flat',
+        'hnsw': f'HNSW{hnsw_m},Flat',
+        'ivf_pq': f"IVF{nlist},PQ{int(index_config['pq_m'])}x{int(index_config['pq_nbits'])}",
+        'ivf_sq8': f'IVF{nlist},SQ8',
+        'hnsw_sq8': f'HNSW{hnsw_m}_SQ8'
+    }[index_type]
+
+def create_faiss_index(training_vectors, index_config):
+    """
+    Creates an empty FAISS index of the configured type, trained on the given vectors.
+
+    Parameters
+    ----------
+    training_vectors : numpy.ndarray
+        A float32 matrix the centroids/codebooks are trained on; its width sets the index dimension.
+    index_config : dict
+        The `faiss_index` section of the config.
+
+    Returns
+    -------
+    faiss.Index
+        The trained, empty index with the configured search parameters applied.
+    """
+    training_vectors = np.ascontiguousarray(training_vectors, dtype=np.float32)
+    factory_string = build_index_factory_string(index_config, len(training_vectors))
+    index = faiss.index_factory(training_vectors.shape[1], factory_string)
+
+    hnsw_index = faiss.downcast_index(index)
+    if hasattr(hnsw_index, 'hnsw'):
+        hnsw_index.hnsw.efConstruction = int(index_config['ef_construction'])
+
+    if not index.is_trained:
+        sample_size = min(len(training_vectors), int(index_config['training_sample_size']))
+        index.train(training_vectors[:sample_size])
+        logger_for_vectordb_builder.info('Trained faiss index %s on %s vectors', factory_string, sample_size)
+
+    apply_faiss_search_parameters(index, index_config)
+    return index
+
+def apply_faiss_search_parameters(index, index_config):
+    """
+    Sets the query-time knobs of a FAISS index: nprobe for IVF indexes and efSearch for HNSW indexes.
+
+    Parameters
+    ----------
+    index : faiss.Index
+        The index to tune; flat indexes are left untouched.
+    index_config : dict
+        The `faiss_index` section of the config.
+    """
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None:
+        ivf_index.nprobe = int(index_config['nprobe'])
+
+    hnsw_index = faiss.downcast_index(index)
+    if hasattr(hnsw_index, 'hnsw'):
+        hnsw_index.hnsw.efSearch = int(index_config['ef_search'])
+
+def create_faiss_store(embedder, texts, vectors, metadatas, ids, index_config):
+    """
+    Creates a LangChain FAISS store on an index of the configured type.
+
+    Parameters
+    ----------
+    embedder : Embeddings
+        The embedding model used to embed queries.
+    texts : list of str
+        The chunk texts.
+    vectors : numpy.ndarray
+        The chunk embeddings; they also train the index.
+    metadatas : list of dict
+        Metadata per chunk.
+    ids : list of str
+        Ids per chunk.
+    index_config : dict
+        The `faiss_index` section of the config.
+
+    Returns
+    -------
+    FAISS
+        The store holding the chunks.
+    """
+    vector_db = FAISS(
+        embedding_function=embedder,
+        index=create_faiss_index(vectors, index_config),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    vector_db.add_embeddings(text_embeddings=zip(texts, vectors), metadatas=metadatas, ids=ids)
+    return vector_db
+
+def delete_from_faiss_store(vector_db, ids, index_config):
+    """
+    Deletes chunks from a FAISS store, rebuilding HNSW graphs, which cannot drop vectors in place.
+
+    Parameters
+    ----------
+    vector_db : FAISS
+        The store to delete from.
+    ids : list of str
+        Ids of the chunks to delete.
+    index_config : dict
+        The `faiss_index` section of the config.
+
+    Returns
+    -------
+    FAISS
+        The store without the deleted chunks.
+    """
+    if not hasattr(faiss.downcast_index(vector_db.index), 'hnsw'):
+        vector_db.delete(ids=ids)
+        return vector_db
+
+    doomed = set(ids)
+    kept = [(position, chunk_id) for position, chunk_id in sorted(vector_db.index_to_docstore_id.items()) if chunk_id not in doomed]
+    logger_for_vectordb_builder.info('Rebuilding the HNSW graph from %s remaining vectors', len(kept))
+
+    index = vector_db.index
+    if kept:
+        vectors = np.vstack([index.reconstruct(position) for position, _ in kept])
+        index = create_faiss_index(vectors, index_config)
+        index.add(vectors)
+    else:
+        index.reset()
+
+    vector_db.docstore.delete(list(doomed))
+    vector_db.index = index
+    vector_db.index_to_docstore_id = {position: chunk_id for position, (_, chunk_id) in enumerate(kept)}
+    return vector_db
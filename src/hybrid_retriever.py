@@ -0,0 +1,360 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from src.vectordb_builder import (
+    get_persist_directory, read_index_version, is_published_snapshot, iterate_stored_chunks, get_documents_by_ids,
+    search_by_vectors
+)
+from src.config_loader import get_config
+from src.metrics import instrument
+from src.logger import logger_for_hybrid_retriever
+
+# Name of the directory the BM25 index is persisted to, inside the vector store's persist directory
+SPARSE_INDEX_DIRECTORY_NAME = "bm25_index"
+
+# Files a persisted BM25Index consists of
+TERMS_FILE_NAME = "terms.json"
+TERM_OFFSETS_FILE_NAME = "term_offsets.npy"
+POSTINGS_FILE_NAME = "postings.npy"
+WEIGHTS_FILE_NAME = "weights.npy"
+CHUNK_IDS_FILE_NAME = "chunk_ids.npy"
+SPARSE_INDEX_INFO_FILE_NAME = "index_info.json"
+
+# Words and numbers; everything else separates tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """
+    Splits text into lowercase word and number tokens for keyword search.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    Compact, read-only inverted index scoring chunks with BM25.
+
+    Postings are stored term by term in flat NumPy arrays: `term_offsets` locates each term's
+    slice of `postings` (chunk positions) and `weights` (the term's precomputed BM25 contribution
+    to that chunk). A query therefore only gathers the postings of its own terms and sums them,
+    without touching chunks that share no term with it. The arrays are memory-mapped on load.
+
+    Parameters
+    ----------
+    terms : list of str
+        The vocabulary, in the order of `term_offsets`.
+    term_offsets : numpy.ndarray
+        Start of each term's postings, plus the total postings count at the end.
+    postings : numpy.ndarray
+        Chunk positions, grouped by term.
+    weights : numpy.ndarray
+        BM25 weight of each posting.
+    chunk_ids : numpy.ndarray
+        Chunk id of each chunk position, as bytes.
+    """
+
+    def __init__(self, terms, term_offsets, postings, weights, chunk_ids):
+        self.term_rows = {term: row for row, term in enumerate(terms)}
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.postings = postings
+        self.weights = weights
+        self.chunk_ids = chunk_ids
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, chunks, k1, b):
+        """
+        Builds the index from chunk texts.
+
+        Parameters
+        ----------
+        chunks : iterable of (str, str)
+            `(chunk_id, text)` of each chunk.
+        k1 : float
+            BM25 term frequency saturation.
+        b : float
+            BM25 document length normalization.
+
+        Returns
+        -------
+        BM25Index
+            The index over the chunks.
+        """
+        chunk_ids = []
+        chunk_lengths = []
+        term_postings = defaultdict(list)
+        for position, (chunk_id, text) in enumerate(chunks):
+            term_counts = Counter(tokenize(text))
+            chunk_ids.append(chunk_id.encode('utf-8'))
+            chunk_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                term_postings[term].append((position, count))
+
+        chunk_count = len(chunk_ids)
+        chunk_lengths = np.asarray(chunk_lengths, dtype=np.float32)
+        average_length = float(chunk_lengths.mean()) if chunk_count else 0.0
+        length_norms = k1 * (1 - b + b * chunk_lengths / average_length) if average_length else chunk_lengths
+
+        terms = sorted(term_postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings = []
+        weights = []
+        for row, term in enumerate(terms):
+            positions, counts = zip(*term_postings[term])
+            positions = np.asarray(positions, dtype=np.int32)
+            counts = np.asarray(counts, dtype=np.float32)
+            idf = math.log(1 + (chunk_count - len(positions) + 0.5) / (len(positions) + 0.5))
+            postings.append(positions)
+            weights.append((idf * counts * (k1 + 1) / (counts + length_norms[positions])).astype(np.float32))
+            term_offsets[row + 1] = term_offsets[row] + len(positions)
+
+        return cls(
+            terms=terms,
+            term_offsets=term_offsets,
+            postings=np.concatenate(postings) if postings else np.empty(0, dtype=np.int32),
+            weights=np.concatenate(weights) if weights else np.empty(0, dtype=np.float32),
+            chunk_ids=np.array(chunk_ids, dtype='S') if chunk_ids else np.empty(0, dtype='S1')
+        )
+
+    def search(self, query, k):
+        """
+        Returns the chunks with the highest BM25 scores for a query.
+
+        Parameters
+        ----------
+        query : str
+            The query text.
+        k : int
+            Maximum number of chunks to return.
+
+        Returns
+        -------
+        list of tuple
+            `(chunk_id, score)` pairs, best match first; chunks sharing no term with the query are left out.
+        """
+        rows = [self.term_rows[term] for term in set(tokenize(query)) if term in self.term_rows]
+        if not rows:
+            return []
+
+        positions = np.concatenate([self.postings[self.term_offsets[row]:self.term_offsets[row + 1]] for row in rows])
+        weights = np.concatenate([self.weights[self.term_offsets[row]:self.term_offsets[row + 1]] for row in rows])
+
+        # Sum the weights per chunk, over only the chunks the query's terms occur in
+        matched, inverse = np.unique(positions, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+
+        k = min(k, len(matched))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[matched[position]].decode('utf-8'), float(scores[position])) for position in top]
+
+    def save(self, folder_path, index_info):
+        """
+        Writes the index to `folder_path`.
+
+        Parameters
+        ----------
+        folder_path : str
+            Directory the index is persisted to.
+        index_info : dict
+            Build details stored alongside, such as the vector store version it was built from.
+        """
+        os.makedirs(folder_path, exist_ok=True)
+        arrays = {
+            TERM_OFFSETS_FILE_NAME: self.term_offsets,
+            POSTINGS_FILE_NAME: self.postings,
+            WEIGHTS_FILE_NAME: self.weights,
+            CHUNK_IDS_FILE_NAME: self.chunk_ids
+        }
+        for file_name, array in arrays.items():
+            with open(os.path.join(folder_path, file_name + '.tmp'), 'wb') as file:
+                np.save(file, array)
+        with open(os.path.join(folder_path, TERMS_FILE_NAME + '.tmp'), 'w', encoding='utf-8') as file:
+            json.dump(self.terms, file)
+        for file_name in [*arrays, TERMS_FILE_NAME]:
+            os.replace(os.path.join(folder_path, file_name + '.tmp'), os.path.join(folder_path, file_name))
+
+        # The info file is written last, so an index is only considered current once it is complete
+        with open(os.path.join(folder_path, SPARSE_INDEX_INFO_FILE_NAME), 'w', encoding='utf-8') as file:
+            json.dump(index_info, file)
+
+    @classmethod
+    def load(cls, folder_path):
+        """
+        Loads a persisted index, memory-mapping its arrays.
+
+        Parameters
+        ----------
+        folder_path : str
+            Directory the index was persisted to.
+
+        Returns
+        -------
+        BM25Index
+            The loaded index.
+        """
+        with open(os.path.join(folder_path, TERMS_FILE_NAME), 'r', encoding='utf-8') as file:
+            terms = json.load(file)
+        return cls(
+            terms=terms,
+            term_offsets=np.load(os.path.join(folder_path, TERM_OFFSETS_FILE_NAME), mmap_mode='r'),
+            postings=np.load(os.path.join(folder_path, POSTINGS_FILE_NAME), mmap_mode='r'),
+            weights=np.load(os.path.join(folder_path, WEIGHTS_FILE_NAME), mmap_mode='r'),
+            chunk_ids=np.load(os.path.join(folder_path, CHUNK_IDS_FILE_NAME), mmap_mode='r')
+        )
+
+    @staticmethod
+    def load_info(folder_path):
+        """
+        Returns the build details of a persisted index, or None if there is no complete index.
+        """
+        info_path = os.path.join(folder_path, SPARSE_INDEX_INFO_FILE_NAME)
+        if not os.path.exists(info_path):
+            return None
+        with open(info_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing dense vector search with BM25 keyword search by reciprocal rank fusion.
+
+    Both searches return `fetch_k` candidates; every candidate scores `1 / (rrf_k + rank)` per list
+    it appears in, and the `k` best fused chunks are returned. Exact section names and terms are
+    thus found by BM25 even when their embedding is not among the nearest neighbours.
+    """
+
+    vectorstore: VectorStore
+    """The vector store searched for dense candidates and holding the chunk texts."""
+    sparse_index: Any
+    """The BM25Index searched for keyword candidates."""
+    k: int = 4
+    """Number of fused chunks returned."""
+    fetch_k: int = 20
+    """Number of candidates taken from each search."""
+    rrf_k: int = 60
+    """Rank offset of reciprocal rank fusion; larger values flatten the rank weights."""
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with instrument('hybrid_retriever') as span:
+            query_vector = np.asarray([self.vectorstore.embeddings.embed_query(query)], dtype=np.float32)
+            dense_hits = search_by_vectors(self.vectorstore, query_vector, self.fetch_k)[0]
+            sparse_hits = self.sparse_index.search(query, self.fetch_k)
+
+            fused_scores = defaultdict(float)
+            for ranked_ids in ([chunk_id for chunk_id, _ in dense_hits], [chunk_id for chunk_id, _ in sparse_hits]):
+                for rank, chunk_id in enumerate(ranked_ids, start=1):
+                    fused_scores[chunk_id] += 1 / (self.rrf_k + rank)
+            top_ids = sorted(fused_scores, key=fused_scores.get, reverse=True)[:self.k]
+            span.add('candidates', len(fused_scores))
+
+            # Dense hits come with their Documents; keyword-only hits are looked up in the vector store
+            documents = dict(dense_hits)
+            documents.update(get_documents_by_ids(self.vectorstore, [chunk_id for chunk_id in top_ids if chunk_id not in documents]))
+            return [documents[chunk_id] for chunk_id in top_ids if chunk_id in documents]
+
+def get_sparse_index_info(persist_directory):
+    """
+    Returns the build details a BM25 index over the store in a persist directory must have to be reused.
+    """
+    hybrid_config = get_config()['hybrid_retrieval']
+    return {
+        'index_version': read_index_version(persist_directory),
+        'bm25_k1': float(hybrid_config['bm25_k1']),
+        'bm25_b': float(hybrid_config['bm25_b'])
+    }
+
+def is_sparse_index_current(persist_directory):
+    """
+    Tells whether the BM25 index persisted in a directory can be reused as is, see `load_sparse_index`.
+    """
+    folder_path = os.path.join(persist_directory, SPARSE_INDEX_DIRECTORY_NAME)
+    return BM25Index.load_info(folder_path) == get_sparse_index_info(persist_directory)
+
+def load_sparse_index(vector_db, vector_storedb, persist_directory=None):
+    """
+    Loads the BM25 index persisted next to a vector store, rebuilding it first if the store changed.
+
+    Parameters
+    ----------
+    vector_db : VectorStore
+        The vector store whose chunks are indexed.
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    persist_directory : str, optional
+        Directory `vector_db` was opened from; defaults to `get_persist_directory`.
+
+    Returns
+    -------
+    BM25Index
+        The index over the vector store's current chunks.
+
+    Notes
+    -----
+    An index rebuilt over a published snapshot (e.g. after a hot reload of the BM25 parameters) is kept
+    in memory only, since published snapshots are never modified and other processes may be reading them.
+    """
+    persist_directory = persist_directory or get_persist_directory(vector_storedb)
+    folder_path = os.path.join(persist_directory, SPARSE_INDEX_DIRECTORY_NAME)
+    index_info = get_sparse_index_info(persist_directory)
+
+    if BM25Index.load_info(folder_path) == index_info:
+        return BM25Index.load(folder_path)
+
+    sparse_index = BM25Index.build(
+        iterate_stored_chunks(vector_db), k1=index_info['bm25_k1'], b=index_info['bm25_b']
+    )
+    logger_for_hybrid_retriever.info(
+        'BM25 index built over %s chunks with %s terms', len(sparse_index), len(sparse_index.terms)
+    )
+    if is_published_snapshot(persist_directory):
+        logger_for_hybrid_retriever.info('BM25 index kept in memory, since %s is a published snapshot', persist_directory)
+        return sparse_index
+    sparse_index.save(folder_path, index_info)
+    return BM25Index.load(folder_path)
+
+def build_hybrid_retriever(retriever, vector_storedb, persist_directory=None):
+    """
+    Wraps a vector store retriever into a hybrid BM25 + dense retriever when enabled in the config.
+
+    Parameters
+    ----------
+    retriever : VectorStoreRetriever
+        The dense retriever returned by `create_vector_store_db` or `load_vectorstore_retriever`.
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    persist_directory : str, optional
+        Directory the vector store was opened from; defaults to `get_persist_directory`.
+
+    Returns
+    -------
+    BaseRetriever
+        A HybridRetriever over the same vector store, or the given retriever when
+        `hybrid_retrieval -> enabled` is false.
+
+    Notes
+    -----
+    - The BM25 index is persisted in `bm25_index/` next to the vector store and rebuilt only when
+      the vector store's version or the BM25 parameters changed; see `load_sparse_index`.
+    - The hybrid retriever keeps the dense retriever's `vectorstore` attribute, so batch mode still works.
+    """
+    hybrid_config = get_config()['hybrid_retrieval']
+    if not hybrid_config['enabled']:
+        return retriever
+
+    sparse_index = load_sparse_index(retriever.vectorstore, vector_storedb, persist_directory)
+    logger_for_hybrid_retriever.info('Hybrid BM25 + dense retriever ready')
+    return HybridRetriever(
+        vectorstore=retriever.vectorstore,
+        sparse_index=sparse_index,
+        k=int(hybrid_config['k']),
+        fetch_k=int(hybrid_config['fetch_k']),
+        rrf_k=int(hybrid_config['rrf_k'])
+    )
@@ -0,0 +1,143 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from src.config_loader import get_config
+from src.logger import log_component_start, log_component_end, logger_for_import_profile
+
+# Root of the project, the working directory the profiled imports run in
+PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy backends that should only be imported once a command actually needs them
+HEAVY_BACKENDS = (
+    'faiss', 'chromadb', 'pypdf', 'sentence_transformers', 'torch', 'streamlit',
+    'langchain_community.vectorstores.faiss', 'langchain_community.vectorstores.chroma',
+    'langchain_community.llms.ollama', 'langchain_community.embeddings.ollama',
+    'langchain.chains'
+)
+
+def parse_importtime(stderr):
+    """
+    Parses the output of `python -X importtime`.
+
+    Parameters
+    ----------
+    stderr : str
+        The standard error of the profiled interpreter.
+
+    Returns
+    -------
+    list of dict
+        One entry per imported module with its `module` name, `self_ms` and `cumulative_ms`.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append({
+            'module': module.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000
+        })
+    return imports
+
+def profile_module_import(module, runs):
+    """
+    Imports a module in fresh interpreters and measures where the import time goes.
+
+    Parameters
+    ----------
+    module : str
+        The module to import, e.g. 'src.pipeline'.
+    runs : int
+        Number of fresh interpreters; the fastest run is reported, as the others include disk cache misses.
+
+    Returns
+    -------
+    dict
+        The module's total import time, the `HEAVY_BACKENDS` it pulled in, and its imports of the fastest run.
+    """
+    fastest_imports = None
+    totals_ms = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, cwd=PROJECT_DIRECTORY
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f'Importing {module} failed: {completed.stderr.strip().splitlines()[-1]}')
+        imports = parse_importtime(completed.stderr)
+        total_ms = sum(entry['self_ms'] for entry in imports)
+        totals_ms.append(total_ms)
+        if fastest_imports is None or total_ms <= min(totals_ms):
+            fastest_imports = imports
+
+    imported_modules = {entry['module'] for entry in fastest_imports}
+    return {
+        'module': module,
+        'import_ms': round(min(totals_ms), 1),
+        'import_ms_median': round(statistics.median(totals_ms), 1),
+        'heavy_backends_imported': [backend for backend in HEAVY_BACKENDS if backend in imported_modules],
+        'imports': fastest_imports
+    }
+
+def run_import_profile():
+    """
+    Profiles the import time of the project's entry points against a start-up budget.
+
+    Returns
+    -------
+    list of dict
+        One result per module in `import_profile -> modules`, also written as JSON to `import_profile -> output_path`.
+
+    Notes
+    -----
+    - Every module is imported in fresh interpreters with `python -X importtime`, so nothing is shared
+      with the current process or between modules.
+    - Each result lists the `top_n` imports with the largest cumulative time, and flags any heavy backend
+      (faiss, chromadb, pypdf, LangChain chains, ...) the import pulled in. These should only load once a
+      command selects them.
+    - A module whose import takes longer than `import_profile -> budget_ms` is reported as over budget.
+    """
+    try:
+        log_component_start(logger_for_import_profile, 'Import Profile Component')
+
+        profile_config = get_config()['import_profile']
+        budget_ms = float(profile_config['budget_ms'])
+        top_n = int(profile_config['top_n'])
+
+        results = []
+        for module in profile_config['modules']:
+            result = profile_module_import(module, int(profile_config['runs']))
+            imports = result.pop('imports')
+            result['over_budget'] = result['import_ms'] > budget_ms
+            result['slowest_imports'] = sorted(imports, key=lambda entry: entry['cumulative_ms'], reverse=True)[:top_n]
+            results.append(result)
+
+            logger_for_import_profile.info(
+                '%-22s import: %8.1f ms (budget %.0f ms%s)  heavy backends: %s',
+                module, result['import_ms'], budget_ms, ', OVER BUDGET' if result['over_budget'] else '',
+                ', '.join(result['heavy_backends_imported']) or '-'
+            )
+            for entry in result['slowest_imports']:
+                logger_for_import_profile.info(
+                    '    %-50s cumulative: %8.1f ms  self: %7.1f ms', entry['module'], entry['cumulative_ms'], entry['self_ms']
+                )
+
+        output_path = profile_config['output_path']
+        output_directory = os.path.dirname(output_path)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as file:
+            json.dump({'python': sys.version.split()[0], 'budget_ms': budget_ms, 'results': results}, file, indent=2)
+        logger_for_import_profile.info('Import profile written to: %s', output_path)
+
+        log_component_end(logger_for_import_profile, 'Import Profile Component')
+        return results
+
+    except Exception as e:
+        logger_for_import_profile.debug('Error encountered in import profile component. error: %s', e)
+        log_component_end(logger_for_import_profile, 'Import Profile Component')
+        raise
@@ -0,0 +1,401 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from src.vectordb_builder import (
+    building_snapshots, get_persist_directory, get_snapshot_directory, get_store_root_directory, is_sharded_store,
+    load_chunk_manifest, load_usable_manifest, read_current_snapshot, read_index_version, CURRENT_SNAPSHOT_FILE_NAME,
+    INDEX_VERSION_FILE_NAME, SNAPSHOT_MANIFEST_FILE_NAME, SNAPSHOTS_DIRECTORY_NAME
+)
+from src.data_loader import IngestLedger, resolve_data_files
+from src.hybrid_retriever import is_sparse_index_current
+from src.config_loader import get_config
+from src.logger import log_component_start, log_component_end, logger_for_index_snapshots
+from src.metrics import instrument
+
+# Entries of a store's root directory that belong to the snapshots, not to a store built before them
+ROOT_ENTRY_NAMES = (SNAPSHOTS_DIRECTORY_NAME, CURRENT_SNAPSHOT_FILE_NAME, CURRENT_SNAPSHOT_FILE_NAME + '.tmp')
+
+def get_current_snapshot(vector_storedb):
+    """
+    Returns the name of the snapshot currently published for a vector store type, or None if snapshots
+    are disabled or none was published yet.
+    """
+    if not get_config()['index_snapshots']['enabled']:
+        return None
+    return read_current_snapshot(get_store_root_directory(vector_storedb))
+
+def new_snapshot_name():
+    """
+    Returns a new snapshot name, `<UTC time to the microsecond>-<random suffix>`, so names sort by creation time.
+    """
+    return f"{datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+def load_snapshot_manifest(snapshot_directory):
+    """
+    Loads the manifest of a snapshot, or returns None if the snapshot was never published.
+    """
+    manifest_path = os.path.join(snapshot_directory, SNAPSHOT_MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def describe_snapshot(snapshot_directory, vector_storedb):
+    """
+    Describes the index a snapshot holds, from the chunk manifests of its store (or of its shards).
+
+    Parameters
+    ----------
+    snapshot_directory : str
+        Directory of the snapshot.
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+
+    Returns
+    -------
+    dict
+        `vector_store_db`, `embedding_model`, `chunk_settings`, `index_settings`, `shard_count`,
+        `index_version`, `chunk_count`, and `documents`, mapping every source document to a hash over
+        the ids (content hashes) of its chunks.
+    """
+    store_directories = [snapshot_directory]
+    shard_count = int(get_config()['vector_shards']['shard_count'])
+    if shard_count > 1:
+        from src.sharded_vectordb import get_shard_directory
+        store_directories = [get_shard_directory(snapshot_directory, shard_number) for shard_number in range(shard_count)]
+    chunk_manifests = [manifest for manifest in map(load_chunk_manifest, store_directories) if manifest is not None]
+
+    chunk_ids_by_source = {}
+    for chunk_manifest in chunk_manifests:
+        for chunk_id, source in chunk_manifest['chunks'].items():
+            chunk_ids_by_source.setdefault(str(source), []).append(chunk_id)
+    build_settings = chunk_manifests[0] if chunk_manifests else {}
+    return {
+        'vector_store_db': vector_storedb,
+        'embedding_model': build_settings.get('embedding_model'),
+        'chunk_settings': build_settings.get('chunk_settings'),
+        'index_settings': build_settings.get('index_settings'),
+        'shard_count': shard_count if shard_count > 1 else 0,
+        'index_version': read_index_version(snapshot_directory),
+        'chunk_count': sum(len(chunk_ids) for chunk_ids in chunk_ids_by_source.values()),
+        'documents': {
+            source: hashlib.sha256('\n'.join(sorted(chunk_ids)).encode('utf-8')).hexdigest()
+            for source, chunk_ids in sorted(chunk_ids_by_source.items())
+        }
+    }
+
+def collect_old_snapshots(root_directory, keep_snapshots):
+    """
+    Deletes the published snapshots of a store beyond the `keep_snapshots` newest ones, and what
+    builds that never completed left behind.
+
+    The current snapshot and snapshots being built in this process are always kept, and so are
+    unpublished snapshots newer than the current one, which another process may still be building.
+
+    Returns
+    -------
+    list of str
+        Names of the deleted snapshots.
+    """
+    snapshots_directory = os.path.join(root_directory, SNAPSHOTS_DIRECTORY_NAME)
+    if not os.path.isdir(snapshots_directory):
+        return []
+    current_snapshot = read_current_snapshot(root_directory)
+    snapshot_names = sorted(os.listdir(snapshots_directory))
+    published = [
+        name for name in snapshot_names
+        if os.path.exists(os.path.join(snapshots_directory, name, SNAPSHOT_MANIFEST_FILE_NAME))
+    ]
+    kept = set(published[-keep_snapshots:]) | {current_snapshot} | set(building_snapshots.values())
+
+    removed = []
+    for name in snapshot_names:
+        if name in kept or (name not in published and (current_snapshot is None or name > current_snapshot)):
+            continue
+        # Files still memory-mapped by a process may not be deletable on every platform; the next run retries
+        shutil.rmtree(os.path.join(snapshots_directory, name), ignore_errors=True)
+        removed.append(name)
+    return removed
+
+def publish_snapshot(vector_storedb, snapshot_name, parent_snapshot):
+    """
+    Publishes a built snapshot: writes its manifest, points `CURRENT` at it and deletes old snapshots.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    snapshot_name : str
+        Name of the built snapshot.
+    parent_snapshot : str or None
+        Name of the snapshot it was built from.
+
+    Returns
+    -------
+    dict
+        The snapshot's manifest.
+
+    Notes
+    -----
+    - `CURRENT` is replaced with `os.replace`, so readers see either the previous snapshot or the new one.
+    - A snapshot without an `index_version` file was not completely built and is never published.
+    """
+    root_directory = get_store_root_directory(vector_storedb)
+    snapshot_directory = os.path.join(root_directory, SNAPSHOTS_DIRECTORY_NAME, snapshot_name)
+    if read_index_version(snapshot_directory) is None:
+        raise ValueError(f'Snapshot {snapshot_name} has no index version, so its build did not complete')
+
+    manifest = {
+        'snapshot': snapshot_name,
+        'parent': parent_snapshot,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        **describe_snapshot(snapshot_directory, vector_storedb)
+    }
+    manifest_path = os.path.join(snapshot_directory, SNAPSHOT_MANIFEST_FILE_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    pointer_path = os.path.join(root_directory, CURRENT_SNAPSHOT_FILE_NAME)
+    with open(pointer_path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(snapshot_name)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(pointer_path + '.tmp', pointer_path)
+    logger_for_index_snapshots.info(
+        'Published snapshot %s of the %s store with %s chunks from %s documents',
+        snapshot_name, vector_storedb.upper(), manifest['chunk_count'], len(manifest['documents'])
+    )
+
+    removed = collect_old_snapshots(root_directory, int(get_config()['index_snapshots']['keep_snapshots']))
+    if removed:
+        logger_for_index_snapshots.info('Deleted old snapshots: %s', ', '.join(removed))
+    return manifest
+
+def is_current_snapshot_up_to_date(vector_storedb, embedding_model, ledger_file_name):
+    """
+    Tells whether building an update of a vector store would leave its current snapshot's index unchanged.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    embedding_model : str
+        The embedding model the store is built with.
+    ledger_file_name : str
+        Name of the store's ingest ledger (sharded and unsharded builds keep separate ledgers).
+
+    Returns
+    -------
+    bool
+        True if a snapshot is published, its store (every shard of it) can be updated incrementally with the
+        current embedding model, chunk and index settings, its ingest ledger lists exactly the current data
+        files with unchanged mtimes and sizes, and its BM25 index (with hybrid retrieval enabled) is current.
+
+    Notes
+    -----
+    Only file metadata is read, so the pipeline can skip `build_index_snapshot`, and its copy of the
+    whole index, when nothing changed.
+    """
+    config = get_config()
+    index_snapshot = get_current_snapshot(vector_storedb)
+    if index_snapshot is None:
+        return False
+    snapshot_directory = get_snapshot_directory(vector_storedb, index_snapshot)
+
+    shard_count = int(config['vector_shards']['shard_count'])
+    if shard_count > 1:
+        from src.sharded_vectordb import get_shard_directory, load_shard_layout
+        layout = load_shard_layout(snapshot_directory)
+        if layout is None or layout.get('shard_count') != shard_count:
+            return False
+        store_directories = [get_shard_directory(snapshot_directory, shard_number) for shard_number in range(shard_count)]
+    else:
+        store_directories = [snapshot_directory]
+    if any(load_usable_manifest(directory, embedding_model, vector_storedb) is None for directory in store_directories):
+        return False
+
+    ingest_ledger = IngestLedger(os.path.join(snapshot_directory, ledger_file_name))
+    data_files = resolve_data_files(config['data_file']['data_file_path'])
+    if set(ingest_ledger.previous_entries) != set(data_files) or not all(ingest_ledger.check(path) for path in data_files):
+        return False
+
+    return not config['hybrid_retrieval']['enabled'] or is_sparse_index_current(snapshot_directory)
+
+@contextmanager
+def build_index_snapshot(vector_storedb):
+    """
+    Builds an update of a vector store into a new snapshot, published when the block completes.
+
+    Within the block, `get_persist_directory` returns the new snapshot's directory in this process, so the
+    vector store builders, the ingest ledger and the BM25 index all write into it. Serving processes keep
+    reading the current snapshot, which is never modified.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+
+    Yields
+    ------
+    str
+        The directory the update is built in; the store's usual directory when `index_snapshots -> enabled` is false.
+
+    Notes
+    -----
+    - The new snapshot starts as a copy of the current one (or of a store built before snapshots were
+      enabled), so the update stays incremental.
+    - The copy's `index_version` and snapshot manifest are dropped, so only a completed build can be
+      published, and the copy is not taken for a published snapshot while it is built.
+    - If the block raises, the snapshot is deleted and `CURRENT` keeps pointing at the previous one.
+    - Concurrent builds of the same store are not supported.
+    """
+    if not get_config()['index_snapshots']['enabled']:
+        yield get_persist_directory(vector_storedb)
+        return
+
+    try:
+        log_component_start(logger_for_index_snapshots, 'Index Snapshot Component')
+
+        with instrument('index_snapshot_copy'):
+            root_directory = get_store_root_directory(vector_storedb)
+            parent_snapshot = read_current_snapshot(root_directory)
+            parent_directory = get_persist_directory(vector_storedb)
+            snapshot_name = new_snapshot_name()
+            snapshot_directory = os.path.join(root_directory, SNAPSHOTS_DIRECTORY_NAME, snapshot_name)
+
+            if os.path.isdir(parent_directory):
+                shutil.copytree(
+                    parent_directory,
+                    snapshot_directory,
+                    ignore=lambda directory, names: [
+                        name for name in names
+                        if directory == parent_directory and (name in ROOT_ENTRY_NAMES or name == SNAPSHOT_MANIFEST_FILE_NAME)
+                    ]
+                )
+            else:
+                os.makedirs(snapshot_directory)
+            version_path = os.path.join(snapshot_directory, INDEX_VERSION_FILE_NAME)
+            if os.path.exists(version_path):
+                os.remove(version_path)
+        logger_for_index_snapshots.info('Building snapshot %s from %s', snapshot_name, parent_snapshot or parent_directory)
+
+        building_snapshots[vector_storedb] = snapshot_name
+        try:
+            yield snapshot_directory
+            publish_snapshot(vector_storedb, snapshot_name, parent_snapshot)
+        except BaseException:
+            shutil.rmtree(snapshot_directory, ignore_errors=True)
+            logger_for_index_snapshots.warning('Snapshot %s was not published, the current snapshot is kept', snapshot_name)
+            raise
+        finally:
+            building_snapshots.pop(vector_storedb, None)
+
+        log_component_end(logger_for_index_snapshots, 'Index Snapshot Component')
+
+    except Exception as e:
+        logger_for_index_snapshots.debug('Error encountered in index snapshot component. error: %s', e)
+        log_component_end(logger_for_index_snapshots, 'Index Snapshot Component')
+        raise
+
+def retire_vector_store(vector_db):
+    """
+    Releases a vector store replaced by a hot swap.
+
+    In-memory and memory-mapped stores are freed once the last request using them finishes; a sharded
+    store's search processes are shut down after `index_snapshots -> drain_seconds`.
+    """
+    if is_sharded_store(vector_db):
+        timer = threading.Timer(float(get_config()['index_snapshots']['drain_seconds']), vector_db.close)
+        timer.daemon = True
+        timer.start()
+
+class SnapshotWatcher:
+    """
+    Background thread noticing newly published snapshots of a store and handing them to a callback.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    on_new_snapshot : callable
+        Called with the name of a newly published snapshot, on the watcher thread. It loads the snapshot
+        and swaps it in; if it raises, the current index is kept and that snapshot is not retried.
+    snapshot : str or None
+        The snapshot served when the watcher starts.
+    """
+
+    def __init__(self, vector_storedb, on_new_snapshot, snapshot):
+        self.vector_storedb = vector_storedb
+        self.on_new_snapshot = on_new_snapshot
+        self.snapshot = snapshot
+        self.failed_snapshot = None
+        self._thread = None
+
+    def check(self):
+        """
+        Swaps to the current snapshot if it is not the one served.
+
+        Returns
+        -------
+        bool
+            True if a new snapshot was swapped in.
+        """
+        snapshot = get_current_snapshot(self.vector_storedb)
+        if snapshot is None or snapshot in (self.snapshot, self.failed_snapshot):
+            return False
+
+        try:
+            with instrument('index_swap') as span:
+                started_at = time.perf_counter()
+                self.on_new_snapshot(snapshot)
+                span.add('swaps')
+        except Exception as e:
+            self.failed_snapshot = snapshot
+            logger_for_index_snapshots.warning('Snapshot %s could not be loaded, still serving %s. error: %s', snapshot, self.snapshot, e)
+            return False
+
+        logger_for_index_snapshots.info(
+            'Swapped from snapshot %s to %s in %.2f ms', self.snapshot, snapshot, (time.perf_counter() - started_at) * 1000
+        )
+        self.snapshot = snapshot
+        return True
+
+    def start(self):
+        """
+        Starts polling `CURRENT` every `index_snapshots -> poll_seconds`.
+        """
+        poll_seconds = float(get_config()['index_snapshots']['poll_seconds'])
+
+        def watch():
+            while True:
+                time.sleep(poll_seconds)
+                try:
+                    self.check()
+                except Exception as e:
+                    logger_for_index_snapshots.debug('Error encountered while checking for a new snapshot. error: %s', e)
+
+        self._thread = threading.Thread(target=watch, name='snapshot-watcher', daemon=True)
+        self._thread.start()
+        logger_for_index_snapshots.info('Watching the %s store for new snapshots', self.vector_storedb.upper())
+
+def start_snapshot_watcher(vector_storedb, on_new_snapshot, snapshot):
+    """
+    Starts a `SnapshotWatcher` swapping newly published snapshots in the background.
+
+    Returns
+    -------
+    SnapshotWatcher or None
+        The running watcher, or None when `index_snapshots -> enabled` is false.
+    """
+    if not get_config()['index_snapshots']['enabled']:
+        return None
+    watcher = SnapshotWatcher(vector_storedb, on_new_snapshot, snapshot)
+    watcher.start()
+    return watcher
@@ -1,29 +1,154 @@
+import atexit
+import os
 import logging
+import logging.handlers
+import queue
+import threading
 
 # Logging Configuration Utilities
 
+# Settings used until `configure_logging` receives the `logging` section of config.yaml,
+# and if the config file cannot be loaded at all
+DEFAULT_LOGGING_SETTINGS = {
+    'log_file': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'pipeline_logs.log'),
+    'level': 'DEBUG',
+    'file_level': 'DEBUG',
+    'console_level': 'DEBUG',
+    'max_bytes': 10 * 1024 * 1024,
+    'backup_count': 5,
+    'component_levels': {}
+}
+
+# Records are put on this queue by the calling thread and written by the listener's background thread
+log_queue = queue.SimpleQueue()
+
+_log_listener = None
+_log_listener_lock = threading.Lock()
+
+# The `logging` settings last passed to `configure_logging`, reused by forked worker processes
+_logging_settings = None
+
+# Handlers a forked worker process writes through directly, in place of the queue; None in the main process
+_direct_handlers = None
+
 def get_logging_config():
     """
     Set up the global logging configuration for the pipeline.
 
+    Every record is handed to a `QueueHandler` on the root logger, so logging never blocks the
+    caller on file or console I/O. Records logged before `configure_logging` runs wait on the
+    queue and are written once the listener starts.
+
     Returns
     -------
     logging : module
-        The configured logging module with file and console handlers.
+        The configured logging module.
     """
-    logging.basicConfig(
-        level=logging.DEBUG, 
-        format='%(asctime)s-%(name)s-%(levelname)s-%(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S',
-        handlers=[
-            # Log to a file
-            logging.FileHandler(r'C:\Users\BW\Desktop\Basic gen ai chatbot project\logs\pipeline_logs.log'),
-            # Also log to the console
-            logging.StreamHandler()
-        ]
-    )
+    root_logger = logging.getLogger()
+    if _direct_handlers is None and not any(isinstance(handler, logging.handlers.QueueHandler) for handler in root_logger.handlers):
+        root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        root_logger.setLevel(DEFAULT_LOGGING_SETTINGS['level'])
     return logging
 
+def configure_logging(logging_settings=None):
+    """
+    Starts (or restarts) the background writer with the log file, rotation and levels from the config.
+
+    Parameters
+    ----------
+    logging_settings : dict, optional
+        The `logging` section of config.yaml; missing keys fall back to `DEFAULT_LOGGING_SETTINGS`.
+
+    Notes
+    -----
+    - The log file is rotated once it reaches `max_bytes`, keeping `backup_count` old files.
+    - `level` is set on the root logger, which every component logger inherits; `component_levels`
+      overrides it per logger name, and `file_level` / `console_level` filter what each output receives.
+    - In forked worker processes the handlers are attached to the root logger directly instead (see
+      `_reset_logging_in_child`).
+    """
+    global _log_listener, _logging_settings, _direct_handlers
+    _logging_settings = logging_settings
+    settings = {**DEFAULT_LOGGING_SETTINGS, **(logging_settings or {})}
+
+    log_directory = os.path.dirname(settings['log_file'])
+    if log_directory:
+        os.makedirs(log_directory, exist_ok=True)
+    formatter = logging.Formatter('%(asctime)s-%(name)s-%(levelname)s-%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    # Log to a size-rotated file
+    file_handler = logging.handlers.RotatingFileHandler(
+        settings['log_file'], maxBytes=int(settings['max_bytes']), backupCount=int(settings['backup_count']),
+        encoding='utf-8', delay=True
+    )
+    file_handler.setLevel(settings['file_level'])
+    file_handler.setFormatter(formatter)
+    # Also log to the console
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(settings['console_level'])
+    console_handler.setFormatter(formatter)
+
+    get_logging_config().getLogger().setLevel(settings['level'])
+    for logger_name, level in (settings['component_levels'] or {}).items():
+        logging.getLogger(logger_name).setLevel(level)
+
+    with _log_listener_lock:
+        if _direct_handlers is not None:
+            root_logger = logging.getLogger()
+            for handler in _direct_handlers:
+                root_logger.removeHandler(handler)
+                handler.close()
+            _direct_handlers = [file_handler, console_handler]
+            for handler in _direct_handlers:
+                root_logger.addHandler(handler)
+            return
+        if _log_listener is not None:
+            _log_listener.stop()
+        _log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        _log_listener.start()
+
+def stop_logging():
+    """
+    Writes out every queued record and stops the background writer; registered to run at exit.
+    """
+    global _log_listener
+    if _direct_handlers is not None:
+        # A forked worker wrote its records directly; only its files are left to close
+        for handler in _direct_handlers:
+            handler.close()
+        return
+    with _log_listener_lock:
+        listener = _log_listener
+        _log_listener = None
+    if listener is None:
+        # The config was never loaded; write out the queued records with the default settings
+        configure_logging()
+        with _log_listener_lock:
+            listener, _log_listener = _log_listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+atexit.register(stop_logging)
+
+def _reset_logging_in_child():
+    # A forked worker has no writer thread, and may exit without running atexit hooks, so it writes its
+    # records directly with the parent's settings; the parent writes the records queued before the fork
+    global _log_listener, _log_listener_lock, _direct_handlers
+    _log_listener = None
+    _log_listener_lock = threading.Lock()
+    while not log_queue.empty():
+        log_queue.get_nowait()
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root_logger.removeHandler(handler)
+    _direct_handlers = []
+    configure_logging(_logging_settings)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_logging_in_child)
+
 # Initialize and return the configured logging module
 logging_config = get_logging_config()
 
@@ -38,7 +163,7 @@ def log_component_start(logger, component_name: str):
     component_name : str
         The name of the pipeline component.
     """
-    logger.info(f"{'='*10} Starting {component_name} {'='*10}")
+    logger.info('========== Starting %s ==========', component_name)
 
 def log_component_end(logger, component_name: str):
     """
@@ -51,43 +176,82 @@ def log_component_end(logger, component_name: str):
     component_name : str
         The name of the pipeline component.
     """
-    logger.info(f"{'='*10} Finished {component_name} {'='*10}\n")
+    logger.info('========== Finished %s ==========\n', component_name)
 
 # =============================================================================
 # Component-Specific Loggers
 # =============================================================================
 
+# Levels are set by `configure_logging` from the `logging` section of config.yaml
+
 # Logger for the data loader component
 logger_for_loading_data = logging_config.getLogger('Data_loader_component')
-logger_for_loading_data.setLevel(get_logging_config().DEBUG)
 
 # Logger for configuration file loading
 logger_for_config_file = logging_config.getLogger('Loading_config_file_component')
-logger_for_config_file.setLevel(get_logging_config().DEBUG)
 
 # Logger for text splitter component
 logger_for_data_splitter = logging_config.getLogger('Data_splitter_component')
-logger_for_data_splitter.setLevel(get_logging_config().DEBUG)
 
 # Logger for embedding component
 logger_for_embedder = logging_config.getLogger('Embedder_component')
-logger_for_embedder.setLevel(get_logging_config().DEBUG)
+
+# Logger for the pooled model clients
+logger_for_model_clients = logging_config.getLogger('Model_clients_component')
+
+# Logger for the persistent embedding cache
+logger_for_embedding_cache = logging_config.getLogger('Embedding_cache_component')
+
+# Logger for the semantic answer cache
+logger_for_answer_cache = logging_config.getLogger('Answer_cache_component')
 
 # Logger for vector database builder
 logger_for_vectordb_builder = logging_config.getLogger('Vectordb_builder_component')
-logger_for_vectordb_builder.setLevel(get_logging_config().DEBUG)
 
 # Logger for prompt construction
 logger_for_prompt_builder = logging_config.getLogger('Prompt_builder_component')
-logger_for_prompt_builder.setLevel(get_logging_config().DEBUG)
 
 # Logger for retrieval chain execution
 logger_for_retrieval_chain = logging_config.getLogger('Retrieval_chain_component')
-logger_for_retrieval_chain.setLevel(get_logging_config().DEBUG)
+
+# Logger for hybrid BM25 + dense retrieval
+logger_for_hybrid_retriever = logging_config.getLogger('Hybrid_retriever_component')
+
+# Logger for re-ranking
+logger_for_reranker = logging_config.getLogger('Reranker_component')
+
+# Logger for context packing
+logger_for_context_packer = logging_config.getLogger('Context_packer_component')
+
+# Logger for batch query evaluation
+logger_for_batch_query = logging_config.getLogger('Batch_query_component')
+
+# Logger for the long-lived query server
+logger_for_query_server = logging_config.getLogger('Query_server_component')
+
+# Logger for the end-to-end benchmark
+logger_for_benchmark = logging_config.getLogger('Benchmark_component')
+
+# Logger for the ANN recall-vs-latency report
+logger_for_ann_report = logging_config.getLogger('Ann_report_component')
+
+# Logger for the chat sessions
+logger_for_chat_sessions = logging_config.getLogger('Chat_sessions_component')
+
+# Logger for the sharded vector store
+logger_for_sharded_vectordb = logging_config.getLogger('Sharded_vectordb_component')
+
+# Logger for index snapshots and their hot swap
+logger_for_index_snapshots = logging_config.getLogger('Index_snapshots_component')
+
+# Logger for the vector quantization report
+logger_for_quantization_report = logging_config.getLogger('Quantization_report_component')
+
+# Logger for the import-time profile
+logger_for_import_profile = logging_config.getLogger('Import_profile_component')
 
 # Logger for the overall pipeline controller
 logger_for_pipeline_code = logging_config.getLogger('Pipeline_component')
-logger_for_pipeline_code.setLevel(get_logging_config().DEBUG)
 
 # Suppress Noisy Logs from Dependencies
 # Suppress debug/info logs from networking and external libraries
@@ -0,0 +1,318 @@
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from src.config_loader import get_config
+
+# Upper bounds (in seconds) of the wall and CPU time histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "genai_pipeline"
+
+# Marks the end of the stream consumed by `Span.excluding`
+_EXHAUSTED = object()
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense.
+
+    Parameters
+    ----------
+    buckets : tuple of float
+        Upper bounds of the buckets, ascending; an implicit +Inf bucket follows.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+class MetricsRegistry:
+    """
+    In-process store of per-component wall time, CPU time, item counts and errors.
+
+    Parameters
+    ----------
+    trace_path : str, optional
+        JSON-lines file every recorded component run is appended to. None disables the trace.
+    """
+
+    def __init__(self, trace_path=None):
+        self._lock = threading.Lock()
+        self.wall_seconds = {}
+        self.cpu_seconds = {}
+        self.items = {}
+        self.errors = {}
+        self._trace_file = None
+        if trace_path:
+            trace_directory = os.path.dirname(trace_path)
+            if trace_directory:
+                os.makedirs(trace_directory, exist_ok=True)
+            self._trace_file = open(trace_path, 'a', encoding='utf-8', buffering=1)
+
+    def record(self, component, wall_seconds, cpu_seconds, items, error):
+        """
+        Records one run of a component.
+
+        Parameters
+        ----------
+        component : str
+            Name of the component.
+        wall_seconds : float
+            Elapsed wall-clock time.
+        cpu_seconds : float
+            CPU time the process spent meanwhile (all threads).
+        items : dict
+            Item counts by kind, e.g. `{'chunks': 120}`.
+        error : BaseException or None
+            The exception the component raised, if any.
+        """
+        with self._lock:
+            self.wall_seconds.setdefault(component, Histogram(DURATION_BUCKETS)).observe(wall_seconds)
+            self.cpu_seconds.setdefault(component, Histogram(DURATION_BUCKETS)).observe(cpu_seconds)
+            for kind, count in items.items():
+                self.items[(component, kind)] = self.items.get((component, kind), 0) + count
+            if error is not None:
+                self.errors[component] = self.errors.get(component, 0) + 1
+
+            if self._trace_file is not None:
+                self._trace_file.write(json.dumps({
+                    'timestamp': time.time(),
+                    'component': component,
+                    'wall_ms': round(wall_seconds * 1000, 3),
+                    'cpu_ms': round(cpu_seconds * 1000, 3),
+                    'items': items,
+                    'error': repr(error) if error is not None else None
+                }) + '\n')
+
+    def render_prometheus(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The metrics, ready to be served on a `/metrics` endpoint or written for a textfile collector.
+        """
+        lines = []
+        with self._lock:
+            for metric, histograms, help_text in (
+                ('component_wall_seconds', self.wall_seconds, 'Wall-clock time per component run.'),
+                ('component_cpu_seconds', self.cpu_seconds, 'Process CPU time per component run.')
+            ):
+                name = f'{METRIC_PREFIX}_{metric}'
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for component, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip([*histogram.buckets, '+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{component="{component}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{component="{component}"}} {histogram.total}')
+                    lines.append(f'{name}_count{{component="{component}"}} {histogram.count}')
+
+            name = f'{METRIC_PREFIX}_component_items_total'
+            lines.append(f'# HELP {name} Items processed per component, by kind.')
+            lines.append(f'# TYPE {name} counter')
+            for (component, kind), count in sorted(self.items.items()):
+                lines.append(f'{name}{{component="{component}",kind="{kind}"}} {count}')
+
+            name = f'{METRIC_PREFIX}_component_errors_total'
+            lines.append(f'# HELP {name} Component runs that raised an error.')
+            lines.append(f'# TYPE {name} counter')
+            for component, count in sorted(self.errors.items()):
+                lines.append(f'{name}{{component="{component}"}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+class Span:
+    """
+    One instrumented run of a component; use it through `instrument`.
+
+    The clock runs from `__enter__` to `__exit__`, except while it is paused by `yielding` or `excluding`,
+    so a generator stage only measures its own work inside each `next()`.
+    """
+
+    __slots__ = ('component', 'registry', 'items', 'wall_started_at', 'cpu_started_at', 'wall_seconds', 'cpu_seconds')
+
+    def __init__(self, component, registry):
+        self.component = component
+        self.registry = registry
+        self.items = {}
+
+    def add(self, kind, count=1):
+        """
+        Counts processed items of a kind, e.g. `span.add('chunks', len(chunks))`.
+        """
+        self.items[kind] = self.items.get(kind, 0) + count
+
+    def _resume(self):
+        self.wall_started_at = time.perf_counter()
+        self.cpu_started_at = time.process_time()
+
+    def _pause(self):
+        self.wall_seconds += time.perf_counter() - self.wall_started_at
+        self.cpu_seconds += time.process_time() - self.cpu_started_at
+
+    def yielding(self, items, kind=None):
+        """
+        Yields every item, pausing the clock while the consumer holds it, and counts them as `kind` if given.
+
+        Use as `yield from span.yielding(documents)` inside a generator, so the time the generator sits
+        suspended at `yield` (while later stages embed and write) is not counted; producing the items is.
+        """
+        for item in items:
+            if kind is not None:
+                self.add(kind)
+            self._pause()
+            try:
+                yield item
+            finally:
+                self._resume()
+
+    def excluding(self, items):
+        """
+        Yields every item of an upstream stream, pausing the clock while the next item is produced.
+
+        Use on the input of a stage, e.g. `span.excluding(loaded_data)`, so the time spent in the
+        (separately instrumented) upstream stage is not counted again.
+        """
+        iterator = iter(items)
+        while True:
+            self._pause()
+            try:
+                item = next(iterator, _EXHAUSTED)
+            finally:
+                self._resume()
+            if item is _EXHAUSTED:
+                return
+            yield item
+
+    def __enter__(self):
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self._resume()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self._pause()
+        # A generator closed early by its consumer is not an error
+        error = exception if exception is not None and not isinstance(exception, GeneratorExit) else None
+        self.registry.record(
+            self.component,
+            wall_seconds=self.wall_seconds,
+            cpu_seconds=self.cpu_seconds,
+            items=self.items,
+            error=error
+        )
+        return False
+
+class NoopSpan:
+    """
+    Span used while metrics are disabled; every operation does nothing.
+    """
+
+    __slots__ = ()
+
+    def add(self, kind, count=1):
+        pass
+
+    def yielding(self, items, kind=None):
+        return items
+
+    def excluding(self, items):
+        return items
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        return False
+
+NOOP_SPAN = NoopSpan()
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_metrics_registry():
+    """
+    Returns the process-wide metrics registry, or None when `metrics -> enabled` is false.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                metrics_config = get_config()['metrics']
+                _registry = (
+                    MetricsRegistry(trace_path=metrics_config['trace_path'] or None)
+                    if metrics_config['enabled'] else False
+                )
+    return _registry or None
+
+def instrument(component):
+    """
+    Context manager measuring one run of a component.
+
+    Parameters
+    ----------
+    component : str
+        Name the run is recorded under.
+
+    Returns
+    -------
+    Span or NoopSpan
+        Use as `with instrument('data_splitter') as span: ... span.add('chunks')`. Wall time, CPU time,
+        the items counted with `span.add` and any exception raised inside the block are recorded.
+        While metrics are disabled a shared no-op span is returned, so the overhead is one function call.
+    """
+    registry = get_metrics_registry()
+    if registry is None:
+        return NOOP_SPAN
+    return Span(component, registry)
+
+def instrumented(component):
+    """
+    Decorator recording every call of a function (or every full run of a generator) under `component`.
+
+    A generator's run only counts the time spent producing its items, not the time its consumer holds them.
+    """
+    def decorator(function):
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                with instrument(component) as span:
+                    yield from span.yielding(function(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with instrument(component):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write_prometheus_file():
+    """
+    Writes the current metrics to `metrics -> prometheus_path`, e.g. for node_exporter's textfile collector.
+    """
+    registry = get_metrics_registry()
+    prometheus_path = get_config()['metrics']['prometheus_path']
+    if registry is None or not prometheus_path:
+        return
+    prometheus_directory = os.path.dirname(prometheus_path)
+    if prometheus_directory:
+        os.makedirs(prometheus_directory, exist_ok=True)
+    temp_path = prometheus_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(registry.render_prometheus())
+    os.replace(temp_path, prometheus_path)
@@ -0,0 +1,306 @@
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Iterator, List, Optional, Union
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from src.config_loader import get_config
+from src.logger import logger_for_model_clients
+from src.metrics import instrument
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight, later callers with the
+    same key wait for its result instead of making their own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """
+        Runs `function()` unless a call for `key` is already in flight, and returns that call's result.
+        Exceptions are shared the same way.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            with instrument('model_client_coalesced') as span:
+                span.add('requests')
+                return future.result()
+
+        try:
+            result = function()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+class ModelClient:
+    """
+    Pooled HTTP client of one model, spread round-robin over one or more Ollama-compatible endpoints.
+
+    Parameters
+    ----------
+    model : str
+        Name of the model.
+    endpoints : list of str
+        Base URLs of the model servers, e.g. `['http://localhost:11434']`.
+    max_concurrency : int
+        Maximum number of requests in flight to this model, across all endpoints.
+    pool_maxsize : int
+        Keep-alive connections kept open per endpoint.
+    timeout_seconds : float
+        Connect and read timeout of every request.
+    coalesce : bool
+        Share one request between identical concurrent non-streaming requests.
+    """
+
+    def __init__(self, model, endpoints, max_concurrency, pool_maxsize, timeout_seconds, coalesce):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.model = model
+        self.timeout_seconds = timeout_seconds
+        # One keep-alive session per (model, endpoint)
+        self.sessions = []
+        for endpoint in endpoints:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.sessions.append((endpoint.rstrip('/'), session))
+        self._next_endpoint = itertools.count()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._single_flight = SingleFlight() if coalesce else None
+        # Guards the counters, which the threads sharing this client update concurrently
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failovers = 0
+
+    def _send(self, path, payload, stream):
+        import requests
+
+        # Start at the next endpoint in turn, failing over to the others if it cannot be reached
+        first = next(self._next_endpoint) % len(self.sessions)
+        last_error = None
+        for endpoint, session in self.sessions[first:] + self.sessions[:first]:
+            try:
+                response = session.post(f'{endpoint}{path}', json=payload, stream=stream, timeout=self.timeout_seconds)
+            except requests.ConnectionError as e:
+                with self._lock:
+                    self.failovers += 1
+                last_error = e
+                logger_for_model_clients.warning('Model server %s unreachable for %s. error: %s', endpoint, self.model, e)
+                continue
+            if response.status_code != 200:
+                detail = response.text
+                response.close()
+                raise ValueError(f'Model server {endpoint} returned HTTP {response.status_code} for {self.model}: {detail}')
+            with self._lock:
+                self.requests += 1
+            return response
+        raise ValueError(f'No model server reachable for {self.model}. error: {last_error}')
+
+    def _post(self, path, payload):
+        with self._semaphore, instrument('model_client') as span:
+            span.add('requests')
+            with self._send(path, payload, stream=False) as response:
+                return response.json()
+
+    def post(self, path, payload):
+        """
+        Posts a JSON payload and returns the decoded JSON reply.
+
+        Identical payloads posted concurrently to the same path share a single request when coalescing is on.
+        """
+        if self._single_flight is None:
+            return self._post(path, payload)
+        key = (path, json.dumps(payload, sort_keys=True))
+        return self._single_flight.do(key, lambda: self._post(path, payload))
+
+    def stream(self, path, payload):
+        """
+        Posts a JSON payload and yields the JSON lines of the streamed reply.
+
+        Streams are never coalesced; the request counts against `max_concurrency` until the stream is closed.
+        """
+        with self._semaphore:
+            with self._send(path, payload, stream=True) as response:
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(decode_unicode=True):
+                    if line:
+                        yield json.loads(line)
+
+    def stats(self):
+        """
+        Returns the client's request, coalesced request and failover counters.
+        """
+        return {
+            'requests': self.requests,
+            'coalesced': self._single_flight.coalesced if self._single_flight is not None else 0,
+            'failovers': self.failovers
+        }
+
+class ModelClientRegistry:
+    """
+    Process-wide registry holding one `ModelClient` per model, shared by the embedder and the LLM chains.
+
+    Parameters
+    ----------
+    client_config : dict
+        The `model_clients` section of the config.
+    default_endpoint : str
+        Endpoint used when `model_clients -> endpoints` is empty.
+    """
+
+    def __init__(self, client_config, default_endpoint):
+        self.client_config = client_config
+        self.endpoints = list(client_config['endpoints']) or [default_endpoint]
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, model):
+        """
+        Returns the pooled client of a model, creating it on first use.
+        """
+        with self._lock:
+            client = self._clients.get(model)
+            if client is None:
+                client = self._clients[model] = ModelClient(
+                    model,
+                    self.endpoints,
+                    max_concurrency=int(self.client_config['model_concurrency'].get(model, self.client_config['max_concurrency'])),
+                    pool_maxsize=int(self.client_config['pool_maxsize']),
+                    timeout_seconds=float(self.client_config['timeout_seconds']),
+                    coalesce=bool(self.client_config['coalesce'])
+                )
+                logger_for_model_clients.info('Model client created for %s over endpoints: %s', model, ', '.join(self.endpoints))
+            return client
+
+    def log_stats(self):
+        """
+        Logs every client's request counters.
+        """
+        for model, client in sorted(self._clients.items()):
+            stats = client.stats()
+            logger_for_model_clients.info(
+                'Model client %s requests: %s, coalesced: %s, failovers: %s',
+                model, stats['requests'], stats['coalesced'], stats['failovers']
+            )
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_model_client_registry():
+    """
+    Returns the process-wide model client registry, built from the `model_clients` section of the config.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                config = get_config()
+                _registry = ModelClientRegistry(config['model_clients'], config['ollama_embedding']['base_url'])
+    return _registry
+
+def _reset_registry_in_child():
+    # Sessions and locks copied from the parent are not safe to share; a forked worker builds its own
+    global _registry, _registry_lock
+    _registry = None
+    _registry_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_registry_in_child)
+
+class PooledOllamaEmbeddings(Embeddings):
+    """
+    LangChain `Embeddings` for an Ollama embedding model, sent through the shared model client registry.
+
+    Texts are prefixed with the same instructions as LangChain's `OllamaEmbeddings`, so the vectors match
+    the ones it produced.
+
+    Parameters
+    ----------
+    model : str
+        Name of the Ollama embedding model.
+    embed_instruction : str, optional
+        Prefix of documents. Defaults to "passage: ".
+    query_instruction : str, optional
+        Prefix of queries. Defaults to "query: ".
+    """
+
+    def __init__(self, model, embed_instruction='passage: ', query_instruction='query: '):
+        self.model = model
+        self.embed_instruction = embed_instruction
+        self.query_instruction = query_instruction
+
+    def _embed(self, text):
+        client = get_model_client_registry().get_client(self.model)
+        return client.post('/api/embeddings', {'model': self.model, 'prompt': text})['embedding']
+
+    def embed_documents(self, texts):
+        return [self._embed(f'{self.embed_instruction}{text}') for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(f'{self.query_instruction}{text}')
+
+class PooledOllamaLLM(LLM):
+    """
+    LangChain LLM for an Ollama model's generate endpoint, sent through the shared model client registry.
+
+    `invoke` makes one non-streaming request, which identical concurrent prompts share; `stream` yields the
+    answer token by token.
+    """
+
+    model: str
+    keep_alive: Optional[Union[str, int]] = None
+
+    @property
+    def _llm_type(self):
+        return 'pooled-ollama-llm'
+
+    @property
+    def _identifying_params(self):
+        return {'model': self.model, 'keep_alive': self.keep_alive}
+
+    def _payload(self, prompt, stop, stream):
+        payload = {'model': self.model, 'prompt': prompt, 'stream': stream}
+        if self.keep_alive is not None:
+            payload['keep_alive'] = self.keep_alive
+        if stop:
+            payload['options'] = {'stop': stop}
+        return payload
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        client = get_model_client_registry().get_client(self.model)
+        return client.post('/api/generate', self._payload(prompt, stop, stream=False))['response']
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        client = get_model_client_registry().get_client(self.model)
+        for reply in client.stream('/api/generate', self._payload(prompt, stop, stream=True)):
+            chunk = GenerationChunk(text=reply.get('response', ''))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+def build_ollama_llm(model):
+    """
+    Builds the pooled LLM client of an Ollama model, keeping the model loaded for `ollama_model -> keep_alive`.
+    """
+    return PooledOllamaLLM(model=model, keep_alive=get_config()['ollama_model']['keep_alive'])
@@ -0,0 +1,455 @@
+import json
+import mmap
+import os
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Files a persisted NumpyVectorStore consists of
+VECTORS_FILE_NAME = "vectors.npy"
+SCALES_FILE_NAME = "scales.npy"
+FULL_VECTORS_FILE_NAME = "full_vectors.npy"
+OFFSETS_FILE_NAME = "offsets.npy"
+IDS_FILE_NAME = "ids.npy"
+RECORDS_FILE_NAME = "records.bin"
+
+# Number of vectors scored per block, bounding the float32 working set of a search (decoded vectors and their scores)
+SEARCH_BLOCK_SIZE = 65536
+
+# Largest magnitude of an int8 code; -128 is left unused so the codes are symmetric around 0
+INT8_MAX = 127
+
+def normalize_rows(vectors):
+    """
+    L2-normalizes every row of a matrix, leaving all-zero rows as they are.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def encode_vectors(vectors, dtype, dimensions=0):
+    """
+    Encodes L2-normalized float32 vectors into the compact form a store searches.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray
+        The full-precision vectors, one per row.
+    dtype : str or numpy.dtype
+        'float32', 'float16', or 'int8' for scalar quantization with a per-dimension scale.
+    dimensions : int, optional
+        Keep only the first `dimensions` dimensions (Matryoshka-style truncation), re-normalized. 0 keeps all.
+
+    Returns
+    -------
+    tuple
+        `(codes, scales)`: the encoded matrix, and for int8 the float32 scale of every dimension
+        (a vector is approximately `codes * scales`), else None.
+    """
+    if dimensions and dimensions < vectors.shape[1]:
+        vectors = normalize_rows(vectors[:, :dimensions])
+    if np.dtype(dtype) != np.int8:
+        return vectors.astype(dtype), None
+    scales = np.abs(vectors).max(axis=0) / INT8_MAX if len(vectors) else np.ones(vectors.shape[1])
+    scales = np.where(scales == 0, 1, scales).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return codes, scales
+
+class NumpyVectorStore(VectorStore):
+    """
+    Vector store backed by a memory-mapped NumPy matrix, with no pickle involved.
+
+    Vectors are L2-normalized and stored in `vectors.npy`. Chunk texts and
+    metadata are stored as UTF-8 JSON records back to back in `records.bin`, located through the
+    byte offsets in `offsets.npy`; chunk ids live in `ids.npy`. A loaded store memory-maps all of
+    these, so startup is near-instant and several processes share one page-cached copy. Search is
+    a vectorized cosine top-k.
+
+    With `dtype` float16 or int8 (scalar-quantized, per-dimension scales in `scales.npy`), or with
+    `dimensions` truncating the vectors Matryoshka-style, `vectors.npy` holds this compact form and
+    the full float32 vectors are kept in `full_vectors.npy`. Search scans the compact vectors, then
+    re-scores the best `k * rescore_factor` candidates exactly against the full vectors, of which
+    only the candidates' rows are read from the memory map.
+
+    The store becomes an in-memory copy on the first add or delete and is written back by `save_local`.
+    Added batches are kept apart and concatenated once, on the next search or save.
+
+    Parameters
+    ----------
+    embedding : Embeddings
+        Embedding model used to embed queries (and texts added through `add_texts`).
+    dtype : str, optional
+        Storage dtype of the searched vectors, 'float32', 'float16' or 'int8'. Defaults to 'float32'.
+    dimensions : int, optional
+        Number of leading dimensions searched; 0 searches all of them. Defaults to 0.
+    rescore_factor : int, optional
+        Candidates re-scored exactly per result with a compact dtype or truncation; 0 disables re-scoring.
+        Defaults to 4.
+    """
+
+    def __init__(self, embedding, dtype='float32', dimensions=0, rescore_factor=4):
+        self.embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self.dimensions = int(dimensions or 0)
+        self.rescore_factor = int(rescore_factor)
+        # Full-precision vectors; None when a store was saved without them (float32, or float16 by older versions)
+        self._full = np.empty((0, 0), dtype=np.float32)
+        # Normalized batches added since the last search or save, concatenated onto `_full` in one copy
+        self._pending_vectors = []
+        # Searched vectors and int8 scales, encoded from `_full` on demand while the store is edited
+        self._vectors = None
+        self._scales = None
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._ids = np.empty(0, dtype='S1')
+        self._records = b''
+        self._items = None
+        self._position_by_id = None
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self._items) if self._items is not None else len(self._ids)
+
+    # ------------------------------------------------------------------
+    # Record access
+    # ------------------------------------------------------------------
+
+    def _record(self, position):
+        if self._items is not None:
+            return self._items[position]
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._records[start:end].decode('utf-8'))
+        return self._ids[position].decode('utf-8'), record['text'], record['metadata']
+
+    def document_at(self, position):
+        """
+        Returns the chunk stored at a row position as a Document (with its id set).
+        """
+        chunk_id, text, metadata = self._record(position)
+        return Document(id=chunk_id, page_content=text, metadata=metadata)
+
+    def _positions_by_id(self):
+        if self._position_by_id is None:
+            if self._items is not None:
+                ids = [chunk_id for chunk_id, _, _ in self._items]
+            else:
+                ids = [chunk_id.decode('utf-8') for chunk_id in self._ids]
+            self._position_by_id = {chunk_id: position for position, chunk_id in enumerate(ids)}
+        return self._position_by_id
+
+    def _materialize(self):
+        # Switch from the read-only memory maps to an editable in-memory copy
+        if self._items is None:
+            self._items = [self._record(position) for position in range(len(self._ids))]
+            if self._full is None:
+                self._full = np.asarray(self._vectors, dtype=np.float32) * (self._scales if self._scales is not None else 1)
+            self._full = np.array(self._full, dtype=np.float32)
+            self._vectors = None
+            self._scales = None
+
+            # Release the memory maps so the files can be replaced (Windows refuses to replace mapped files)
+            if isinstance(self._records, mmap.mmap):
+                self._records.close()
+            self._records = b''
+            self._offsets = np.zeros(1, dtype=np.int64)
+            self._ids = np.empty(0, dtype='S1')
+
+    def _full_vectors(self):
+        # Concatenates the pending batches onto the full vectors
+        if self._pending_vectors:
+            batches = [self._full, *self._pending_vectors] if len(self._full) else self._pending_vectors
+            self._full = np.concatenate(batches)
+            self._pending_vectors = []
+        return self._full
+
+    # ------------------------------------------------------------------
+    # Mutation
+    # ------------------------------------------------------------------
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        """
+        Adds texts with precomputed embeddings.
+
+        Parameters
+        ----------
+        text_embeddings : iterable of (str, vector)
+            Texts and their embedding vectors.
+        metadatas : list of dict, optional
+            Metadata per text.
+        ids : list of str, optional
+            Ids per text; an id that already exists is replaced.
+
+        Returns
+        -------
+        list of str
+            The ids of the added texts.
+        """
+        text_embeddings = list(text_embeddings)
+        texts = [text for text, _ in text_embeddings]
+        vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(position) for position in range(len(self), len(self) + len(texts))]
+
+        self.delete([chunk_id for chunk_id in ids if chunk_id in self._positions_by_id()])
+        self._materialize()
+
+        positions_by_id = self._positions_by_id()
+        for position, chunk_id in enumerate(ids, start=len(self._items)):
+            positions_by_id[chunk_id] = position
+        self._pending_vectors.append(normalize_rows(vectors))
+        self._vectors = None
+        self._items.extend(zip(ids, texts, [dict(metadata or {}) for metadata in metadatas]))
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return True
+        positions_by_id = self._positions_by_id()
+        doomed = {positions_by_id[chunk_id] for chunk_id in ids if chunk_id in positions_by_id}
+        if not doomed:
+            return False
+        self._materialize()
+        keep = [position for position in range(len(self._items)) if position not in doomed]
+        self._items = [self._items[position] for position in keep]
+        self._full = self._full_vectors()[keep]
+        self._vectors = None
+        self._position_by_id = None
+        return True
+
+    def get_by_ids(self, ids):
+        positions_by_id = self._positions_by_id()
+        return [self.document_at(positions_by_id[chunk_id]) for chunk_id in ids if chunk_id in positions_by_id]
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    @property
+    def is_compact(self):
+        """
+        Tells whether the searched vectors are an approximation (float16, int8 or truncated) of the full ones.
+        """
+        full = self._full_vectors()
+        truncated = self.dimensions > 0 and (full is None or self.dimensions < full.shape[1])
+        return self.dtype != np.float32 or truncated
+
+    def _searched_vectors(self):
+        if self._vectors is None:
+            full = self._full_vectors()
+            if self.is_compact:
+                self._vectors, self._scales = encode_vectors(full, self.dtype, self.dimensions)
+            else:
+                self._vectors, self._scales = full, None
+        return self._vectors, self._scales
+
+    def memory_usage(self):
+        """
+        Returns the bytes of the searched vectors (`searched_bytes`, resident while searching) and of the
+        full vectors kept for re-scoring (`full_bytes`, mostly left on disk).
+        """
+        vectors, scales = self._searched_vectors()
+        full_bytes = self._full.nbytes if self._full is not None and self._full is not vectors else 0
+        return {
+            'searched_bytes': int(vectors.nbytes + (scales.nbytes if scales is not None else 0)),
+            'full_bytes': int(full_bytes)
+        }
+
+    @staticmethod
+    def _top_k(scores, k):
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def search_matrix(self, query_vectors, k):
+        """
+        Cosine top-k for a batch of query vectors, re-scored exactly when the searched vectors are compact.
+
+        Parameters
+        ----------
+        query_vectors : numpy.ndarray
+            A matrix with one query embedding per row.
+        k : int
+            Number of results per query.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            `(positions, scores)`, both of shape (n_queries, min(k, len(self))), best match first.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        total = len(self)
+        k = min(k, total)
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        vectors, scales = self._searched_vectors()
+        search_queries = queries
+        if vectors.shape[1] < queries.shape[1]:
+            search_queries = normalize_rows(queries[:, :vectors.shape[1]])
+        if scales is not None:
+            # Folding the per-dimension scales into the queries scores the int8 codes without decoding them
+            search_queries = search_queries * scales
+
+        rescore = self._full is not None and self._full is not vectors and self.rescore_factor > 0
+        candidate_count = min(total, k * self.rescore_factor) if rescore else k
+
+        # Keep a running top `candidate_count` per query, so only one block of scores is held at a time
+        candidates = np.empty((len(queries), 0), dtype=np.int64)
+        candidate_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, SEARCH_BLOCK_SIZE):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_SIZE], dtype=np.float32)
+            block_best, block_best_scores = self._top_k(search_queries @ block.T, min(candidate_count, len(block)))
+            merged_positions = np.concatenate([candidates, block_best + start], axis=1)
+            merged_scores = np.concatenate([candidate_scores, block_best_scores], axis=1)
+            best, candidate_scores = self._top_k(merged_scores, min(candidate_count, merged_scores.shape[1]))
+            candidates = np.take_along_axis(merged_positions, best, axis=1)
+        if not rescore:
+            return candidates, candidate_scores
+
+        # Re-score the candidates exactly; sorted positions read the memory-mapped full vectors front to back
+        positions = np.empty((len(queries), k), dtype=np.int64)
+        exact_scores = np.empty((len(queries), k), dtype=np.float32)
+        for row, (query, candidate_positions) in enumerate(zip(queries, np.sort(candidates, axis=1))):
+            exact = np.asarray(self._full[candidate_positions], dtype=np.float32) @ query
+            best = np.argsort(-exact)[:k]
+            positions[row] = candidate_positions[best]
+            exact_scores[row] = exact[best]
+        return positions, exact_scores
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        positions, scores = self.search_matrix(np.asarray([embedding]), k)
+        return [(self.document_at(int(position)), float(score)) for position, score in zip(positions[0], scores[0])]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already
+        return lambda score: score
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save_local(self, folder_path):
+        """
+        Writes the store to `folder_path` and memory-maps the written files.
+
+        Parameters
+        ----------
+        folder_path : str
+            Directory the store is persisted to.
+        """
+        os.makedirs(folder_path, exist_ok=True)
+        self._materialize()
+        items = self._items
+
+        records = bytearray()
+        offsets = np.zeros(len(items) + 1, dtype=np.int64)
+        for position, (_, text, metadata) in enumerate(items):
+            records += json.dumps({'text': text, 'metadata': metadata}, default=str).encode('utf-8')
+            offsets[position + 1] = len(records)
+        ids = np.array([chunk_id.encode('utf-8') for chunk_id, _, _ in items], dtype='S')
+
+        # Write every file under a temporary name first, then swap them into place
+        vectors, scales = self._searched_vectors()
+        columns = {VECTORS_FILE_NAME: vectors, OFFSETS_FILE_NAME: offsets, IDS_FILE_NAME: ids}
+        if scales is not None:
+            columns[SCALES_FILE_NAME] = scales
+        if vectors is not self._full:
+            columns[FULL_VECTORS_FILE_NAME] = self._full
+        for file_name, column in columns.items():
+            with open(os.path.join(folder_path, file_name + '.tmp'), 'wb') as file:
+                np.save(file, column)
+        with open(os.path.join(folder_path, RECORDS_FILE_NAME + '.tmp'), 'wb') as file:
+            file.write(records)
+        for file_name in [*columns, RECORDS_FILE_NAME]:
+            os.replace(os.path.join(folder_path, file_name + '.tmp'), os.path.join(folder_path, file_name))
+
+        # Drop the scales and full vectors of a previous, differently encoded save
+        for file_name in (SCALES_FILE_NAME, FULL_VECTORS_FILE_NAME):
+            if file_name not in columns and os.path.exists(os.path.join(folder_path, file_name)):
+                os.remove(os.path.join(folder_path, file_name))
+
+        self._open(folder_path)
+
+    def _open(self, folder_path):
+        self._vectors = np.load(os.path.join(folder_path, VECTORS_FILE_NAME), mmap_mode='r')
+        self._offsets = np.load(os.path.join(folder_path, OFFSETS_FILE_NAME), mmap_mode='r')
+        self._ids = np.load(os.path.join(folder_path, IDS_FILE_NAME), mmap_mode='r')
+        scales_path = os.path.join(folder_path, SCALES_FILE_NAME)
+        self._scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        full_path = os.path.join(folder_path, FULL_VECTORS_FILE_NAME)
+        self._full = np.load(full_path, mmap_mode='r') if os.path.exists(full_path) else None
+        self._pending_vectors = []
+        self.dtype = self._vectors.dtype
+        truncated = self._full is not None and self._full.shape[1] != self._vectors.shape[1]
+        self.dimensions = self._vectors.shape[1] if truncated else 0
+        records_path = os.path.join(folder_path, RECORDS_FILE_NAME)
+        if os.path.getsize(records_path):
+            with open(records_path, 'rb') as file:
+                self._records = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._records = b''
+        self._items = None
+        self._position_by_id = None
+
+    @classmethod
+    def exists(cls, folder_path):
+        """
+        Tells whether a persisted store exists in `folder_path`.
+        """
+        return os.path.exists(os.path.join(folder_path, VECTORS_FILE_NAME))
+
+    @classmethod
+    def load_local(cls, folder_path, embeddings, rescore_factor=4):
+        """
+        Memory-maps a persisted store; its dtype and dimensions are the ones it was saved with.
+
+        Parameters
+        ----------
+        folder_path : str
+            Directory the store was persisted to.
+        embeddings : Embeddings
+            Embedding model used to embed queries.
+        rescore_factor : int, optional
+            Candidates re-scored exactly per result; see the class docstring. Defaults to 4.
+
+        Returns
+        -------
+        NumpyVectorStore
+            The loaded store.
+        """
+        store = cls(embedding=embeddings, rescore_factor=rescore_factor)
+        store._open(folder_path)
+        return store
+
+    @classmethod
+    def from_embeddings(cls, text_embeddings, embedding, metadatas=None, ids=None, dtype='float32',
+                        dimensions=0, rescore_factor=4, **kwargs):
+        store = cls(embedding=embedding, dtype=dtype, dimensions=dimensions, rescore_factor=rescore_factor)
+        store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, dtype='float32',
+                   dimensions=0, rescore_factor=4, **kwargs):
+        store = cls(embedding=embedding, dtype=dtype, dimensions=dimensions, rescore_factor=rescore_factor)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
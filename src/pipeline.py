@@ -1,10 +1,18 @@
-from src.data_loader import data_loader
+import os
+from src.data_loader import data_loader, IngestLedger
 from src.data_splitter import data_splitter
 from src.embedder import embedder
-from src.vectordb_builder import create_vector_store_db
+from src.vectordb_builder import (
+    create_vector_store_db, get_persist_directory, load_vectorstore_retriever, INGEST_LEDGER_FILE_NAME
+)
+from src.hybrid_retriever import build_hybrid_retriever
+from src.index_snapshots import build_index_snapshot, is_current_snapshot_up_to_date
 from src.prompt_builder import build_prompt_chain
 from src.run_retriever_chain import invoke_chain
+from src.batch_query import run_batch_queries
 from src.config_loader import get_config
+from src.metrics import instrument, write_prometheus_file
+from src.model_clients import get_model_client_registry
 from src.logger import log_component_start, log_component_end, logger_for_pipeline_code
 
 
@@ -16,12 +24,17 @@ def run_pipeline():
     
     Workflow Steps
     --------------
-    1. Load raw data using the `data_loader` component.
+    1. Load raw data using the `data_loader` component, skipping files unchanged since the last ingest.
     2. Split the loaded data into chunks using `data_splitter`.
     3. Initialize and configure the embedding model using `embedder`.
-    4. Create a vector database (FAISS or Chroma) using `create_vector_store_db`.
+    4. Create a vector database (FAISS, Chroma or NumPy) using `create_vector_store_db`, or a sharded
+       one using `create_sharded_vector_store_db` when `vector_shards -> shard_count` is above 1, and
+       wrap its retriever into a hybrid BM25 + dense retriever using `build_hybrid_retriever`.
+       Steps 1 to 4 build into a new index snapshot (`build_index_snapshot`), published once they succeed;
+       they are skipped, and the current snapshot is served, when no data file or index setting changed.
     5. Construct a retrieval chain by combining the retriever and prompt via `build_prompt_chain`.
-    6. Invoke the retrieval chain with a configured query using `invoke_chain`.
+    6. Invoke the retrieval chain with a configured query using `invoke_chain`, or, in batch mode,
+       answer a file of questions using `run_batch_queries`.
     
     Returns
     -------
@@ -32,6 +45,8 @@ def run_pipeline():
     - Configuration values such as vector store type and query are fetched using `get_config()`.
     - Logging is used at every stage to ensure traceability and debugging support.
     - If an error occurs during execution, it is logged and then re-raised to halt execution.
+    - Every component records its wall time, CPU time, item counts and errors in `src.metrics`;
+      the metrics are written to `metrics -> prometheus_path` at the end of the run.
     """
     # Load configuration file
     config = get_config()
@@ -40,35 +55,79 @@ def run_pipeline():
     try:
         # Start pipeline logging
         log_component_start(logger_for_pipeline_code, 'Pipeline Component')
-        logger_for_pipeline_code.info('Pipeline execution has started')
 
-        # Step 1: Load raw input data
-        loaded_data = data_loader()
+        with instrument('pipeline'):
+            logger_for_pipeline_code.info('Pipeline execution has started')
 
-        # Step 2: Split data into smaller chunks for processing
-        data_splits = data_splitter(loaded_data=loaded_data)
+            # Sharded and unsharded builds of a store keep separate ingest ledgers
+            sharded = int(config["vector_shards"]["shard_count"]) > 1
+            if sharded:
+                from src.sharded_vectordb import create_sharded_vector_store_db, SHARDED_INGEST_LEDGER_FILE_NAME
+            ledger_file_name = SHARDED_INGEST_LEDGER_FILE_NAME if sharded else INGEST_LEDGER_FILE_NAME
+            embedding_model = config["ollama_embedding"]["embedding_model"]
 
-        # Step 3: Create embedding model and return updated data_splits
-        ollama_embedding, data_splits = embedder(data_splits=data_splits)
+            if is_current_snapshot_up_to_date(vector_store, embedding_model, ledger_file_name):
+                # Nothing changed since the current snapshot was built, so it is served as is instead of copied
+                logger_for_pipeline_code.info('Data and index settings unchanged, the current index snapshot is reused')
+                ollama_embedding = None
+                persist_directory = get_persist_directory(vector_store)
+                retriever = build_hybrid_retriever(
+                    retriever=load_vectorstore_retriever(
+                        vector_storedb=vector_store, embedding_model=embedding_model, persist_directory=persist_directory
+                    ),
+                    vector_storedb=vector_store,
+                    persist_directory=persist_directory
+                )
+            else:
+                # Steps 1-4 build into a new index snapshot; serving processes swap to it once it is published
+                with build_index_snapshot(vector_store):
+                    # Step 1: Load raw input data, skipping files unchanged since the last ingest
+                    ingest_ledger = IngestLedger(os.path.join(get_persist_directory(vector_store), ledger_file_name))
+                    loaded_data = data_loader(ingest_ledger=ingest_ledger)
 
-        # Step 4: Build the vector store and obtain a retriever
-        retriever = create_vector_store_db(
-            data_splits=data_splits,
-            embedder=ollama_embedding,
-            vector_storedb=vector_store
-        )
+                    # Step 2: Split data into smaller chunks for processing
+                    data_splits = data_splitter(loaded_data=loaded_data)
 
-        # Step 5: Build the LLM-powered prompt chain using the retriever
-        retriever_chain = build_prompt_chain(retriever=retriever)
+                    # Step 3: Create embedding model and return updated data_splits
+                    ollama_embedding, data_splits = embedder(data_splits=data_splits)
 
-        # Step 6: Execute the retrieval chain with a configured query
-        invoke_chain(retrieval_chain=retriever_chain)
+                    # Step 4: Build the vector store (or its shards, in parallel processes) and obtain a retriever
+                    build_vector_store = create_sharded_vector_store_db if sharded else create_vector_store_db
+                    retriever = build_vector_store(
+                        data_splits=data_splits,
+                        embedder=ollama_embedding,
+                        vector_storedb=vector_store,
+                        ingest_ledger=ingest_ledger
+                    )
 
-        # End pipeline logging
-        logger_for_pipeline_code.info('Pipeline execution has finished')
-        log_component_end(logger_for_pipeline_code, 'Pipeline Component')
+                    # Add BM25 keyword search over the same chunks when hybrid retrieval is enabled
+                    retriever = build_hybrid_retriever(retriever=retriever, vector_storedb=vector_store)
+
+            # Report how much work the embedding cache saved
+            if hasattr(ollama_embedding, 'log_stats'):
+                ollama_embedding.log_stats()
+
+            # Step 5: Build the LLM-powered prompt chain using the retriever
+            retriever_chain = build_prompt_chain(retriever=retriever)
+
+            # Step 6: Execute the retrieval chain with a configured query, or answer a file of questions
+            if config["batch_query"]["enabled"]:
+                run_batch_queries(retriever=retriever)
+            else:
+                invoke_chain(retrieval_chain=retriever_chain)
+
+            # Report the model server requests made, and how many were coalesced
+            get_model_client_registry().log_stats()
+
+            # End pipeline logging
+            logger_for_pipeline_code.info('Pipeline execution has finished')
+            log_component_end(logger_for_pipeline_code, 'Pipeline Component')
     
     except Exception as pl_e:
         # Log if any step in the pipeline fails
-        logger_for_pipeline_code.debug(f'Error encountered during execution of the pipeline. error {pl_e}')
+        logger_for_pipeline_code.debug('Error encountered during execution of the pipeline. error %s', pl_e)
         raise
+
+    finally:
+        # Export the per-component metrics of this run
+        write_prometheus_file()
@@ -1,11 +1,64 @@
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms import Ollama
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
+from src.reranker import build_reranking_retriever
+from src.context_packer import build_context_packing_retriever
 from src.logger import log_component_start, log_component_end, logger_for_prompt_builder
 from src.config_loader import get_config
+from src.metrics import instrument
+from src.model_clients import build_ollama_llm
 
-def build_prompt_chain(retriever):
+# Answer prompt of conversational chains, laid out stable-prefix-first: the fixed instruction, then the
+# conversation (which only grows between summarizations), then the context and question of the turn
+CONVERSATIONAL_PROMPT_TEMPLATE = "{system_instruction}\n\nConversation so far:\n{chat_history}\n\nContext:\n{context}\n\nQuestion: {input}"
+
+# Prompt rewriting a follow-up question into a standalone question before retrieval, laid out the same way
+QUESTION_REWRITE_PROMPT_TEMPLATE = (
+    "Rewrite the user's latest question as a standalone question that can be understood without the "
+    "conversation. Reply with the question only.\n\nConversation so far:\n{chat_history}\n\n"
+    "Latest question: {input}\n\nStandalone question:"
+)
+
+def build_document_chain(llm=None):
+    """
+    Builds the document combination chain that answers a question from already retrieved documents.
+
+    Parameters
+    ----------
+    llm : BaseLanguageModel, optional
+        The LLM answering the question. Defaults to the Ollama model set in the config.
+
+    Returns
+    -------
+    Runnable
+        A "stuff" documents chain taking `{"input": ..., "context": [Document, ...]}` and returning the answer text.
+
+    Notes
+    -----
+    - The system instruction for the prompt template is loaded from the configuration file.
+    - Ollama LLM is initialized using the model specified in the config, and asks the Ollama server
+      to keep the model loaded for `keep_alive` between requests. Its requests go through the shared
+      model client registry (`src.model_clients`).
+    - LangChain's chain modules are imported here rather than at module import, to keep
+      start-up fast for commands that never build a chain.
+    """
+    from langchain.prompts import ChatPromptTemplate
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    # Load configuration values
+    config = get_config()
+    ollama_llm = config["ollama_model"]["ollama_llm"]
+    system_instruction = config["chatprompttemplate_system_instruction"]
+
+    # Initialize the Ollama LLM using the model from config, unless one was passed in
+    if llm is None:
+        llm = build_ollama_llm(ollama_llm)
+        logger_for_prompt_builder.info('Selected LLM model: %s', ollama_llm)
+
+    # Create a chat prompt template using the system instruction from config
+    prompt = ChatPromptTemplate.from_template(system_instruction)
+
+    # Create a document combination chain (stuff method)
+    return create_stuff_documents_chain(llm=llm, prompt=prompt)
+
+def build_prompt_chain(retriever, llm=None):
     """
     Builds a LangChain retrieval chain using an Ollama LLM, a document combination chain,
     and a prompt template loaded from configuration.
@@ -14,6 +67,8 @@ def build_prompt_chain(retriever):
     ----------
     retriever : BaseRetriever
         A retriever instance used to fetch relevant documents based on input queries.
+    llm : BaseLanguageModel, optional
+        The LLM answering the question. Defaults to the Ollama model set in the config.
 
     Returns
     -------
@@ -23,39 +78,102 @@ def build_prompt_chain(retriever):
     Notes
     -----
     - The system instruction for the prompt template is loaded from the configuration file.
-    - Ollama LLM is initialized using the model specified in the config.
+    - Ollama LLM is initialized using the model specified in the config, and asks the Ollama server
+      to keep the model loaded for `keep_alive` between requests.
     - Logging is used to trace component execution and any errors encountered.
     - The `ChatPromptTemplate` defines how retrieved documents are used within the LLM chain.
+    - With `reranking -> enabled`, a wider candidate set is retrieved and re-ranked by `build_reranking_retriever`.
+    - With `context_packing -> enabled`, retrieved chunks are merged and trimmed to a token budget
+      by `build_context_packing_retriever` before they are stuffed into the prompt.
     """
     try:
         # Start logging for the Prompt Builder component
         log_component_start(logger_for_prompt_builder, 'Prompt Builder Component')
 
-        # Load configuration values
-        config = get_config()
-        ollama_llm = config["ollama_model"]["ollama_llm"]
-        system_instruction = config["chatprompttemplate_system_instruction"]
-
-        # Initialize the Ollama LLM using the model from config
-        llm = Ollama(model=ollama_llm)
-        logger_for_prompt_builder.info(f'Selected LLM model: {ollama_llm}')
-
-        # Create a chat prompt template using the system instruction from config
-        prompt = ChatPromptTemplate.from_template(system_instruction)
+        with instrument('prompt_builder'):
+            # Create a document combination chain (stuff method)
+            doc_chain = build_document_chain(llm=llm)
 
-        # Create a document combination chain (stuff method)
-        doc_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
+            # Re-rank a wider candidate set, then pack the kept chunks into the token budget
+            retriever = build_reranking_retriever(retriever)
+            retriever = build_context_packing_retriever(retriever)
 
-        # Build the retrieval chain by combining retriever with the document chain
-        retrieval_chain = create_retrieval_chain(retriever=retriever, combine_docs_chain=doc_chain)
+            # Build the retrieval chain by combining retriever with the document chain
+            from langchain.chains import create_retrieval_chain
+            retrieval_chain = create_retrieval_chain(retriever=retriever, combine_docs_chain=doc_chain)
 
-        logger_for_prompt_builder.info('Retrievel chain built')
-        log_component_end(logger_for_prompt_builder, 'Prompt Builder Component')
+            logger_for_prompt_builder.info('Retrievel chain built')
+            log_component_end(logger_for_prompt_builder, 'Prompt Builder Component')
 
-        # Return the assembled retrieval chain
-        return retrieval_chain
+            # Return the assembled retrieval chain
+            return retrieval_chain
     
     except Exception as e:
         # Log any error that occurs during prompt chain construction
-        logger_for_prompt_builder.debug(f'Error encountered in prompt builder component. error: {e}')
+        logger_for_prompt_builder.debug('Error encountered in prompt builder component. error: %s', e)
+        log_component_end(logger_for_prompt_builder, 'Prompt Builder Component')
+
+def build_conversational_chain(retriever, llm=None, system_instruction=None):
+    """
+    Builds a retrieval chain answering questions within a conversation.
+
+    Parameters
+    ----------
+    retriever : BaseRetriever
+        A retriever instance used to fetch relevant documents based on input queries.
+    llm : BaseLanguageModel, optional
+        The LLM rewriting and answering questions. Defaults to the Ollama model set in the config.
+    system_instruction : str, optional
+        Instruction at the top of the answer prompt. Defaults to `conversation -> system_instruction`.
+
+    Returns
+    -------
+    RetrievalChain
+        A retrieval chain taking `{"input": ..., "chat_history": ...}`, where `chat_history` is the
+        session's history text (see `ChatSession.history_text`), and returning the answer and its context.
+
+    Notes
+    -----
+    - With `conversation -> rewrite_questions`, a question asked after earlier turns is first rewritten by
+      the LLM into a standalone question, which is what gets retrieved (and re-ranked) for; the first
+      question of a session is retrieved for as it is.
+    - Both prompts put what changes least first (instruction, conversation, then the turn's context and
+      question), so consecutive turns share a long prompt prefix the model server can reuse from its cache.
+    - Re-ranking and context packing are applied as in `build_prompt_chain`.
+    """
+    try:
+        log_component_start(logger_for_prompt_builder, 'Prompt Builder Component')
+
+        with instrument('prompt_builder'):
+            from langchain.prompts import ChatPromptTemplate
+            from langchain.chains.combine_documents import create_stuff_documents_chain
+            from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+
+            config = get_config()
+            conversation_config = config['conversation']
+            if llm is None:
+                llm = build_ollama_llm(config["ollama_model"]["ollama_llm"])
+                logger_for_prompt_builder.info('Selected LLM model: %s', config["ollama_model"]["ollama_llm"])
+
+            # Re-rank a wider candidate set, then pack the kept chunks into the token budget
+            retriever = build_reranking_retriever(retriever)
+            retriever = build_context_packing_retriever(retriever)
+
+            # Retrieve for a standalone version of follow-up questions
+            if conversation_config['rewrite_questions']:
+                rewrite_prompt = ChatPromptTemplate.from_template(QUESTION_REWRITE_PROMPT_TEMPLATE)
+                retriever = create_history_aware_retriever(llm, retriever, rewrite_prompt)
+
+            prompt = ChatPromptTemplate.from_template(CONVERSATIONAL_PROMPT_TEMPLATE).partial(
+                system_instruction=system_instruction or conversation_config['system_instruction']
+            )
+            doc_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
+            retrieval_chain = create_retrieval_chain(retriever=retriever, combine_docs_chain=doc_chain)
+
+            logger_for_prompt_builder.info('Conversational retrieval chain built')
+            log_component_end(logger_for_prompt_builder, 'Prompt Builder Component')
+            return retrieval_chain
+
+    except Exception as e:
+        logger_for_prompt_builder.debug('Error encountered in prompt builder component. error: %s', e)
         log_component_end(logger_for_prompt_builder, 'Prompt Builder Component')
@@ -0,0 +1,146 @@
+import json
+import os
+import time
+import numpy as np
+from src.embedder import embed_in_batches, build_embedding_model
+from src.numpy_vectorstore import NumpyVectorStore
+from src.vectordb_builder import load_vectorstore_retriever, iterate_stored_chunks
+from src.config_loader import get_config
+from src.logger import log_component_start, log_component_end, logger_for_quantization_report
+
+def load_stored_vectors(vector_storedb, embedding_model):
+    """
+    Embeds every chunk of the persisted vector store again, giving the exact float32 vectors.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy') whose chunks form the corpus.
+    embedding_model : str
+        The Ollama embedding model the store was built with.
+
+    Returns
+    -------
+    numpy.ndarray
+        A float32 matrix with one chunk embedding per row; with the embedding cache enabled this is all cache hits.
+    """
+    vector_db = load_vectorstore_retriever(vector_storedb, embedding_model).vectorstore
+    texts = [text for _, text in iterate_stored_chunks(vector_db)]
+    return embed_in_batches(texts, build_embedding_model(embedding_model))
+
+def build_variant_store(base, dtype, dimensions, rescore_factor):
+    """
+    Builds an in-memory NumPy store of the base vectors with the given storage settings.
+    """
+    store = NumpyVectorStore(embedding=None, dtype=dtype, dimensions=dimensions, rescore_factor=rescore_factor)
+    store.add_embeddings(((str(position), vector) for position, vector in enumerate(base)))
+    return store
+
+def measure_store(store, queries, k, ground_truth):
+    """
+    Runs every query on its own against a store and measures recall and latency.
+
+    Parameters
+    ----------
+    store : NumpyVectorStore
+        The store to measure.
+    queries : numpy.ndarray
+        A float32 matrix with one query vector per row.
+    k : int
+        Number of neighbours retrieved per query.
+    ground_truth : numpy.ndarray
+        Positions of the exact k nearest neighbours of every query.
+
+    Returns
+    -------
+    dict
+        `recall_at_k` and the mean/p50/p95 per-query latency in milliseconds.
+    """
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, ground_truth):
+        started_at = time.perf_counter()
+        positions, _ = store.search_matrix(query[np.newaxis, :], k)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        found += len(set(positions[0].tolist()) & set(expected.tolist()))
+    latencies = np.array(latencies)
+    return {
+        'recall_at_k': round(found / (len(queries) * k), 4),
+        'latency_ms_mean': round(float(latencies.mean()), 4),
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 4),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 4)
+    }
+
+def run_quantization_report():
+    """
+    Compares compact storage variants of the NumPy backend (float16, int8, truncated dimensions) against
+    exact float32 search, side by side on memory and recall@k.
+
+    Returns
+    -------
+    list of dict
+        One row per variant, also written as JSON to `quantization_report -> output_path`.
+
+    Notes
+    -----
+    - Run `main.py` first; the chunks of the persisted store selected by `vector_store_db` are the corpus.
+    - `num_queries` chunks are held out of every store and used as queries, so no query finds itself.
+    - Recall@k is measured against the exact float32 cosine neighbours of every query.
+    - `searched_mb` is what a search scans (and keeps resident); `full_mb` is the full-precision copy
+      kept on disk for re-scoring, of which only the candidates' rows are read.
+    """
+    try:
+        log_component_start(logger_for_quantization_report, 'Quantization Report Component')
+
+        config = get_config()
+        report_config = config['quantization_report']
+
+        vectors = load_stored_vectors(config['vector_store_db'], config['ollama_embedding']['embedding_model'])
+        num_queries = min(int(report_config['num_queries']), len(vectors) // 2)
+        held_out = np.zeros(len(vectors), dtype=bool)
+        held_out[np.random.default_rng(0).choice(len(vectors), size=num_queries, replace=False)] = True
+        queries, base = vectors[held_out], vectors[~held_out]
+        k = min(int(report_config['k']), len(base))
+        logger_for_quantization_report.info(
+            'Stored vectors: %s of %s dimensions, held-out queries: %s, k: %s', len(base), base.shape[1], len(queries), k
+        )
+
+        # Exact float32 search gives the neighbours every variant is measured against
+        exact_store = build_variant_store(base, 'float32', 0, 0)
+        ground_truth, _ = exact_store.search_matrix(queries, k)
+
+        rows = []
+        variants = [{'dtype': 'float32', 'dimensions': 0, 'rescore_factor': 0}, *report_config['variants']]
+        for variant in variants:
+            store = exact_store if variant['dtype'] == 'float32' and not variant['dimensions'] else build_variant_store(base, **variant)
+            store.rescore_factor = int(variant['rescore_factor'])
+            memory = store.memory_usage()
+            rows.append({
+                **variant,
+                'searched_mb': round(memory['searched_bytes'] / 1e6, 3),
+                'full_mb': round(memory['full_bytes'] / 1e6, 3),
+                **measure_store(store, queries, k, ground_truth)
+            })
+
+        for row in rows:
+            logger_for_quantization_report.info(
+                '%-7s dims: %-5s rescore: %-3s recall@%s: %.4f  p50: %.3f ms  p95: %.3f ms  searched: %.1f MB  full: %.1f MB',
+                row['dtype'], row['dimensions'] or 'all', row['rescore_factor'], k, row['recall_at_k'],
+                row['latency_ms_p50'], row['latency_ms_p95'], row['searched_mb'], row['full_mb']
+            )
+
+        output_path = report_config['output_path']
+        output_directory = os.path.dirname(output_path)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as file:
+            json.dump({'stored_vectors': len(base), 'dimensions': int(base.shape[1]), 'queries': len(queries), 'k': k, 'results': rows}, file, indent=2)
+        logger_for_quantization_report.info('Quantization report written to: %s', output_path)
+
+        log_component_end(logger_for_quantization_report, 'Quantization Report Component')
+        return rows
+
+    except Exception as e:
+        logger_for_quantization_report.debug('Error encountered in quantization report component. error: %s', e)
+        log_component_end(logger_for_quantization_report, 'Quantization Report Component')
+        raise
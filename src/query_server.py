@@ -0,0 +1,400 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.vectordb_builder import get_snapshot_directory, load_vectorstore_retriever
+from src.hybrid_retriever import build_hybrid_retriever
+from src.prompt_builder import build_prompt_chain, build_conversational_chain
+from src.chat_sessions import build_session_store, update_session_store, answer_in_session
+from src.index_snapshots import get_current_snapshot, retire_vector_store, start_snapshot_watcher
+from src.config_loader import get_config, add_config_listener, start_config_watcher
+from src.metrics import instrument, get_metrics_registry
+from src.logger import log_component_start, log_component_end, logger_for_query_server
+
+# Reason phrases for the status codes the server sends
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+def build_serving_chains(search_retriever, conversational):
+    """
+    Builds the retrieval chain, and the conversational chain when `conversational` is true, over a retriever.
+
+    Returns
+    -------
+    tuple
+        `(retrieval_chain, conversational_chain)`; the conversational chain is None when not requested.
+
+    Raises
+    ------
+    ValueError
+        If a chain could not be built; the prompt builder logs the cause and returns None.
+    """
+    retrieval_chain = build_prompt_chain(retriever=search_retriever)
+    if retrieval_chain is None:
+        raise ValueError('The retrieval chain could not be built, see the prompt builder logs')
+    conversational_chain = None
+    if conversational:
+        conversational_chain = build_conversational_chain(retriever=search_retriever)
+        if conversational_chain is None:
+            raise ValueError('The conversational chain could not be built, see the prompt builder logs')
+    return retrieval_chain, conversational_chain
+
+class QueryServer:
+    """
+    Long-lived HTTP query server answering questions against a warm retriever and chain.
+
+    The index, retriever and retrieval chain are built once at startup and reused for every request.
+    Questions are answered on a bounded thread pool; once `max_workers + max_pending` questions are
+    in flight, new ones are rejected with 503 instead of queueing without bound. When query-time
+    settings are hot-reloaded, only the affected components are rebuilt (see `reload_components`),
+    and a newly published index snapshot is loaded and swapped in without a restart (see `swap_index`).
+
+    Endpoints
+    ---------
+    POST /query
+        Body `{"question": "..."}`. Returns the answer, its sources and per-request timings.
+        With a `"session_id"` in the body (null starts a new session), the question is answered within
+        that session's conversation, and the response carries the `session_id` to send with the next question.
+    GET /health
+        Returns the server status, the index snapshot served and how long the index took to load at startup.
+    GET /metrics
+        Returns the per-component metrics in the Prometheus text format.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    vector_retriever : BaseRetriever
+        The retriever of the loaded vector store.
+    search_retriever : BaseRetriever
+        `vector_retriever`, wrapped by `build_hybrid_retriever`.
+    retrieval_chain : RetrievalChain
+        The warm retrieval chain used to answer questions.
+    conversational_chain : RetrievalChain or None
+        The warm chain answering questions within a session; None when conversations are disabled.
+    session_store : SessionStore or None
+        The bounded store of chat sessions; None when conversations are disabled.
+    index_snapshot : str or None
+        Name of the index snapshot loaded; None when snapshots are disabled.
+    max_workers : int
+        Number of questions answered concurrently.
+    max_pending : int
+        Number of questions allowed to wait for a worker.
+    startup_timings : dict
+        Timings measured while loading the index and building the chain.
+    """
+
+    def __init__(self, vector_storedb, vector_retriever, search_retriever, retrieval_chain, conversational_chain, session_store,
+                 index_snapshot, max_workers, max_pending, startup_timings):
+        self.vector_storedb = vector_storedb
+        self.vector_retriever = vector_retriever
+        self.search_retriever = search_retriever
+        self.retrieval_chain = retrieval_chain
+        self.conversational_chain = conversational_chain
+        self.session_store = session_store
+        self.index_snapshot = index_snapshot
+        self.max_in_flight = max_workers + max_pending
+        self.startup_timings = startup_timings
+        self.in_flight = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query-worker')
+        # Serializes settings reloads and index swaps, which both rebuild the chains
+        self._components_lock = threading.Lock()
+
+    def reload_components(self, changed_sections):
+        """
+        Rebuilds the components affected by hot-reloaded config sections; the loaded index is always kept.
+
+        A change of `hybrid_retrieval` rebuilds the hybrid retriever over the loaded snapshot (keeping a rebuilt
+        BM25 index in memory, since published snapshots are never modified), and a change of `conversation`
+        applies the new session limits to the session store (created or dropped when conversations are
+        enabled or disabled); any change rebuilds the chain (LLM, prompt, re-ranking and context packing) over it. The new chain replaces
+        the old one in a single assignment, so requests in flight finish on the chain they started with.
+        If any component fails to build, nothing is replaced and the current retriever and chains are kept.
+
+        Parameters
+        ----------
+        changed_sections : set of str
+            The query-time config sections that changed.
+        """
+        try:
+            started_at = time.perf_counter()
+            with self._components_lock:
+                search_retriever = self.search_retriever
+                if 'hybrid_retrieval' in changed_sections:
+                    search_retriever = build_hybrid_retriever(
+                        retriever=self.vector_retriever,
+                        vector_storedb=self.vector_storedb,
+                        persist_directory=get_snapshot_directory(self.vector_storedb, self.index_snapshot)
+                    )
+                session_store = self.session_store
+                if 'conversation' in changed_sections:
+                    session_store = update_session_store(session_store)
+                retrieval_chain, conversational_chain = build_serving_chains(search_retriever, session_store is not None)
+
+                self.search_retriever, self.retrieval_chain = search_retriever, retrieval_chain
+                self.conversational_chain, self.session_store = conversational_chain, session_store
+            logger_for_query_server.info(
+                'Rebuilt the chain for changed settings %s in %.2f ms',
+                ', '.join(sorted(changed_sections)), (time.perf_counter() - started_at) * 1000
+            )
+        except Exception as e:
+            logger_for_query_server.warning('Error encountered while rebuilding the chain, keeping the current one. error: %s', e)
+
+    def swap_index(self, index_snapshot):
+        """
+        Loads a newly published index snapshot and swaps it in, with the retrievers and chains built over it.
+
+        Everything is built on the calling (watcher) thread while requests keep being answered from the
+        current index; the new chains then replace the old ones in single assignments, so requests in
+        flight finish on the index they started with and no request is dropped. If any component fails
+        to build, this raises before anything is replaced and the current index keeps being served.
+
+        Parameters
+        ----------
+        index_snapshot : str
+            Name of the snapshot `CURRENT` points at.
+        """
+        with self._components_lock:
+            # Opened by name, not through `CURRENT`, which may already point at a later snapshot
+            persist_directory = get_snapshot_directory(self.vector_storedb, index_snapshot)
+            vector_retriever = load_vectorstore_retriever(
+                vector_storedb=self.vector_storedb,
+                embedding_model=get_config()['ollama_embedding']['embedding_model'],
+                persist_directory=persist_directory
+            )
+            search_retriever = build_hybrid_retriever(
+                retriever=vector_retriever, vector_storedb=self.vector_storedb, persist_directory=persist_directory
+            )
+            # Raises before anything is replaced if a chain cannot be built, so the watcher keeps the current index
+            retrieval_chain, conversational_chain = build_serving_chains(search_retriever, self.session_store is not None)
+
+            retired_retriever = self.vector_retriever
+            self.vector_retriever, self.search_retriever = vector_retriever, search_retriever
+            self.retrieval_chain, self.conversational_chain = retrieval_chain, conversational_chain
+            self.index_snapshot = index_snapshot
+        retire_vector_store(retired_retriever.vectorstore)
+
+    def _answer(self, question, submitted_at, session=None):
+        # Runs on a worker thread
+        started_at = time.perf_counter()
+        if session is None:
+            response = self.retrieval_chain.invoke({"input": question})
+        else:
+            response = answer_in_session(self.conversational_chain, session, question)
+        finished_at = time.perf_counter()
+        result = {
+            'answer': response['answer'],
+            'sources': [document.metadata for document in response.get('context', [])],
+            'timing': {
+                'queue_ms': round((started_at - submitted_at) * 1000, 2),
+                'chain_ms': round((finished_at - started_at) * 1000, 2)
+            }
+        }
+        if session is not None:
+            result['session_id'] = session.session_id
+            result['turn'] = session.turn_count
+        return result
+
+    async def _handle_query(self, body):
+        try:
+            request = json.loads(body or b'{}')
+            question = request['question']
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': 'Request body must be JSON of the form {"question": "..."}'}
+
+        session = None
+        if 'session_id' in request:
+            if self.session_store is None:
+                return 400, {'error': 'Conversations are disabled, set conversation -> enabled in the config'}
+            session_id = request['session_id']
+            session = self.session_store.get(str(session_id) if session_id is not None else None)
+
+        if self.in_flight >= self.max_in_flight:
+            with instrument('query_server_rejected') as span:
+                span.add('rejected_queries')
+            return 503, {'error': 'Server is at capacity, retry later'}
+
+        self.in_flight += 1
+        submitted_at = time.perf_counter()
+        try:
+            with instrument('query_server_request') as span:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, self._answer, question, submitted_at, session)
+                span.add('queries')
+        finally:
+            self.in_flight -= 1
+        result['timing']['total_ms'] = round((time.perf_counter() - submitted_at) * 1000, 2)
+        logger_for_query_server.info('Answered question in %s ms', result['timing']['total_ms'])
+        return 200, result
+
+    async def _route(self, method, path, body):
+        if path == '/query':
+            if method != 'POST':
+                return 405, {'error': 'Use POST for /query'}
+            return await self._handle_query(body)
+        if path == '/metrics':
+            registry = get_metrics_registry()
+            if registry is None:
+                return 404, {'error': 'Metrics are disabled, set metrics -> enabled in the config'}
+            return 200, registry.render_prometheus()
+        if path == '/health':
+            sessions = len(self.session_store) if self.session_store is not None else None
+            return 200, {
+                'status': 'ok', 'in_flight': self.in_flight, 'sessions': sessions,
+                'index_snapshot': self.index_snapshot, 'startup': self.startup_timings
+            }
+        return 404, {'error': f'Unknown path: {path}'}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves a single HTTP/1.1 request on an accepted connection.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Stream the request is read from.
+        writer : asyncio.StreamWriter
+            Stream the response is written to.
+        """
+        try:
+            request_line = (await reader.readline()).decode('latin-1').strip()
+            if not request_line:
+                return
+            method, path = request_line.split(' ')[:2]
+
+            headers = {}
+            while True:
+                header_line = (await reader.readline()).decode('latin-1').strip()
+                if not header_line:
+                    break
+                name, _, value = header_line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            try:
+                status, payload = await self._route(method, path.split('?')[0], body)
+            except Exception as e:
+                logger_for_query_server.debug('Error encountered while answering a request. error: %s', e)
+                status, payload = 500, {'error': str(e)}
+
+            # Text payloads (the Prometheus metrics) are sent as they are, everything else as JSON
+            if isinstance(payload, str):
+                response_body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+            else:
+                response_body, content_type = json.dumps(payload, default=str).encode('utf-8'), 'application/json'
+            writer.write(
+                f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Length: {len(response_body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1') + response_body
+            )
+            await writer.drain()
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+            logger_for_query_server.debug('Malformed request or dropped connection. error: %s', e)
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host, port):
+        """
+        Accepts connections on `host:port` until cancelled.
+
+        Parameters
+        ----------
+        host : str
+            Address to listen on.
+        port : int
+            Port to listen on.
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger_for_query_server.info('Query server listening on http://%s:%s', host, port)
+        async with server:
+            await server.serve_forever()
+
+def build_query_server():
+    """
+    Loads the persisted index once and builds a query server around a warm retriever and chain.
+
+    Returns
+    -------
+    QueryServer
+        The server, ready to be started with `serve_forever`.
+
+    Notes
+    -----
+    - The vector store type and embedding model are read from the config, as in `app.py`.
+    - The retriever is loaded with `load_vectorstore_retriever` (wrapped by `build_hybrid_retriever`)
+      and the chain built with `build_prompt_chain`; with `conversation -> enabled`, a conversational
+      chain (`build_conversational_chain`) and a bounded LRU session store are built as well.
+    - Index load and chain build times are logged and reported by `GET /health`.
+    - With `config_reload -> enabled`, the config file is watched and changed query-time settings are
+      applied with `QueryServer.reload_components`, without reloading the index.
+    - With `index_snapshots -> enabled`, the store's `CURRENT` pointer is watched and newly published
+      snapshots are swapped in with `QueryServer.swap_index`.
+    """
+    try:
+        log_component_start(logger_for_query_server, 'Query Server Component')
+
+        with instrument('query_server_startup'):
+            config = get_config()
+            server_config = config['query_server']
+
+            # Load the index once; every request reuses this retriever until a new snapshot is swapped in
+            started_at = time.perf_counter()
+            index_snapshot = get_current_snapshot(config['vector_store_db'])
+            persist_directory = get_snapshot_directory(config['vector_store_db'], index_snapshot)
+            vector_retriever = load_vectorstore_retriever(
+                vector_storedb=config['vector_store_db'],
+                embedding_model=config['ollama_embedding']['embedding_model'],
+                persist_directory=persist_directory
+            )
+            search_retriever = build_hybrid_retriever(
+                retriever=vector_retriever, vector_storedb=config['vector_store_db'], persist_directory=persist_directory
+            )
+            index_loaded_at = time.perf_counter()
+
+            # Build the chains once; the Ollama client inside them stays warm between requests
+            session_store = build_session_store()
+            retrieval_chain, conversational_chain = build_serving_chains(search_retriever, session_store is not None)
+            chain_built_at = time.perf_counter()
+
+            startup_timings = {
+                'index_load_ms': round((index_loaded_at - started_at) * 1000, 2),
+                'chain_build_ms': round((chain_built_at - index_loaded_at) * 1000, 2)
+            }
+            logger_for_query_server.info('Query server ready. startup timings: %s', startup_timings)
+
+            query_server = QueryServer(
+                vector_storedb=config['vector_store_db'],
+                vector_retriever=vector_retriever,
+                search_retriever=search_retriever,
+                retrieval_chain=retrieval_chain,
+                conversational_chain=conversational_chain,
+                session_store=session_store,
+                index_snapshot=index_snapshot,
+                max_workers=int(server_config['max_workers']),
+                max_pending=int(server_config['max_pending']),
+                startup_timings=startup_timings
+            )
+
+            # Apply query-time config changes without restarting
+            add_config_listener(query_server.reload_components)
+            start_config_watcher()
+
+            # Swap newly published index snapshots in without restarting
+            start_snapshot_watcher(config['vector_store_db'], query_server.swap_index, index_snapshot)
+
+            log_component_end(logger_for_query_server, 'Query Server Component')
+            return query_server
+
+    except Exception as e:
+        logger_for_query_server.debug('Error encountered while starting the query server. error: %s', e)
+        log_component_end(logger_for_query_server, 'Query Server Component')
+        raise
+
+def run_query_server():
+    """
+    Builds the query server and serves requests on the configured host and port until interrupted.
+    """
+    server_config = get_config()['query_server']
+    query_server = build_query_server()
+    asyncio.run(query_server.serve_forever(server_config['host'], int(server_config['port'])))
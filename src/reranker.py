@@ -0,0 +1,191 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+from src.vectordb_builder import compute_chunk_id
+from src.config_loader import get_config
+from src.metrics import instrument
+from src.logger import logger_for_reranker
+
+class ScoreCache:
+    """
+    Bounded, thread-safe LRU cache of re-ranking scores per (query, chunk) pair.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of scores kept; least recently used ones are evicted first.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query, document):
+        return hashlib.sha256(query.encode('utf-8')).hexdigest(), compute_chunk_id(document)
+
+    def get_many(self, keys):
+        """
+        Returns the cached score of every key, or None where a key is not cached.
+        """
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._scores.get(key)
+                if score is None:
+                    self.misses += 1
+                else:
+                    self._scores.move_to_end(key)
+                    self.hits += 1
+                scores.append(score)
+            return scores
+
+    def put_many(self, keys, scores):
+        """
+        Stores scores, evicting the least recently used ones beyond the size bound.
+        """
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Retriever that re-ranks a wide candidate set and keeps only the best `top_n` chunks.
+
+    The wrapped retriever is expected to return `fetch_k` candidates. With the `cross_encoder`
+    method, each (query, chunk) pair is scored by a small cross-encoder in batches; scores are
+    cached per pair, so repeated questions only score new candidates. With the `mmr` method, the
+    candidates are picked by maximal marginal relevance over their embeddings, trading relevance
+    against redundancy.
+    """
+
+    retriever: Any
+    """The retriever returning the candidate chunks."""
+    method: str = 'cross_encoder'
+    """'cross_encoder' or 'mmr'."""
+    top_n: int = 4
+    """Number of chunks kept."""
+    cross_encoder: Any = None
+    """The sentence_transformers CrossEncoder, for the cross_encoder method."""
+    embedding: Any = None
+    """The embedding model, for the mmr method."""
+    batch_size: int = 16
+    """Number of (query, chunk) pairs scored per cross-encoder batch."""
+    mmr_lambda: float = 0.5
+    """Relevance weight of MMR; 1 ignores redundancy, 0 only maximizes diversity."""
+    score_cache: Any = None
+    """The ScoreCache of cross-encoder scores."""
+
+    def _cross_encoder_scores(self, query, documents):
+        keys = [ScoreCache.make_key(query, document) for document in documents]
+        scores = self.score_cache.get_many(keys)
+        missing = [position for position, score in enumerate(scores) if score is None]
+        if missing:
+            fresh_scores = self.cross_encoder.predict(
+                [(query, documents[position].page_content) for position in missing],
+                batch_size=self.batch_size
+            )
+            fresh_scores = [float(score) for score in fresh_scores]
+            self.score_cache.put_many([keys[position] for position in missing], fresh_scores)
+            for position, score in zip(missing, fresh_scores):
+                scores[position] = score
+        return scores
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        documents = self.retriever.invoke(query, config={'callbacks': run_manager.get_child()} if run_manager else None)
+        if self.method == 'mmr' and len(documents) <= self.top_n:
+            return documents
+
+        # Only the re-ranking itself is measured; the wrapped retriever records its own time
+        with instrument('reranker') as span:
+            if self.method == 'mmr':
+                query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+                document_vectors = self.embedding.embed_documents([document.page_content for document in documents])
+                selected = maximal_marginal_relevance(query_vector, document_vectors, lambda_mult=self.mmr_lambda, k=self.top_n)
+            else:
+                scores = self._cross_encoder_scores(query, documents)
+                selected = sorted(range(len(documents)), key=lambda position: scores[position], reverse=True)[:self.top_n]
+            span.add('candidates', len(documents))
+
+        logger_for_reranker.info('Re-ranked %s candidates with %s, kept %s', len(documents), self.method, len(selected))
+        return [documents[position] for position in selected]
+
+def with_candidate_count(retriever, fetch_k):
+    """
+    Returns a copy of a retriever that returns `fetch_k` chunks.
+
+    Parameters
+    ----------
+    retriever : BaseRetriever
+        A VectorStoreRetriever (`search_kwargs['k']`) or a retriever with a `k` field, such as HybridRetriever.
+    fetch_k : int
+        Number of chunks to return.
+
+    Returns
+    -------
+    BaseRetriever
+        The adjusted copy.
+    """
+    if hasattr(retriever, 'search_kwargs'):
+        return retriever.model_copy(update={'search_kwargs': {**retriever.search_kwargs, 'k': fetch_k}})
+    return retriever.model_copy(update={'k': fetch_k})
+
+def build_reranking_retriever(retriever):
+    """
+    Wraps a retriever into a re-ranking stage, when enabled in the config.
+
+    Parameters
+    ----------
+    retriever : BaseRetriever
+        The retriever whose candidates are re-ranked; it is made to return `reranking -> fetch_k` chunks.
+
+    Returns
+    -------
+    BaseRetriever
+        A RerankingRetriever keeping `reranking -> top_n` chunks, or the given retriever when
+        `reranking -> enabled` is false.
+
+    Notes
+    -----
+    - The cross-encoder runs on the CPU; sentence_transformers (and torch) are only imported when it is used.
+    - The mmr method embeds candidates with the vector store's embedding model, so with the embedding
+      cache enabled their vectors are cache hits.
+    """
+    reranking_config = get_config()['reranking']
+    if not reranking_config['enabled']:
+        return retriever
+
+    method = reranking_config['method']
+    cross_encoder = None
+    embedding = None
+    if method == 'cross_encoder':
+        from sentence_transformers import CrossEncoder
+        cross_encoder = CrossEncoder(reranking_config['cross_encoder_model'], device='cpu')
+    elif method == 'mmr':
+        embedding = retriever.vectorstore.embeddings
+    else:
+        raise ValueError(f'Unsupported re-ranking method: {method}')
+
+    logger_for_reranker.info(
+        'Re-ranking enabled. method: %s, fetch_k: %s, top_n: %s', method, reranking_config['fetch_k'], reranking_config['top_n']
+    )
+    return RerankingRetriever(
+        retriever=with_candidate_count(retriever, int(reranking_config['fetch_k'])),
+        method=method,
+        top_n=int(reranking_config['top_n']),
+        cross_encoder=cross_encoder,
+        embedding=embedding,
+        batch_size=int(reranking_config['batch_size']),
+        mmr_lambda=float(reranking_config['mmr_lambda']),
+        score_cache=ScoreCache(reranking_config['score_cache_size'])
+    )
@@ -1,9 +1,9 @@
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms import Ollama
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
 from src.logger import log_component_start, log_component_end, logger_for_retrieval_chain
 from src.config_loader import get_config
+from src.metrics import instrument
+from src.embedder import build_embedding_model
+from src.vectordb_builder import get_index_version
+from src.answer_cache import build_answer_cache, make_answer_cache_version
 
 def invoke_chain(retrieval_chain):
     """
@@ -21,7 +21,9 @@ def invoke_chain(retrieval_chain):
     Notes
     -----
     - The input query is loaded from a configuration file.
-    - The response from the LLM is logged but not returned or saved.
+    - The response from the LLM is logged at DEBUG level but not returned or saved.
+    - With the semantic answer cache enabled, a stored answer to a near-duplicate question is served
+      instead of invoking the chain, and fresh answers are added to the cache.
     - Logging is used extensively to trace execution and debug errors.
     - This function is typically the final step in a LangChain pipeline.
     """
@@ -29,25 +31,51 @@ def invoke_chain(retrieval_chain):
         # Start logging for the retrieval chain execution component
         log_component_start(logger_for_retrieval_chain, 'Run Retriever Chain Component')
 
-        # Load configuration to get the user query
-        config = get_config()
-        query = config["query"]
+        with instrument('retrieval_chain') as span:
+            # Load configuration to get the user query
+            config = get_config()
+            query = config["query"]
 
-        # Invoke the retrieval chain with the provided query
-        run_chain = retrieval_chain.invoke({"input": query})
-        logger_for_retrieval_chain.info('Retrieval chain executed')
+            # Look for a cached answer to a near-duplicate question first
+            answer_cache = build_answer_cache()
+            cached_answer = None
+            if answer_cache is not None:
+                query_vector = build_embedding_model(config["ollama_embedding"]["embedding_model"]).embed_query(query)
+                cache_version = make_answer_cache_version(
+                    get_index_version(config["vector_store_db"]),
+                    config["ollama_model"]["ollama_llm"],
+                    config["chatprompttemplate_system_instruction"]
+                )
+                cached_answer = answer_cache.lookup(query_vector, cache_version)
 
-        # Extract and log the LLM's response
-        llm_response = run_chain['answer']
+            if cached_answer is not None:
+                llm_response = cached_answer['answer']
+                span.add('answer_cache_hits')
+                logger_for_retrieval_chain.info('Answer served from the semantic answer cache')
+            else:
+                # Invoke the retrieval chain with the provided query
+                run_chain = retrieval_chain.invoke({"input": query})
+                logger_for_retrieval_chain.info('Retrieval chain executed')
 
-        logger_for_retrieval_chain.info(f'User query: {query}')
-        logger_for_retrieval_chain.info("LLM's response recieved")
-        logger_for_retrieval_chain.info(f"LLM's response: {llm_response}")
+                # Extract the LLM's response and remember it for similar questions
+                llm_response = run_chain['answer']
+                if answer_cache is not None:
+                    sources = [document.metadata for document in run_chain['context']]
+                    answer_cache.store(query, query_vector, llm_response, sources, cache_version)
 
-        # End logging for the component
-        log_component_end(logger_for_retrieval_chain, 'Run Retriever Chain Component')
+            if answer_cache is not None:
+                answer_cache.log_stats()
+            span.add('queries')
+
+            logger_for_retrieval_chain.info('User query: %s', query)
+            logger_for_retrieval_chain.info("LLM's response recieved")
+            # Full responses are only formatted when DEBUG logging is enabled
+            logger_for_retrieval_chain.debug("LLM's response: %s", llm_response)
+
+            # End logging for the component
+            log_component_end(logger_for_retrieval_chain, 'Run Retriever Chain Component')
 
     except Exception as e:
         # Log any error that occurs during retrieval chain execution
-        logger_for_retrieval_chain.debug(f'Error encountered in run retriever chain component. error: {e}')
+        logger_for_retrieval_chain.debug('Error encountered in run retriever chain component. error: %s', e)
         log_component_end(logger_for_retrieval_chain, 'Run Retriever Chain Component')
@@ -0,0 +1,545 @@
+import copy
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from src.vectordb_builder import (
+    create_vector_store_db, get_persist_directory, load_chunk_manifest, load_usable_manifest, open_vector_store,
+    read_index_version, search_by_vectors_with_scores, get_documents_by_ids, iterate_stored_chunks,
+    CHUNK_MANIFEST_FILE_NAME, INDEX_VERSION_FILE_NAME
+)
+from src.index_snapshots import build_index_snapshot
+from src.embedder import build_embedding_model
+from src.data_loader import data_loader
+from src.data_splitter import data_splitter
+from src.config_loader import get_config, set_config
+from src.logger import log_component_start, log_component_end, logger_for_sharded_vectordb
+from src.metrics import instrument
+
+# Name of the file recording how many shards a sharded store was built with
+SHARD_LAYOUT_FILE_NAME = "shards.json"
+
+# Name of the ingest ledger kept by sharded builds, apart from the one of the unsharded store
+SHARDED_INGEST_LEDGER_FILE_NAME = "sharded_ingest_ledger.json"
+
+# Directory the chunk stream is spilled to, one JSON lines file per shard, while the shards are built
+STAGING_DIRECTORY_NAME = "shard_staging"
+
+# Start method of the shard build and search workers. A forked worker inherits the parent's open
+# Chroma client and its locks, and can deadlock on them; spawned workers start clean and receive
+# the parent's configuration through `set_config`.
+WORKER_START_METHOD = "spawn"
+
+def shard_for_source(source, shard_count):
+    """
+    Returns the shard a source document belongs to, from a hash of its path.
+
+    All chunks of a document land in the same shard, so a changed or deleted file only touches one shard.
+    """
+    digest = hashlib.sha256(str(source).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+def get_shard_directory(root_directory, shard_number):
+    """
+    Returns the directory a shard is persisted to, `shard_<number>` inside the backend's directory.
+    """
+    return os.path.join(root_directory, f'shard_{shard_number:03d}')
+
+def load_shard_layout(root_directory):
+    """
+    Loads the shard layout (`shard_count`) of a sharded store, or None if it was never built sharded.
+    """
+    layout_path = os.path.join(root_directory, SHARD_LAYOUT_FILE_NAME)
+    if not os.path.exists(layout_path):
+        return None
+    with open(layout_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def prepare_shard_layout(root_directory, shard_count):
+    """
+    Records the shard count of a sharded store, deleting every shard first if it was built with another count.
+
+    Returns
+    -------
+    bool
+        True if the shards were deleted, since chunks hash to other shards under a new count.
+    """
+    layout = load_shard_layout(root_directory)
+    if layout is not None and layout.get('shard_count') == shard_count:
+        return False
+
+    if layout is not None:
+        for shard_number in range(int(layout['shard_count'])):
+            shutil.rmtree(get_shard_directory(root_directory, shard_number), ignore_errors=True)
+    os.makedirs(root_directory, exist_ok=True)
+    layout_path = os.path.join(root_directory, SHARD_LAYOUT_FILE_NAME)
+    with open(layout_path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump({'shard_count': shard_count}, file)
+    os.replace(layout_path + '.tmp', layout_path)
+    return layout is not None
+
+def spill_chunks(data_splits, staging_directory, shard_count, shard_numbers):
+    """
+    Consumes the chunk stream, appending every chunk to the JSON lines file of its shard.
+
+    Parameters
+    ----------
+    data_splits : iterable
+        The `data_splitter` stream.
+    staging_directory : str
+        Directory the files are written to.
+    shard_count : int
+        Number of shards of the store.
+    shard_numbers : set of int
+        The shards being built; chunks of other shards are dropped.
+
+    Returns
+    -------
+    dict
+        Maps each shard number being built to its `(file path, chunk count)`.
+    """
+    os.makedirs(staging_directory, exist_ok=True)
+    paths = {shard_number: os.path.join(staging_directory, f'shard_{shard_number:03d}.jsonl') for shard_number in shard_numbers}
+    counts = dict.fromkeys(shard_numbers, 0)
+    files = {shard_number: open(path, 'w', encoding='utf-8') for shard_number, path in paths.items()}
+    try:
+        for document in data_splits:
+            shard_number = shard_for_source(document.metadata.get('source', ''), shard_count)
+            if shard_number not in files:
+                continue
+            files[shard_number].write(json.dumps({'page_content': document.page_content, 'metadata': document.metadata}, default=str) + '\n')
+            counts[shard_number] += 1
+    finally:
+        for file in files.values():
+            file.close()
+    return {shard_number: (paths[shard_number], counts[shard_number]) for shard_number in shard_numbers}
+
+def read_spilled_chunks(spill_path):
+    """
+    Lazily reads the chunks a shard's JSON lines file holds back as Documents.
+    """
+    with open(spill_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            record = json.loads(line)
+            yield Document(page_content=record['page_content'], metadata=record['metadata'])
+
+def build_shard(shard_number, vector_storedb, embedding_model, spill_path, shard_directory, ingest_ledger):
+    """
+    Builds or incrementally updates one shard from its spilled chunks; runs in the shard build worker processes.
+
+    Returns
+    -------
+    dict
+        The shard's `shard` number, `chunks` count and `index_version`.
+    """
+    retriever = create_vector_store_db(
+        read_spilled_chunks(spill_path),
+        build_embedding_model(embedding_model),
+        vector_storedb,
+        ingest_ledger=ingest_ledger,
+        persist_directory=shard_directory
+    )
+    if retriever is None:
+        raise RuntimeError(f'Shard {shard_number} could not be built, see the vectordb builder logs')
+    return {
+        'shard': shard_number,
+        'chunks': len(load_chunk_manifest(shard_directory)['chunks']),
+        'index_version': read_index_version(shard_directory)
+    }
+
+def write_sharded_index_version(root_directory, shard_count):
+    """
+    Records the version of the whole sharded store, a hash over the versions of its shards.
+    """
+    shard_versions = [read_index_version(get_shard_directory(root_directory, shard_number)) or '' for shard_number in range(shard_count)]
+    index_version = hashlib.sha256('\n'.join(shard_versions).encode('utf-8')).hexdigest()
+    version_path = os.path.join(root_directory, INDEX_VERSION_FILE_NAME)
+    with open(version_path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(index_version)
+    os.replace(version_path + '.tmp', version_path)
+
+def build_shards(data_splits, vector_storedb, embedding_model, shard_numbers, ingest_ledger=None):
+    """
+    Spills the chunk stream per shard and builds the given shards in a process pool, one shard per task.
+
+    Parameters
+    ----------
+    data_splits : iterable
+        The `data_splitter` stream.
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    embedding_model : str
+        The Ollama embedding model the shards are built with; every worker builds its own client.
+    shard_numbers : list of int
+        The shards to build. Shards that receive no chunks and were never built are left empty.
+    ingest_ledger : IngestLedger, optional
+        Ledger the data loader checked files against; the workers keep the chunks of the files it skipped.
+
+    Returns
+    -------
+    list of dict
+        The summary of every shard built, as returned by `build_shard`.
+    """
+    config = get_config()
+    shard_config = config['vector_shards']
+    shard_count = int(shard_config['shard_count'])
+    root_directory = get_persist_directory(vector_storedb)
+    staging_directory = os.path.join(root_directory, STAGING_DIRECTORY_NAME)
+    shutil.rmtree(staging_directory, ignore_errors=True)
+
+    # The stream is consumed once, in the parent, so every worker only reads its own shard's file
+    spilled = spill_chunks(data_splits, staging_directory, shard_count, set(shard_numbers))
+
+    tasks = []
+    for shard_number, (spill_path, chunk_count) in sorted(spilled.items()):
+        shard_directory = get_shard_directory(root_directory, shard_number)
+        if not chunk_count and load_usable_manifest(shard_directory, embedding_model, vector_storedb) is None:
+            # Nothing to keep or add; a shard whose files were all removed or that must be rebuilt ends up empty
+            shutil.rmtree(shard_directory, ignore_errors=True)
+            continue
+        shard_ledger = None
+        if ingest_ledger is not None:
+            # Workers only read the ledger's unchanged sources; the parent saves the real ledger at the end
+            shard_ledger = copy.copy(ingest_ledger)
+            shard_ledger.ledger_path = os.path.join(staging_directory, f'ingest_ledger_{shard_number:03d}.json')
+        tasks.append((shard_number, vector_storedb, embedding_model, spill_path, shard_directory, shard_ledger))
+
+    results = []
+    if tasks:
+        build_workers = min(int(shard_config['build_workers']), len(tasks))
+        with ProcessPoolExecutor(
+            max_workers=build_workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+            initializer=set_config, initargs=(config,)
+        ) as executor:
+            futures = [executor.submit(build_shard, *task) for task in tasks]
+            results = [future.result() for future in futures]
+
+    write_sharded_index_version(root_directory, shard_count)
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    for result in results:
+        logger_for_sharded_vectordb.info('Shard %s built with %s chunks', result['shard'], result['chunks'])
+    return results
+
+def create_sharded_vector_store_db(data_splits, embedder, vector_storedb, ingest_ledger=None):
+    """
+    Creates or incrementally updates a sharded vector store, building its shards in parallel processes.
+
+    Parameters
+    ----------
+    data_splits : iterable
+        An iterable (typically the `data_splitter` stream) of Document chunks.
+    embedder : Embeddings
+        The embedding model; its `model` names the Ollama model every worker embeds with.
+    vector_storedb : str
+        The vector store type every shard is built as ('faiss', 'chroma' or 'numpy').
+    ingest_ledger : IngestLedger, optional
+        Ledger the data loader checked files against; saved once every shard has been updated.
+
+    Returns
+    -------
+    Retriever
+        A retriever over the `ShardedVectorStore`.
+
+    Notes
+    -----
+    - Chunks are partitioned into `vector_shards -> shard_count` shards by a hash of their source document,
+      and every shard is a complete store of its own (`shard_000`, `shard_001`, ... in the backend's directory)
+      with its own manifest, so it is updated incrementally and can be rebuilt on its own (see `rebuild_shards`).
+    - The chunk stream is spilled to one file per shard, and the shards are built by
+      `vector_shards -> build_workers` worker processes running `create_vector_store_db` on their shard.
+    - Changing the shard count deletes every shard, since chunks hash to other shards.
+    - The store's version (used by the BM25 index and the answer cache) is a hash over the shards' versions.
+    - Errors are logged and re-raised, since a partly built store must not replace the previous one.
+    """
+    try:
+        log_component_start(logger_for_sharded_vectordb, 'Sharded Vectordb Component')
+
+        with instrument('sharded_vectordb_builder') as span:
+            shard_count = int(get_config()['vector_shards']['shard_count'])
+            root_directory = get_persist_directory(vector_storedb)
+            embedding_model = getattr(embedder, 'model', type(embedder).__name__)
+            logger_for_sharded_vectordb.info('Vector store db selected is: %s in %s shards', vector_storedb.upper(), shard_count)
+
+            if prepare_shard_layout(root_directory, shard_count):
+                logger_for_sharded_vectordb.info('Shard count changed, every shard will be rebuilt')
+
+            # A shard that must be fully rebuilt needs every file re-read. The loader is lazy and has
+            # not checked any file yet, so resetting the ledger here is enough.
+            rebuilt_shards = [
+                shard_number for shard_number in range(shard_count)
+                if load_usable_manifest(get_shard_directory(root_directory, shard_number), embedding_model, vector_storedb) is None
+            ]
+            if rebuilt_shards and ingest_ledger is not None:
+                ingest_ledger.reset()
+
+            results = build_shards(span.excluding(data_splits), vector_storedb, embedding_model, list(range(shard_count)), ingest_ledger)
+            if ingest_ledger is not None:
+                ingest_ledger.save()
+            span.add('shards', len(results))
+            span.add('chunks', sum(result['chunks'] for result in results))
+
+            retriever = load_sharded_vector_store(vector_storedb, embedder).as_retriever()
+
+            logger_for_sharded_vectordb.info('Sharded vector store %s is ready', vector_storedb.upper())
+            log_component_end(logger_for_sharded_vectordb, 'Sharded Vectordb Component')
+            return retriever
+
+    except Exception as e:
+        logger_for_sharded_vectordb.debug('Error encountered in sharded vectordb component. error: %s', e)
+        log_component_end(logger_for_sharded_vectordb, 'Sharded Vectordb Component')
+        raise
+
+def rebuild_shards():
+    """
+    Rebuilds shards of the sharded vector store from scratch, leaving the other shards untouched.
+
+    Returns
+    -------
+    list of dict
+        The summary of every shard rebuilt.
+
+    Notes
+    -----
+    - The shards listed in `vector_shards -> rebuild_shards` are rebuilt, or every shard if it is empty.
+    - Only the data files hashing to those shards are loaded, split and embedded.
+    - Queries keep being answered from the previous shard files while a shard is rebuilt, and running
+      query servers pick the rebuilt shards up on their next query.
+    - With `index_snapshots -> enabled`, the shards are rebuilt in a new snapshot (see
+      `src.index_snapshots.build_index_snapshot`), which serving processes swap to once it is published.
+    """
+    try:
+        log_component_start(logger_for_sharded_vectordb, 'Shard Rebuild Component')
+
+        config = get_config()
+        shard_config = config['vector_shards']
+        shard_count = int(shard_config['shard_count'])
+        vector_storedb = config['vector_store_db']
+        if shard_count <= 1:
+            raise ValueError('Sharding is disabled; set vector_shards.shard_count above 1')
+        shard_numbers = sorted(set(shard_config['rebuild_shards'])) or list(range(shard_count))
+        if shard_numbers[-1] >= shard_count:
+            raise ValueError(f'The store has shards 0 to {shard_count - 1}, cannot rebuild: {shard_numbers}')
+
+        with build_index_snapshot(vector_storedb):
+            root_directory = get_persist_directory(vector_storedb)
+            if prepare_shard_layout(root_directory, shard_count) and len(shard_numbers) < shard_count:
+                raise ValueError('The store was built with another shard count; every shard must be rebuilt')
+
+            logger_for_sharded_vectordb.info('Rebuilding shards %s of %s', shard_numbers, shard_count)
+            # Without its manifest a shard is rebuilt from scratch, while queries keep searching its previous files
+            for shard_number in shard_numbers:
+                manifest_path = os.path.join(get_shard_directory(root_directory, shard_number), CHUNK_MANIFEST_FILE_NAME)
+                if os.path.exists(manifest_path):
+                    os.remove(manifest_path)
+
+            targets = set(shard_numbers)
+            data_splits = data_splitter(data_loader(source_filter=lambda path: shard_for_source(path, shard_count) in targets))
+            results = build_shards(data_splits, vector_storedb, config['ollama_embedding']['embedding_model'], shard_numbers)
+
+        log_component_end(logger_for_sharded_vectordb, 'Shard Rebuild Component')
+        return results
+
+    except Exception as e:
+        logger_for_sharded_vectordb.debug('Error encountered in shard rebuild component. error: %s', e)
+        log_component_end(logger_for_sharded_vectordb, 'Shard Rebuild Component')
+        raise
+
+# Shards opened in this process, by directory: (version file mtime, store)
+_open_shards = {}
+_open_shards_lock = threading.Lock()
+
+def get_shard_store(vector_storedb, shard_directory):
+    """
+    Returns an opened shard, kept open between queries and reopened once the shard has been rebuilt.
+    """
+    version_stamp = os.stat(os.path.join(shard_directory, INDEX_VERSION_FILE_NAME)).st_mtime_ns
+    with _open_shards_lock:
+        opened = _open_shards.get(shard_directory)
+        if opened is None or opened[0] != version_stamp:
+            # Searched by vector only, so no embedding model is needed
+            opened = _open_shards[shard_directory] = (version_stamp, open_vector_store(vector_storedb, None, shard_directory))
+        return opened[1]
+
+def merge_top_k(result_sets, k):
+    """
+    Merges several result sets (lists of `(chunk_id, Document, score)` hits per query) into the k best hits per query.
+    """
+    return [heapq.nlargest(k, itertools.chain.from_iterable(hits), key=itemgetter(2)) for hits in zip(*result_sets)]
+
+def search_shards(vector_storedb, shard_directories, query_vectors, k):
+    """
+    Searches a group of shards and merges their hits; runs in the search worker processes.
+    """
+    return merge_top_k(
+        [search_by_vectors_with_scores(get_shard_store(vector_storedb, shard_directory), query_vectors, k)
+         for shard_directory in shard_directories],
+        k
+    )
+
+def lookup_shards(vector_storedb, shard_directories, ids):
+    """
+    Looks chunk ids up in a group of shards; runs in the search worker processes.
+    """
+    documents = {}
+    for shard_directory in shard_directories:
+        documents.update(get_documents_by_ids(get_shard_store(vector_storedb, shard_directory), ids))
+    return documents
+
+class ShardedVectorStore(VectorStore):
+    """
+    Vector store split into independently built shards and searched scatter-gather.
+
+    Every query is sent to all shards at once and their top-k hits are merged into the global top-k.
+    With `search_workers` above 1, the shards are divided among that many worker processes; each
+    worker only opens its own shards and keeps them open between queries.
+
+    Parameters
+    ----------
+    embedding : Embeddings
+        The embedding model queries are embedded with.
+    vector_storedb : str
+        The vector store type of the shards ('faiss', 'chroma' or 'numpy').
+    shard_directories : list of str
+        Directories of the built shards.
+    search_workers : int
+        Number of search worker processes; 0 or 1 searches the shards in the current process.
+    """
+
+    def __init__(self, embedding, vector_storedb, shard_directories, search_workers):
+        self.embedding = embedding
+        self.vector_storedb = vector_storedb
+        self.shard_directories = list(shard_directories)
+        worker_count = min(int(search_workers), len(self.shard_directories))
+        if worker_count > 1:
+            self.shard_groups = [self.shard_directories[worker::worker_count] for worker in range(worker_count)]
+        else:
+            self.shard_groups = [self.shard_directories]
+        self._executors = None
+        self._executors_lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def _get_executors(self):
+        # One single-process pool per shard group, so every shard stays in one worker; started on first use
+        with self._executors_lock:
+            if self._executors is None:
+                config = get_config()
+                self._executors = [
+                    ProcessPoolExecutor(
+                        max_workers=1, mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+                        initializer=set_config, initargs=(config,)
+                    )
+                    for _ in self.shard_groups
+                ]
+            return self._executors
+
+    def _scatter(self, function, *arguments):
+        if len(self.shard_groups) == 1:
+            return [function(self.vector_storedb, self.shard_groups[0], *arguments)]
+        futures = [
+            executor.submit(function, self.vector_storedb, shard_group, *arguments)
+            for executor, shard_group in zip(self._get_executors(), self.shard_groups)
+        ]
+        return [future.result() for future in futures]
+
+    def search_with_scores(self, query_vectors, k):
+        """
+        Searches every shard for a batch of query vectors and merges the hits.
+
+        Returns
+        -------
+        list of list of tuple
+            For every query, the k `(chunk_id, Document, score)` hits with the highest scores over all shards.
+        """
+        with instrument('sharded_search') as span:
+            span.add('queries', len(query_vectors))
+            return merge_top_k(self._scatter(search_shards, np.asarray(query_vectors, dtype=np.float32), k), k)
+
+    def get_documents_by_ids(self, ids):
+        """
+        Looks chunk ids up in every shard; unknown ids are left out.
+        """
+        documents = {}
+        for shard_documents in self._scatter(lookup_shards, list(ids)):
+            documents.update(shard_documents)
+        return documents
+
+    def iterate_chunks(self):
+        """
+        Yields the `(chunk_id, text)` of every stored chunk, shard by shard.
+        """
+        for shard_directory in self.shard_directories:
+            yield from iterate_stored_chunks(open_vector_store(self.vector_storedb, None, shard_directory))
+
+    def close(self):
+        """
+        Shuts the search worker processes down.
+        """
+        with self._executors_lock:
+            for executor in self._executors or []:
+                executor.shutdown()
+            self._executors = None
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        hits = self.search_with_scores(np.asarray([embedding], dtype=np.float32), k)[0]
+        return [(document, score) for _, document, score in hits]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError('Shards are built with create_sharded_vector_store_db')
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError('Shards are built with create_sharded_vector_store_db')
+
+def load_sharded_vector_store(vector_storedb, embedding, root_directory=None):
+    """
+    Opens the sharded vector store of a backend, as laid out by `create_sharded_vector_store_db`.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    embedding : Embeddings
+        The embedding model queries are embedded with.
+    root_directory : str, optional
+        Directory holding the shards; defaults to the backend's persist directory.
+
+    Returns
+    -------
+    ShardedVectorStore
+        The store over every built shard, searched by `vector_shards -> search_workers` processes.
+    """
+    shard_config = get_config()['vector_shards']
+    shard_count = int(shard_config['shard_count'])
+    root_directory = root_directory or get_persist_directory(vector_storedb)
+    layout = load_shard_layout(root_directory)
+    if layout is None or layout.get('shard_count') != shard_count:
+        raise ValueError(f'No {vector_storedb} store of {shard_count} shards found in {root_directory}; run main.py to build it')
+
+    shard_directories = [
+        get_shard_directory(root_directory, shard_number) for shard_number in range(shard_count)
+        if read_index_version(get_shard_directory(root_directory, shard_number)) is not None
+    ]
+    if not shard_directories:
+        raise ValueError(f'No shard of the {vector_storedb} store has been built in {root_directory}')
+    return ShardedVectorStore(embedding, vector_storedb, shard_directories, int(shard_config['search_workers']))
@@ -1,17 +1,347 @@
-from langchain_community.vectorstores import FAISS, Chroma
+import hashlib
+import json
+import os
+import sys
+from langchain_core.documents import Document
+from src.numpy_vectorstore import NumpyVectorStore
 from src.logger import log_component_start, log_component_end, logger_for_vectordb_builder
+from src.embedder import embed_in_batches, build_embedding_model
+from src.data_splitter import get_chunk_settings
+from src.config_loader import get_config
+from src.metrics import instrument, instrumented
 
-def create_vector_store_db(data_splits, embedder, vector_storedb):
+# Directories the vector stores are persisted to, inside `paths -> vector_store_dir`
+PERSIST_DIRECTORY_NAMES = {'faiss': 'faiss_vecdb', 'chroma': 'chroma_vecdb', 'numpy': 'numpy_vecdb'}
+
+# Module defining LangChain's FAISS vector store; FAISS and Chroma are only imported once selected
+FAISS_STORE_MODULE = "langchain_community.vectorstores.faiss"
+
+# Module defining the sharded vector store, only imported when sharding is enabled
+SHARDED_STORE_MODULE = "src.sharded_vectordb"
+
+# Name of the chunk manifest file kept next to each persisted vector store
+CHUNK_MANIFEST_FILE_NAME = "chunk_manifest.json"
+
+# Name of the ingest ledger file kept next to each persisted vector store
+INGEST_LEDGER_FILE_NAME = "ingest_ledger.json"
+
+# Name of the file holding the version (content hash) of each persisted vector store
+INDEX_VERSION_FILE_NAME = "index_version"
+
+# Directory holding the index snapshots of a vector store, inside its root directory
+SNAPSHOTS_DIRECTORY_NAME = "snapshots"
+
+# Name of the file naming the snapshot currently served, replaced atomically when a snapshot is published
+CURRENT_SNAPSHOT_FILE_NAME = "CURRENT"
+
+# Name of the manifest written into every published snapshot, which is never modified afterwards
+SNAPSHOT_MANIFEST_FILE_NAME = "snapshot.json"
+
+# Snapshots being built in this process, by vector store type; see `src.index_snapshots.build_index_snapshot`
+building_snapshots = {}
+
+def get_store_root_directory(vector_storedb):
+    """
+    Returns the root directory of a vector store type, holding its snapshots (or the store itself when
+    snapshots are disabled).
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+
+    Returns
+    -------
+    str
+        The directory under `paths -> vector_store_dir` (which includes the instance name, so every
+        instance keeps its own stores).
+    """
+    if vector_storedb not in PERSIST_DIRECTORY_NAMES:
+        raise ValueError(f'Unsupported vector store db: {vector_storedb}')
+    return os.path.join(get_config()['paths']['vector_store_dir'], PERSIST_DIRECTORY_NAMES[vector_storedb])
+
+def read_current_snapshot(root_directory):
+    """
+    Returns the name of the snapshot a store's `CURRENT` pointer names, or None if none was published yet.
+    """
+    pointer_path = os.path.join(root_directory, CURRENT_SNAPSHOT_FILE_NAME)
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path, "r", encoding="utf-8") as file:
+        return file.read().strip() or None
+
+def get_persist_directory(vector_storedb):
+    """
+    Returns the local directory a vector store type is persisted to.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+
+    Returns
+    -------
+    str
+        The persist directory of the vector store. With `index_snapshots -> enabled`, this is the snapshot
+        being built in this process, else the current (published) snapshot; without snapshots, or before the
+        first one is published, it is the store's root directory (see `get_store_root_directory`).
+    """
+    root_directory = get_store_root_directory(vector_storedb)
+    if not get_config()['index_snapshots']['enabled']:
+        return root_directory
+    return get_snapshot_directory(vector_storedb, building_snapshots.get(vector_storedb) or read_current_snapshot(root_directory))
+
+def get_snapshot_directory(vector_storedb, snapshot_name):
+    """
+    Returns the directory of a named snapshot of a vector store, or the store's root directory for None
+    (snapshots disabled, or none published yet), as `get_persist_directory` would have returned for it.
+
+    Serving code opens a snapshot through its name, read once, so a snapshot published meanwhile
+    cannot make it open one snapshot's files and another's.
+    """
+    root_directory = get_store_root_directory(vector_storedb)
+    if snapshot_name is None:
+        return root_directory
+    return os.path.join(root_directory, SNAPSHOTS_DIRECTORY_NAME, snapshot_name)
+
+def is_published_snapshot(persist_directory):
+    """
+    Tells whether a persist directory is a published snapshot, whose files must not be modified.
+    """
+    return os.path.exists(os.path.join(persist_directory, SNAPSHOT_MANIFEST_FILE_NAME))
+
+def compute_chunk_id(document):
+    """
+    Computes a stable content hash for a chunk, used as its id inside the vector store.
+
+    Parameters
+    ----------
+    document : Document
+        A LangChain Document produced by the data splitter.
+
+    Returns
+    -------
+    str
+        Hex SHA-256 digest of the chunk text and its metadata.
+    """
+    payload = json.dumps(
+        {"page_content": document.page_content, "metadata": document.metadata},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_chunk_manifest(persist_directory):
+    """
+    Loads the chunk manifest stored next to a persisted vector store.
+
+    Parameters
+    ----------
+    persist_directory : str
+        Directory the vector store is persisted to.
+
+    Returns
+    -------
+    dict or None
+        The manifest (`embedding_model`, `chunk_settings`, `index_settings` and `chunks`, mapping chunk id to source), or None if no manifest exists yet.
+    """
+    manifest_path = os.path.join(persist_directory, CHUNK_MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_chunk_manifest(persist_directory, manifest):
+    """
+    Atomically writes the chunk manifest next to a persisted vector store.
+
+    Parameters
+    ----------
+    persist_directory : str
+        Directory the vector store is persisted to.
+    manifest : dict
+        The manifest to persist.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    manifest_path = os.path.join(persist_directory, CHUNK_MANIFEST_FILE_NAME)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, manifest_path)
+
+def get_index_version(vector_storedb):
+    """
+    Returns the version of a persisted vector store, which changes whenever its chunks do.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+
+    Returns
+    -------
+    str or None
+        Hex digest over the embedding model and chunk ids (over the shards' versions for a sharded
+        store), or None if the store was never built.
+    """
+    return read_index_version(get_persist_directory(vector_storedb))
+
+def read_index_version(persist_directory):
+    """
+    Returns the version recorded in a persist directory, or None if there is none.
+    """
+    version_path = os.path.join(persist_directory, INDEX_VERSION_FILE_NAME)
+    if not os.path.exists(version_path):
+        return None
+    with open(version_path, "r", encoding="utf-8") as file:
+        return file.read().strip()
+
+def get_numpy_store_settings(numpy_config):
+    """
+    Returns the part of the `numpy_vecdb` config that determines how the vectors are stored.
+
+    Parameters
+    ----------
+    numpy_config : dict
+        The `numpy_vecdb` section of the config.
+
+    Returns
+    -------
+    dict
+        `dtype` and `dimensions`; the query-time `rescore_factor` is left out.
+    """
+    return {'dtype': numpy_config['dtype'], 'dimensions': int(numpy_config['dimensions'])}
+
+def is_faiss_store(vector_db):
+    """
+    Tells whether a vector store is a FAISS store, without importing faiss when it is not loaded yet.
+    """
+    faiss_store_module = sys.modules.get(FAISS_STORE_MODULE)
+    return faiss_store_module is not None and isinstance(vector_db, faiss_store_module.FAISS)
+
+def is_sharded_store(vector_db):
+    """
+    Tells whether a vector store is a ShardedVectorStore, without importing the sharding module when it is not loaded yet.
+    """
+    sharded_store_module = sys.modules.get(SHARDED_STORE_MODULE)
+    return sharded_store_module is not None and isinstance(vector_db, sharded_store_module.ShardedVectorStore)
+
+def add_chunks_to_vector_store(vector_db, vector_storedb, documents, ids, embedder):
+    """
+    Embeds chunks with the concurrent batch engine and bulk-adds the vectors to a vector store.
+
+    Parameters
+    ----------
+    vector_db : VectorStore or None
+        The store to add to. For FAISS and NumPy, None creates a new store from the chunks;
+        a new FAISS index of the type set under `faiss_index` is trained on these chunks first.
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    documents : list
+        The Document chunks to add.
+    ids : list of str
+        The ids to store the chunks under.
+    embedder : Embeddings
+        The embedding model used to embed the chunks.
+
+    Returns
+    -------
+    VectorStore
+        The vector store holding the new chunks.
+    """
+    texts = [document.page_content for document in documents]
+    metadatas = [document.metadata for document in documents]
+    vectors = embed_in_batches(texts, embedder)
+
+    if vector_storedb == 'faiss':
+        text_embeddings = zip(texts, vectors)
+        if vector_db is None:
+            from src.faiss_index import create_faiss_store
+            return create_faiss_store(embedder, texts, vectors, metadatas, ids, get_config()['faiss_index'])
+        vector_db.add_embeddings(text_embeddings=text_embeddings, metadatas=metadatas, ids=ids)
+        return vector_db
+
+    if vector_storedb == 'numpy':
+        if vector_db is None:
+            numpy_config = get_config()['numpy_vecdb']
+            vector_db = NumpyVectorStore(
+                embedding=embedder, rescore_factor=int(numpy_config['rescore_factor']), **get_numpy_store_settings(numpy_config)
+            )
+        vector_db.add_embeddings(text_embeddings=zip(texts, vectors), metadatas=metadatas, ids=ids)
+        return vector_db
+
+    # Chroma caps how many records a single call may carry
+    max_batch_size = vector_db._client.get_max_batch_size()
+    for start in range(0, len(ids), max_batch_size):
+        end = start + max_batch_size
+        vector_db._collection.upsert(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            metadatas=[metadata or None for metadata in metadatas[start:end]],
+            documents=texts[start:end]
+        )
+    return vector_db
+
+def get_index_settings(vector_storedb):
+    """
+    Returns the settings that determine how a vector store of the given type is built.
+
+    Returns
+    -------
+    dict or None
+        The FAISS build settings or the NumPy storage settings; None for Chroma.
+    """
+    config = get_config()
+    if vector_storedb == 'faiss':
+        from src.faiss_index import get_faiss_build_settings
+        return get_faiss_build_settings(config['faiss_index'])
+    if vector_storedb == 'numpy':
+        return get_numpy_store_settings(config['numpy_vecdb'])
+    return None
+
+def load_usable_manifest(persist_directory, embedding_model, vector_storedb):
+    """
+    Loads the chunk manifest of a persisted vector store if the store can be updated incrementally.
+
+    Parameters
+    ----------
+    persist_directory : str
+        Directory the store is persisted to.
+    embedding_model : str
+        The embedding model the store is (re)built with.
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+
+    Returns
+    -------
+    dict or None
+        The manifest, or None when there is none or it was built with another embedding model,
+        other chunk settings or other index settings, i.e. when the store must be fully rebuilt.
+    """
+    manifest = load_chunk_manifest(persist_directory)
+    if (manifest is not None and manifest.get('embedding_model') == embedding_model
+            and manifest.get('chunk_settings') == get_chunk_settings()
+            and manifest.get('index_settings') == get_index_settings(vector_storedb)):
+        return manifest
+    return None
+
+def create_vector_store_db(data_splits, embedder, vector_storedb, ingest_ledger=None, persist_directory=None):
     """
-    Creates a vector store (FAISS or Chroma) from the provided data splits using the specified embedding model.
+    Creates or incrementally updates a vector store (FAISS, Chroma or NumPy) from the provided data splits.
+
     Parameters:
     ----------
-    data_splits : list
-        A list of langchain.schema.Document objects representing the split data to be embedded.
+    data_splits : iterable
+        An iterable (typically the `data_splitter` stream) of langchain.schema.Document objects representing the split data to be embedded.
     embedder : BaseEmbedding
         An embedding model instance compatible with LangChain (e.g., OpenAIEmbeddings, HuggingFaceEmbeddings).
     vector_storedb : str
-        Specifies the vector store type to use. Supported values are 'faiss' and 'chroma'.
+        Specifies the vector store type to use. Supported values are 'faiss', 'chroma' and 'numpy'.
+    ingest_ledger : IngestLedger, optional
+        Ledger the data loader checked files against. Chunks of files it skipped as unchanged are kept,
+        and the ledger is saved once the vector store has been updated.
+    persist_directory : str, optional
+        Directory the store is persisted to; defaults to the backend's directory in `paths -> vector_store_dir`.
     Returns:
     -------
     Retriever
@@ -23,50 +353,390 @@ def create_vector_store_db(data_splits, embedder, vector_storedb):
     Notes:
     -----
     - The vector stores are persisted locally to specified directories.
+    - Every chunk is stored under its content hash, and the hashes are recorded in a manifest next to the store.
+    - On later runs only new or changed chunks are embedded, and vectors of chunks that no longer exist are deleted.
+    - A change of embedding model, chunk settings or FAISS index settings (or a missing manifest) triggers a full rebuild.
+    - FAISS indexes that need training (IVF, PQ, SQ) are trained on the first `faiss_index -> training_sample_size`
+      chunks, which are buffered before the first add; `nprobe`/`efSearch` are applied to the returned retriever.
+    - Chunks of files the loader skipped as unchanged (per the ingest ledger) are kept as they are.
+    - The chunk stream is consumed lazily; new chunks are embedded concurrently in batches of
+      `batch_size * max_workers` and bulk-added to the store, so only one batch is held in memory.
     - Logging is performed at each step to track component execution and failures.
     """
 
-    try: 
-        if vector_storedb == 'faiss':
+    try:
+        # Start logging for vector DB creation
+        log_component_start(logger_for_vectordb_builder, 'Vectordb Builder Component')
 
-            # Start logging for FAISS vector DB creation
-            log_component_start(logger_for_vectordb_builder, 'Vectordb Builder Component')
-            logger_for_vectordb_builder.info('Vector store db selected is: FAISS')
+        with instrument('vectordb_builder') as span:
+            persist_directory = persist_directory or get_persist_directory(vector_storedb)
+            logger_for_vectordb_builder.info('Vector store db selected is: %s', vector_storedb.upper())
 
-            # Create FAISS vector store and persist to local disk
-            vector_db_faiss = FAISS.from_documents(documents=data_splits, embedding=embedder)
-            vector_db_faiss.save_local("C:/Users/BW/Desktop/Basic gen ai chatbot project/vector_store_dbs/faiss_vecdb") 
+            # Only the selected backend is imported
+            if vector_storedb == 'faiss':
+                from langchain_community.vectorstores import FAISS
+                from src.faiss_index import (
+                    delete_from_faiss_store, apply_faiss_search_parameters, faiss_index_requires_training
+                )
+            elif vector_storedb == 'chroma':
+                from langchain_community.vectorstores import Chroma
 
-            # Convert FAISS vector store to retriever
-            faiss_retriever = vector_db_faiss.as_retriever()
+            # Compare against the manifest of the previous run, unless the embedding model or chunking changed
+            config = get_config()
+            embedding_model = getattr(embedder, 'model', type(embedder).__name__)
+            chunk_settings = get_chunk_settings()
+            index_settings = get_index_settings(vector_storedb)
+            manifest = load_usable_manifest(persist_directory, embedding_model, vector_storedb)
+            if manifest is not None:
+                previous_chunks = manifest['chunks']
+            else:
+                logger_for_vectordb_builder.info('No usable chunk manifest found, the vector store will be fully rebuilt')
+                previous_chunks = None
 
-            logger_for_vectordb_builder.info('Embedding of data splits completed and vector store FAISS is created')
-            log_component_end(logger_for_vectordb_builder, 'Vectordb Builder Component')
+            # Open the existing store when it can be updated in place
+            vector_db = None
+            if vector_storedb == 'faiss':
+                if previous_chunks is not None and os.path.exists(os.path.join(persist_directory, 'index.faiss')):
+                    vector_db = FAISS.load_local(
+                        folder_path=persist_directory,
+                        embeddings=embedder,
+                        allow_dangerous_deserialization=True
+                    )
+                else:
+                    previous_chunks = None
+            elif vector_storedb == 'numpy':
+                if previous_chunks is not None and NumpyVectorStore.exists(persist_directory):
+                    vector_db = NumpyVectorStore.load_local(
+                        folder_path=persist_directory,
+                        embeddings=embedder,
+                        rescore_factor=int(config['numpy_vecdb']['rescore_factor'])
+                    )
+                else:
+                    previous_chunks = None
+            else:
+                vector_db = Chroma(persist_directory=persist_directory, embedding_function=embedder)
+                if previous_chunks is None:
+                    # Drop whatever an earlier, manifest-less build left in the collection
+                    stale_ids = vector_db.get(include=[])['ids']
+                    if stale_ids:
+                        vector_db.delete(ids=stale_ids)
+
+            # A full rebuild cannot keep chunks of skipped files, so the loader must re-read every file.
+            # The loader is lazy and has not checked any file yet, so resetting the ledger here is enough.
+            if previous_chunks is None:
+                previous_chunks = {}
+                if ingest_ledger is not None:
+                    ingest_ledger.reset()
+
+            # Consume the chunk stream in bounded batches, embedding only new or changed chunks
+            batching_config = config['embedding_batching']
+            index_batch_size = int(batching_config['batch_size']) * int(batching_config['max_workers'])
+
+            # A new FAISS index that needs training gets a larger first batch to train its centroids/codebooks on
+            first_batch_size = index_batch_size
+            if vector_storedb == 'faiss' and vector_db is None and faiss_index_requires_training(config['faiss_index']):
+                first_batch_size = max(index_batch_size, int(config['faiss_index']['training_sample_size']))
+            seen_chunks = {}
+            pending_documents = []
+            pending_ids = []
+            added_count = 0
+            # The time spent loading and splitting is the upstream stages', and is not counted here
+            for document in span.excluding(data_splits):
+                chunk_id = compute_chunk_id(document)
+
+                # Identical chunks collapse into a single entry
+                if chunk_id in seen_chunks:
+                    continue
+                seen_chunks[chunk_id] = document.metadata.get('source')
+
+                if chunk_id not in previous_chunks:
+                    pending_documents.append(document)
+                    pending_ids.append(chunk_id)
+                if len(pending_ids) >= (first_batch_size if vector_db is None else index_batch_size):
+                    vector_db = add_chunks_to_vector_store(vector_db, vector_storedb, pending_documents, pending_ids, embedder)
+                    added_count += len(pending_ids)
+                    pending_documents, pending_ids = [], []
+
+            if pending_ids:
+                vector_db = add_chunks_to_vector_store(vector_db, vector_storedb, pending_documents, pending_ids, embedder)
+                added_count += len(pending_ids)
+
+            # Keep the chunks of files the loader skipped as unchanged
+            unchanged_sources = ingest_ledger.unchanged_sources if ingest_ledger is not None else set()
+            for chunk_id, source in previous_chunks.items():
+                if source in unchanged_sources:
+                    seen_chunks.setdefault(chunk_id, source)
+
+            # Delete vectors of chunks that no longer exist
+            removed_ids = [chunk_id for chunk_id in previous_chunks if chunk_id not in seen_chunks]
+            if removed_ids and vector_db is not None:
+                if vector_storedb == 'faiss':
+                    vector_db = delete_from_faiss_store(vector_db, removed_ids, config['faiss_index'])
+                else:
+                    vector_db.delete(ids=removed_ids)
+            reused_count = len(seen_chunks) - added_count
+            span.add('chunks_added', added_count)
+            span.add('chunks_removed', len(removed_ids))
+            span.add('chunks_reused', reused_count)
+
+            if vector_db is None:
+                raise ValueError('No data splits were provided to build the vector store from')
 
-            return faiss_retriever
-        
-        elif vector_storedb == 'chroma':
-
-            # Start logging for Chroma vector DB creation
-            log_component_start(logger_for_vectordb_builder, 'Vectordb Builder Component')
-            logger_for_vectordb_builder.info('Vector store db selected is: CHROMA')
-
-            # Create Chroma vector store and persist to local disk
-            vector_db_chroma = Chroma.from_documents(
-                documents=data_splits,
-                embedding=embedder,
-                persist_directory="C:/Users/BW/Desktop/Basic gen ai chatbot project/vector_store_dbs/chroma_vecdb"
-            ) 
-
-            # Convert Chroma vector store to retriever
-            chroma_retriever = vector_db_chroma.as_retriever()
-            
-            logger_for_vectordb_builder.info('Embedding of data splits completed and vector store CHROMA is created')
+            # Persist FAISS and NumPy to local disk (Chroma persists automatically)
+            if vector_storedb in ('faiss', 'numpy') and (added_count or removed_ids):
+                vector_db.save_local(persist_directory)
+
+            save_chunk_manifest(persist_directory, {
+                'embedding_model': embedding_model,
+                'chunk_settings': chunk_settings,
+                'index_settings': index_settings,
+                'chunks': seen_chunks
+            })
+            if ingest_ledger is not None:
+                ingest_ledger.save()
+
+            # Record the store's version so caches keyed on it notice the change
+            index_version = hashlib.sha256(
+                '\n'.join([embedding_model, *sorted(seen_chunks)]).encode('utf-8')
+            ).hexdigest()
+            with open(os.path.join(persist_directory, INDEX_VERSION_FILE_NAME), 'w', encoding='utf-8') as file:
+                file.write(index_version)
+
+            logger_for_vectordb_builder.info(
+                'Vector store updated. chunks added: %s, removed: %s, reused: %s', added_count, len(removed_ids), reused_count
+            )
+
+            # Convert vector store to retriever, with the FAISS query-time knobs applied
+            if vector_storedb == 'faiss':
+                apply_faiss_search_parameters(vector_db.index, config['faiss_index'])
+            retriever = vector_db.as_retriever()
+
+            logger_for_vectordb_builder.info('Embedding of data splits completed and vector store %s is ready', vector_storedb.upper())
             log_component_end(logger_for_vectordb_builder, 'Vectordb Builder Component')
-            
-            return chroma_retriever
+
+            return retriever
 
     except Exception as e:
         # Log any exceptions raised during the vector DB creation
-        logger_for_vectordb_builder.debug(f'Error encountered in vectordb builder component. error: {e}')
+        logger_for_vectordb_builder.debug('Error encountered in vectordb builder component. error: %s', e)
         log_component_end(logger_for_vectordb_builder, 'Vectordb Builder Component')
+
+def search_by_vectors_with_scores(vector_db, query_vectors, k):
+    """
+    Runs a batch of similarity searches as a single matrix search, keeping every hit's score.
+
+    Parameters
+    ----------
+    vector_db : VectorStore
+        A FAISS, Chroma, NumPy or sharded vector store.
+    query_vectors : numpy.ndarray
+        A float32 matrix with one query embedding per row.
+    k : int
+        Number of chunks to retrieve per query.
+
+    Returns
+    -------
+    list of list of tuple
+        For every query, up to k `(chunk_id, Document, score)` triples, most similar first. Higher scores
+        are better: cosine similarity for NumPy, negated distance for FAISS and Chroma, so scores from
+        stores of the same type can be merged.
+    """
+    if is_sharded_store(vector_db):
+        return vector_db.search_with_scores(query_vectors, k)
+
+    if is_faiss_store(vector_db):
+        # FAISS indexes built here use L2 distance
+        distances, positions = vector_db.index.search(query_vectors, k)
+        results = []
+        for distance_row, position_row in zip(distances, positions):
+            hits = [(vector_db.index_to_docstore_id[position], distance) for position, distance in zip(position_row, distance_row) if position != -1]
+            results.append([(chunk_id, vector_db.docstore.search(chunk_id), -float(distance)) for chunk_id, distance in hits])
+        return results
+
+    if isinstance(vector_db, NumpyVectorStore):
+        positions, scores = vector_db.search_matrix(query_vectors, k)
+        results = []
+        for position_row, score_row in zip(positions, scores):
+            documents = [vector_db.document_at(int(position)) for position in position_row]
+            results.append([(document.id, document, float(score)) for document, score in zip(documents, score_row)])
+        return results
+
+    # Chroma answers every query embedding in a single call
+    response = vector_db._collection.query(
+        query_embeddings=query_vectors,
+        n_results=k,
+        include=['documents', 'metadatas', 'distances']
+    )
+    return [
+        [
+            (chunk_id, Document(page_content=text, metadata=metadata or {}), -float(distance))
+            for chunk_id, text, metadata, distance in zip(chunk_ids, texts, metadatas, distances)
+        ]
+        for chunk_ids, texts, metadatas, distances in zip(
+            response['ids'], response['documents'], response['metadatas'], response['distances']
+        )
+    ]
+
+@instrumented('search_by_vectors')
+def search_by_vectors(vector_db, query_vectors, k):
+    """
+    Runs a batch of similarity searches as a single matrix search against a vector store.
+
+    Parameters
+    ----------
+    vector_db : VectorStore
+        A FAISS, Chroma, NumPy or sharded vector store.
+    query_vectors : numpy.ndarray
+        A float32 matrix with one query embedding per row.
+    k : int
+        Number of chunks to retrieve per query.
+
+    Returns
+    -------
+    list of list of tuple
+        For every query, up to k `(chunk_id, Document)` pairs, most similar first.
+    """
+    return [
+        [(chunk_id, document) for chunk_id, document, _ in hits]
+        for hits in search_by_vectors_with_scores(vector_db, query_vectors, k)
+    ]
+
+def iterate_stored_chunks(vector_db):
+    """
+    Yields every chunk held by a vector store, in storage order.
+
+    Parameters
+    ----------
+    vector_db : VectorStore
+        A FAISS, Chroma, NumPy or sharded vector store.
+
+    Yields
+    ------
+    tuple
+        `(chunk_id, text)` of each stored chunk.
+    """
+    if is_sharded_store(vector_db):
+        yield from vector_db.iterate_chunks()
+        return
+
+    if is_faiss_store(vector_db):
+        for _, chunk_id in sorted(vector_db.index_to_docstore_id.items()):
+            yield chunk_id, vector_db.docstore.search(chunk_id).page_content
+        return
+
+    if isinstance(vector_db, NumpyVectorStore):
+        for position in range(len(vector_db)):
+            document = vector_db.document_at(position)
+            yield document.id, document.page_content
+        return
+
+    response = vector_db.get(include=['documents'])
+    yield from zip(response['ids'], response['documents'])
+
+def get_documents_by_ids(vector_db, ids):
+    """
+    Looks chunks up by id in a vector store.
+
+    Parameters
+    ----------
+    vector_db : VectorStore
+        A FAISS, Chroma or NumPy vector store.
+    ids : list of str
+        The chunk ids to look up.
+
+    Returns
+    -------
+    dict
+        Maps each id found to its Document; unknown ids are left out.
+    """
+    if not ids:
+        return {}
+
+    if is_sharded_store(vector_db):
+        return vector_db.get_documents_by_ids(ids)
+
+    if is_faiss_store(vector_db):
+        documents = {chunk_id: vector_db.docstore.search(chunk_id) for chunk_id in ids}
+        return {chunk_id: document for chunk_id, document in documents.items() if isinstance(document, Document)}
+
+    if isinstance(vector_db, NumpyVectorStore):
+        return {document.id: document for document in vector_db.get_by_ids(ids)}
+
+    response = vector_db.get(ids=ids, include=['documents', 'metadatas'])
+    return {
+        chunk_id: Document(page_content=text, metadata=metadata or {})
+        for chunk_id, text, metadata in zip(response['ids'], response['documents'], response['metadatas'])
+    }
+
+def open_vector_store(vector_storedb, embedding, persist_directory=None):
+    """
+    Opens a persisted vector store.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The vector store type ('faiss', 'chroma' or 'numpy').
+    embedding : Embeddings or None
+        The embedding model queries are embedded with; None for stores only searched by vector.
+    persist_directory : str, optional
+        Directory the store is persisted to; defaults to the backend's directory in `paths -> vector_store_dir`.
+
+    Returns
+    -------
+    VectorStore
+        The opened store, with the FAISS query-time knobs applied.
+    """
+    persist_directory = persist_directory or get_persist_directory(vector_storedb)
+
+    if vector_storedb == 'faiss':
+        from langchain_community.vectorstores import FAISS
+        from src.faiss_index import apply_faiss_search_parameters
+        vector_db_faiss = FAISS.load_local(
+            folder_path=persist_directory,
+            embeddings=embedding,
+            allow_dangerous_deserialization=True
+        )
+        apply_faiss_search_parameters(vector_db_faiss.index, get_config()['faiss_index'])
+        return vector_db_faiss
+
+    elif vector_storedb == "chroma":
+        from langchain_community.vectorstores import Chroma
+        return Chroma(persist_directory=persist_directory, embedding_function=embedding)
+
+    elif vector_storedb == "numpy":
+        return NumpyVectorStore.load_local(
+            folder_path=persist_directory,
+            embeddings=embedding,
+            rescore_factor=int(get_config()['numpy_vecdb']['rescore_factor'])
+        )
+
+    raise ValueError(f'Unsupported vector store db: {vector_storedb}')
+
+def load_vectorstore_retriever(vector_storedb, embedding_model, persist_directory=None):
+    """
+    Load a vector store retriever based on user-specified configuration.
+
+    Parameters
+    ----------
+    vector_storedb : str
+        The type of vector database to use ('faiss', 'chroma' or 'numpy').
+
+    embedding_model : str
+        The Ollama embedding model to use for vector representation.
+
+    persist_directory : str, optional
+        Directory of the store (e.g. a snapshot's, see `get_snapshot_directory`); defaults to `get_persist_directory`.
+
+    Returns
+    -------
+    retriever : langchain.schema.retriever.BaseRetriever
+        A retriever object compatible with LangChain pipelines. With `vector_shards -> shard_count`
+        above 1 it searches every shard of the store in parallel.
+    """
+    embedding = build_embedding_model(embedding_model)
+
+    if int(get_config()['vector_shards']['shard_count']) > 1:
+        from src.sharded_vectordb import load_sharded_vector_store
+        return load_sharded_vector_store(vector_storedb, embedding, persist_directory).as_retriever()
+
+    return open_vector_store(vector_storedb, embedding, persist_directory).as_retriever()
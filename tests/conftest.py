@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.config_loader as config_loader
+import src.model_clients as model_clients
+from src.config_schema import validate_config
+
+class FakeOllama:
+    """
+    In-process stand-in for an Ollama server, answering `/api/embeddings` and `/api/generate`.
+
+    Embeddings are derived from a hash of the prompt, so equal texts get equal vectors. `delay_seconds`
+    holds every request open, `failures` makes the next requests of a path return HTTP 500, and every
+    request is recorded with the highest number of requests seen in flight at once.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.delay_seconds = 0
+        self.failures = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with fake._lock:
+                    fake.requests.append((self.path, body))
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                    failing = fake.failures.get(self.path, 0) > 0
+                    if failing:
+                        fake.failures[self.path] -= 1
+                try:
+                    time.sleep(fake.delay_seconds)
+                    if failing:
+                        self.reply(500, {'error': 'fake failure'})
+                    elif self.path == '/api/embeddings':
+                        self.reply(200, {'embedding': FakeOllama.embedding_of(body['prompt'])})
+                    else:
+                        self.reply(200, {'response': f'answer to {len(body["prompt"])} characters', 'done': True})
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *arguments):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def embedding_of(prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        return [byte / 255 for byte in digest[:16]]
+
+    def requests_to(self, path):
+        return [body for request_path, body in self.requests if request_path == path]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def fake_ollama():
+    server = FakeOllama()
+    yield server
+    server.close()
+
+@pytest.fixture
+def pipeline_config(tmp_path, fake_ollama):
+    """
+    Installs config/config.yaml with its data kept in `tmp_path` and its models served by `fake_ollama`.
+
+    Tests adjust the returned dictionary before building anything; worker processes receive it through `set_config`.
+    """
+    with open(config_loader.DEFAULT_CONFIG_FILE_PATH, 'r', encoding='utf-8') as file:
+        raw_config = yaml.safe_load(file)
+    raw_config['paths']['base_dir'] = str(tmp_path)
+    raw_config['logging']['console_level'] = 'CRITICAL'
+    raw_config['model_clients']['endpoints'] = [fake_ollama.url]
+    raw_config['embedding_cache']['enabled'] = False
+    raw_config['answer_cache']['enabled'] = False
+    config = validate_config(raw_config, config_loader.PROJECT_DIRECTORY)
+
+    config_loader.set_config(config)
+    model_clients._registry = None
+    yield config
+    model_clients._registry = None
+    config_loader.config = None
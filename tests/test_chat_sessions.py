@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chat_sessions import build_session_store, update_session_store
+
+def test_reloaded_conversation_settings_apply_to_the_running_store(pipeline_config):
+    session_store = build_session_store()
+    sessions = [session_store.get() for _ in range(3)]
+
+    pipeline_config['conversation'].update(max_sessions=2, session_ttl_seconds=0)
+    assert update_session_store(session_store) is session_store
+    assert (session_store.max_sessions, session_store.ttl_seconds) == (2, 0)
+    assert len(session_store) == 2
+    assert session_store.get(sessions[-1].session_id) is sessions[-1]
+
+    pipeline_config['conversation']['enabled'] = False
+    assert update_session_store(session_store) is None
+
+    pipeline_config['conversation']['enabled'] = True
+    assert update_session_store(None).max_sessions == 2
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embedder import build_embedding_model, embed_in_batches
+from src.model_clients import get_model_client_registry
+
+TEXTS = [f'chunk number {number}' for number in range(10)]
+
+@pytest.fixture
+def embedding(pipeline_config):
+    pipeline_config['embedding_batching'].update(batch_size=3, max_workers=2, max_retries=3, retry_backoff_seconds=0.01)
+    return build_embedding_model(pipeline_config['ollama_embedding']['embedding_model'])
+
+def expected_vectors(fake_ollama, texts, instruction='passage: '):
+    return np.asarray([fake_ollama.embedding_of(instruction + text) for text in texts], dtype=np.float32)
+
+def test_batches_are_embedded_concurrently_into_rows_in_input_order(fake_ollama, embedding):
+    fake_ollama.delay_seconds = 0.02
+    vectors = embed_in_batches(TEXTS, embedding)
+
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors, expected_vectors(fake_ollama, TEXTS))
+    assert len(fake_ollama.requests_to('/api/embeddings')) == len(TEXTS)
+    # Two batches in flight at once, one request at a time within a batch
+    assert fake_ollama.max_in_flight == 2
+
+def test_queries_are_embedded_with_the_query_instruction(fake_ollama, embedding):
+    vectors = embed_in_batches(TEXTS[:2], embedding, as_queries=True)
+    np.testing.assert_allclose(vectors, expected_vectors(fake_ollama, TEXTS[:2], 'query: '))
+
+def test_failed_batches_are_retried(fake_ollama, embedding):
+    fake_ollama.failures['/api/embeddings'] = 2
+    vectors = embed_in_batches(TEXTS, embedding)
+
+    np.testing.assert_allclose(vectors, expected_vectors(fake_ollama, TEXTS))
+    assert len(fake_ollama.requests_to('/api/embeddings')) == len(TEXTS) + 2
+
+def test_the_last_failure_is_raised_once_the_retries_are_used_up(fake_ollama, pipeline_config, embedding):
+    pipeline_config['embedding_batching']['max_retries'] = 1
+    fake_ollama.failures['/api/embeddings'] = 100
+    with pytest.raises(ValueError, match='HTTP 500'):
+        embed_in_batches(TEXTS, embedding)
+
+def test_the_client_counts_every_request_sent_by_concurrent_batches(embedding, pipeline_config):
+    embed_in_batches(TEXTS * 3, embedding)
+    client = get_model_client_registry().get_client(pipeline_config['ollama_embedding']['embedding_model'])
+    stats = client.stats()
+    assert stats['requests'] + stats['coalesced'] == len(TEXTS) * 3
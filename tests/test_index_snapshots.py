@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipeline import run_pipeline
+from src.index_snapshots import get_current_snapshot
+from src.vectordb_builder import get_snapshot_directory, load_vectorstore_retriever
+from src.hybrid_retriever import build_hybrid_retriever
+
+def snapshot_files(directory):
+    return {
+        os.path.join(folder, name): os.stat(os.path.join(folder, name)).st_mtime_ns
+        for folder, _, names in os.walk(directory) for name in names
+    }
+
+def build_snapshot(tmp_path, pipeline_config):
+    corpus_directory = tmp_path / 'corpus'
+    corpus_directory.mkdir()
+    for number in range(6):
+        (corpus_directory / f'doc{number}.txt').write_text(
+            f'Document {number} is about topic {number}. ' * 40, encoding='utf-8'
+        )
+    pipeline_config['data_file']['data_file_path'] = str(corpus_directory)
+    pipeline_config['vector_store_db'] = 'numpy'
+    run_pipeline()
+    return get_current_snapshot('numpy')
+
+def test_bm25_rebuilt_for_new_settings_leaves_the_published_snapshot_untouched(tmp_path, pipeline_config):
+    index_snapshot = build_snapshot(tmp_path, pipeline_config)
+    snapshot_directory = get_snapshot_directory('numpy', index_snapshot)
+    files_before = snapshot_files(snapshot_directory)
+
+    pipeline_config['hybrid_retrieval']['bm25_k1'] += 0.5
+    vector_retriever = load_vectorstore_retriever(
+        vector_storedb='numpy',
+        embedding_model=pipeline_config['ollama_embedding']['embedding_model'],
+        persist_directory=snapshot_directory
+    )
+    search_retriever = build_hybrid_retriever(
+        retriever=vector_retriever, vector_storedb='numpy', persist_directory=snapshot_directory
+    )
+
+    assert search_retriever.invoke('topic 4')
+    assert snapshot_files(snapshot_directory) == files_before
+
+def test_a_run_without_changes_serves_the_current_snapshot_without_copying_it(tmp_path, pipeline_config):
+    index_snapshot = build_snapshot(tmp_path, pipeline_config)
+    snapshots_directory = os.path.dirname(get_snapshot_directory('numpy', index_snapshot))
+
+    run_pipeline()
+    assert get_current_snapshot('numpy') == index_snapshot
+    assert os.listdir(snapshots_directory) == [index_snapshot]
+
+    (tmp_path / 'corpus' / 'doc6.txt').write_text('Document 6 is about topic 6. ' * 40, encoding='utf-8')
+    run_pipeline()
+    assert get_current_snapshot('numpy') != index_snapshot
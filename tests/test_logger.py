@@ -0,0 +1,32 @@
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.logger import configure_logging, stop_logging, logger_for_data_splitter
+
+MARKER = uuid.uuid4().hex
+
+def log_in_worker(number):
+    logger_for_data_splitter.info('Worker line %s %s', MARKER, number)
+    return os.getpid()
+
+@pytest.mark.skipif(not hasattr(os, 'register_at_fork'), reason='worker processes are only forked on POSIX')
+def test_forked_worker_lines_reach_the_log_file(tmp_path):
+    log_file = str(tmp_path / 'pipeline_logs.log')
+    configure_logging({'log_file': log_file, 'console_level': 'CRITICAL'})
+
+    # Like the loader and splitter pools: forked workers without an initializer
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        worker_pids = set(executor.map(log_in_worker, range(4)))
+    stop_logging()
+
+    assert os.getpid() not in worker_pids
+    with open(log_file, encoding='utf-8') as file:
+        text = file.read()
+    for number in range(4):
+        assert text.count(f'Worker line {MARKER} {number}') == 1
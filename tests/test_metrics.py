@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.metrics import MetricsRegistry, Span
+
+def slow_items(count, seconds_per_item):
+    for item in range(count):
+        time.sleep(seconds_per_item)
+        yield item
+
+def stage(span, count, seconds_per_item):
+    with span:
+        yield from span.yielding(slow_items(count, seconds_per_item), 'items')
+
+def test_generator_span_skips_the_time_its_consumer_holds_each_item():
+    registry = MetricsRegistry()
+    for _ in stage(Span('stage', registry), count=5, seconds_per_item=0.01):
+        time.sleep(0.05)
+
+    assert 0.04 <= registry.wall_seconds['stage'].total < 0.15
+    assert registry.items[('stage', 'items')] == 5
+
+def test_downstream_span_skips_the_time_spent_in_its_upstream_stage():
+    registry = MetricsRegistry()
+    upstream = stage(Span('upstream', registry), count=5, seconds_per_item=0.05)
+    downstream = Span('downstream', registry)
+    with downstream:
+        for _ in downstream.excluding(upstream):
+            time.sleep(0.01)
+
+    assert 0.2 <= registry.wall_seconds['upstream'].total < 0.35
+    assert 0.04 <= registry.wall_seconds['downstream'].total < 0.15
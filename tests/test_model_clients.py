@@ -0,0 +1,105 @@
+import os
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.model_clients import ModelClientRegistry, PooledOllamaEmbeddings, build_ollama_llm
+
+def client_config(**overrides):
+    return {
+        'endpoints': [], 'pool_maxsize': 8, 'max_concurrency': 4, 'model_concurrency': {},
+        'timeout_seconds': 10, 'coalesce': True, **overrides
+    }
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+def post_concurrently(client, payloads):
+    with ThreadPoolExecutor(max_workers=len(payloads)) as executor:
+        return list(executor.map(lambda payload: client.post('/api/embeddings', payload), payloads))
+
+def test_identical_concurrent_requests_share_one_request(fake_ollama):
+    fake_ollama.delay_seconds = 0.2
+    client = ModelClientRegistry(client_config(), fake_ollama.url).get_client('embedder')
+    replies = post_concurrently(client, [{'model': 'embedder', 'prompt': 'same question'}] * 4)
+
+    assert all(reply == replies[0] for reply in replies)
+    assert len(fake_ollama.requests_to('/api/embeddings')) == 1
+    assert client.stats() == {'requests': 1, 'coalesced': 3, 'failovers': 0}
+
+def test_different_requests_are_not_coalesced(fake_ollama):
+    client = ModelClientRegistry(client_config(), fake_ollama.url).get_client('embedder')
+    post_concurrently(client, [{'model': 'embedder', 'prompt': f'question {number}'} for number in range(4)])
+
+    assert len(fake_ollama.requests_to('/api/embeddings')) == 4
+    assert client.stats()['coalesced'] == 0
+
+def test_coalesced_callers_share_the_error(fake_ollama):
+    fake_ollama.delay_seconds = 0.2
+    fake_ollama.failures['/api/embeddings'] = 1
+    client = ModelClientRegistry(client_config(), fake_ollama.url).get_client('embedder')
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(client.post, '/api/embeddings', {'prompt': 'same question'}) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match='HTTP 500'):
+            future.result()
+    assert len(fake_ollama.requests_to('/api/embeddings')) == 1
+
+def test_concurrency_is_limited_per_model(fake_ollama):
+    fake_ollama.delay_seconds = 0.1
+    registry = ModelClientRegistry(client_config(max_concurrency=3, model_concurrency={'small-llm': 1}), fake_ollama.url)
+
+    post_concurrently(registry.get_client('small-llm'), [{'prompt': f'question {number}'} for number in range(4)])
+    assert fake_ollama.max_in_flight == 1
+
+    fake_ollama.max_in_flight = 0
+    post_concurrently(registry.get_client('embedder'), [{'prompt': f'question {number}'} for number in range(6)])
+    assert fake_ollama.max_in_flight == 3
+
+def test_registry_shares_one_client_per_model(fake_ollama):
+    registry = ModelClientRegistry(client_config(), fake_ollama.url)
+    assert registry.get_client('embedder') is registry.get_client('embedder')
+    assert registry.get_client('embedder') is not registry.get_client('llm')
+
+def test_requests_are_spread_round_robin_over_the_endpoints(fake_ollama):
+    other_server = type(fake_ollama)()
+    try:
+        registry = ModelClientRegistry(client_config(endpoints=[fake_ollama.url, other_server.url]), 'http://unused')
+        client = registry.get_client('embedder')
+        for number in range(6):
+            client.post('/api/embeddings', {'prompt': f'question {number}'})
+
+        assert len(fake_ollama.requests) == 3
+        assert len(other_server.requests) == 3
+    finally:
+        other_server.close()
+
+def test_unreachable_endpoints_fail_over_to_the_next_one(fake_ollama):
+    registry = ModelClientRegistry(client_config(endpoints=[unused_url(), fake_ollama.url]), 'http://unused')
+    client = registry.get_client('embedder')
+    for number in range(4):
+        client.post('/api/embeddings', {'prompt': f'question {number}'})
+
+    assert len(fake_ollama.requests) == 4
+    assert client.stats()['failovers'] == 2
+
+def test_no_reachable_endpoint_raises():
+    client = ModelClientRegistry(client_config(endpoints=[unused_url()]), 'http://unused').get_client('embedder')
+    with pytest.raises(ValueError, match='No model server reachable'):
+        client.post('/api/embeddings', {'prompt': 'question'})
+
+def test_pooled_embeddings_and_llm_go_through_the_configured_endpoint(fake_ollama, pipeline_config):
+    embedding = PooledOllamaEmbeddings(model='embedder')
+    assert embedding.embed_query('question') == pytest.approx(fake_ollama.embedding_of('query: question'))
+    assert embedding.embed_documents(['chunk']) == [pytest.approx(fake_ollama.embedding_of('passage: chunk'))]
+
+    llm = build_ollama_llm('llm')
+    assert llm.invoke('hello') == 'answer to 5 characters'
+    assert ''.join(llm.stream('hello')) == 'answer to 5 characters'
+    assert fake_ollama.requests_to('/api/generate')[-1]['stream'] is True
@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_loader import data_loader
+from src.data_splitter import data_splitter
+from src.embedder import build_embedding_model
+from src.sharded_vectordb import create_sharded_vector_store_db
+from src.vectordb_builder import iterate_stored_chunks
+
+# Seconds a query may take before the search workers are taken to be deadlocked
+QUERY_TIMEOUT_SECONDS = 60
+
+def run_with_timeout(function):
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = function()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(QUERY_TIMEOUT_SECONDS)
+    return thread.is_alive(), outcome
+
+def test_sharded_chroma_query_after_a_fresh_build(tmp_path, pipeline_config):
+    corpus_directory = tmp_path / 'corpus'
+    corpus_directory.mkdir()
+    for number in range(9):
+        (corpus_directory / f'doc{number}.txt').write_text(
+            f'Document {number} is about topic {number}. ' * 40, encoding='utf-8'
+        )
+    pipeline_config['data_file']['data_file_path'] = str(corpus_directory)
+    pipeline_config['vector_shards'].update(shard_count=3, build_workers=3, search_workers=2)
+
+    embedding = build_embedding_model(pipeline_config['ollama_embedding']['embedding_model'])
+    retriever = create_sharded_vector_store_db(data_splitter(data_loader()), embedding, 'chroma')
+    vector_store = retriever.vectorstore
+    try:
+        # Like the BM25 build, opens Chroma in this process before the search workers start
+        stored_chunks = list(iterate_stored_chunks(vector_store))
+
+        hung, outcome = run_with_timeout(lambda: retriever.invoke('topic 4'))
+        if hung:
+            for executor in vector_store._executors or []:
+                for process in executor._processes.values():
+                    process.kill()
+        assert not hung, 'the sharded query did not return'
+        assert 'error' not in outcome
+        assert outcome['result']
+        assert len(stored_chunks) >= 9
+    finally:
+        vector_store.close()